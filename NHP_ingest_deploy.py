@@ -6,7 +6,7 @@ import logging
 import re
 import json
 from datetime import datetime
-from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 from multiprocessing import Pool, cpu_count
 
@@ -26,6 +26,9 @@ CSV_FOLDER = r"D:\FTP_SYNC_DATA\NHP_FTP_SYNC"
 TABLE_NAME = "nhp_rtdas_ingest_v1"
 AUDIT_TABLE = "nhp_rtdas_ingest_audit_v1"
 PROCESSED_TABLE = "nhp_ingest_files"   # table that records processed files
+VERSIONS_TABLE = "nhp_ingest_versions"  # per-station, per-month change counters (API validators)
+NOTIFY_CHANNEL = os.getenv("NOTIFY_CHANNEL", "nhp_readings")  # API stream listeners (nhp_stream.py)
+RAIN_COVERING_INDEX = os.getenv("RAIN_COVERING_INDEX", "1") == "1"  # see ensure_tables()
 
 EXPECTED_COLUMNS = [
     "StationID", "DateTime", "MobileNumber", "Battery", "WaterLevel",
@@ -37,11 +40,15 @@ EXPECTED_COLUMNS = [
 # LOGGING
 # ===============================================================
 LOG_FILE = "rtdas_ingest.log"
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-)
+
+
+def configure_logging():
+    """Log to LOG_FILE; run by the entry point and each worker, not on import: importing this module (bench/seed.py does) must not create or append to LOG_FILE."""
+    logging.basicConfig(
+        filename=LOG_FILE,
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(message)s",
+    )
 
 # ===============================================================
 # DB CONNECTION
@@ -49,6 +56,22 @@ logging.basicConfig(
 def connect_db():
     return psycopg2.connect(**DB_CONFIG)
 
+def notify_new_readings(cur, station_ids):
+    """
+    NOTIFY the API's stream listeners which stations got new readings. Sent in
+    the insert transaction, so it is delivered on commit (and never for a
+    rolled-back batch). Split into several payloads under the 8000-byte limit.
+    """
+    chunk, size = [], 0
+    for sid in sorted(set(map(str, station_ids))):
+        if chunk and size + len(sid) + 4 > 7900:
+            cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, json.dumps({"stations": chunk})))
+            chunk, size = [], 0
+        chunk.append(sid)
+        size += len(sid) + 4
+    if chunk:
+        cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, json.dumps({"stations": chunk})))
+
 # ===============================================================
 # HELPERS: UUID, safe CSV read, normalize headers, validators
 # ===============================================================
@@ -203,9 +226,131 @@ def ensure_tables():
                     processed_at TIMESTAMP DEFAULT NOW()
                 );
             """)
+
+            # DateTime is stored as TEXT (DD/MM/YY HH:MM[:SS] and friends).
+            # nhp_ts() parses it with a pinned DateStyle so it can be used in an
+            # index; unparseable values become NULL instead of failing the read.
+            # The EXCEPTION block opens a subtransaction, which Postgres refuses
+            # anywhere in a parallel query (leader included), hence PARALLEL UNSAFE.
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION nhp_ts(txt TEXT) RETURNS TIMESTAMP
+                LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL UNSAFE
+                SET datestyle = 'ISO, DMY'
+                AS $$
+                BEGIN
+                    RETURN txt::timestamp;
+                EXCEPTION WHEN others THEN
+                    RETURN NULL;
+                END;
+                $$;
+            """)
+
+            # readings are TEXT too; nhp_num() is the NULL-on-garbage numeric parse
+            # used by server-side aggregation in the API
+            cur.execute("""
+                CREATE OR REPLACE FUNCTION nhp_num(txt TEXT) RETURNS DOUBLE PRECISION
+                LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL UNSAFE
+                AS $$
+                BEGIN
+                    RETURN NULLIF(btrim(txt), '')::double precision;
+                EXCEPTION WHEN others THEN
+                    RETURN NULL;
+                END;
+                $$;
+            """)
+
+            # per-station latest-first lookups used by the API (/stations/latest)
+            cur.execute(f"""
+                CREATE INDEX IF NOT EXISTS {TABLE_NAME}_station_ts_idx
+                ON {TABLE_NAME} ("StationID", nhp_ts("DateTime") DESC NULLS LAST);
+            """)
+
+            # same keys plus the rain columns, so rain-only API reads
+            # (fields=HourlyRain,DailyRain) are index-only scans; costs one more
+            # index write per row, RAIN_COVERING_INDEX=0 skips it
+            if RAIN_COVERING_INDEX:
+                cur.execute(f"""
+                    CREATE INDEX IF NOT EXISTS {TABLE_NAME}_station_ts_rain_idx
+                    ON {TABLE_NAME} ("StationID", nhp_ts("DateTime") DESC NULLS LAST)
+                    INCLUDE ("DateTime", "HourlyRain", "DailyRain");
+                """)
+
+            ensure_versions(cur)
         conn.commit()
 
 
+def ensure_versions(cur):
+    """
+    Change counters the API's /stations/data ETags are read from, one row per
+    (station, month of nhp_ts("DateTime"); 'infinity' for unparseable times).
+    Statement triggers on the readings table set every (station, month) a
+    statement wrote, deleted or changed to a new value of one sequence, so
+    MAX(version) over a station's months in a window changes whenever a reading
+    in it does -- whoever wrote it (this ingest, back-fills, manual fixes).
+    The API reads it with one index range scan per station.
+    """
+    cur.execute(f"CREATE SEQUENCE IF NOT EXISTS {VERSIONS_TABLE}_seq")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+            station_id TEXT,
+            month DATE,
+            version BIGINT NOT NULL,
+            PRIMARY KEY (station_id, month)
+        );
+    """)
+
+    def bump(rows: str, on_conflict: str = "DO UPDATE SET version = EXCLUDED.version") -> str:
+        # sorted, so concurrent writers take the row locks in one order
+        return f"""
+            INSERT INTO {VERSIONS_TABLE} (station_id, month, version)
+            SELECT k.station_id, k.month, nextval('{VERSIONS_TABLE}_seq')
+            FROM (
+                SELECT DISTINCT "StationID" AS station_id,
+                       COALESCE(date_trunc('month', nhp_ts("DateTime"))::date, 'infinity') AS month
+                FROM {rows}
+            ) k
+            WHERE k.station_id IS NOT NULL
+            ORDER BY k.station_id, k.month
+            ON CONFLICT (station_id, month) {on_conflict};
+        """
+
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION {VERSIONS_TABLE}_bump() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                {bump("new_rows")}
+            ELSIF TG_OP = 'DELETE' THEN
+                {bump("old_rows")}
+            ELSIF TG_OP = 'UPDATE' THEN
+                {bump("(SELECT * FROM old_rows UNION ALL SELECT * FROM new_rows) r")}
+            ELSE
+                UPDATE {VERSIONS_TABLE} SET version = nextval('{VERSIONS_TABLE}_seq');
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+    """)
+    triggers = {
+        "insert": "AFTER INSERT ON {t} REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT",
+        "delete": "AFTER DELETE ON {t} REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT",
+        "update": "AFTER UPDATE ON {t} REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT",
+        "truncate": "AFTER TRUNCATE ON {t} FOR EACH STATEMENT",
+    }
+    for event, spec in triggers.items():
+        cur.execute(f"""
+            CREATE OR REPLACE TRIGGER {VERSIONS_TABLE}_{event}
+            {spec.format(t=TABLE_NAME)}
+            EXECUTE FUNCTION {VERSIONS_TABLE}_bump();
+        """)
+
+    # first deploy: counters for the readings already there (rows bumped by the
+    # triggers meanwhile are newer and kept)
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM {VERSIONS_TABLE})")
+    if not cur.fetchone()[0]:
+        cur.execute(bump(TABLE_NAME, on_conflict="DO NOTHING"))
+
+
 def already_processed_set():
     """Return set of filenames already recorded as processed."""
     s = set()
@@ -318,12 +463,14 @@ def ingest_csv(file_path):
         with connect_db() as conn:
             with conn.cursor() as cur:
                 cols = ", ".join([f'"{c}"' for c in df.columns])
-                ph = ", ".join(["%s"] * len(df.columns))
-                execute_batch(cur,
-                              f"INSERT INTO {TABLE_NAME} ({cols}) VALUES ({ph}) ON CONFLICT (uuid) DO NOTHING",
-                              df.values.tolist(),
-                              page_size=500)
+                # one statement per file: the version triggers (ensure_versions)
+                # fire once, and concurrent workers cannot deadlock on the counters
+                execute_values(cur,
+                               f"INSERT INTO {TABLE_NAME} ({cols}) VALUES %s ON CONFLICT (uuid) DO NOTHING",
+                               df.values.tolist(),
+                               page_size=max(1, len(df)))
                 inserted_count = len(df)
+                notify_new_readings(cur, df["StationID"].unique())
 
                 # audit entry (only if there are failures or to record counts)
                 cur.execute(f"""
@@ -378,7 +525,7 @@ def ingest_all_csv(folder_path, max_workers=None):
     print(f"Starting ingestion on {len(files_to_process)} files with {num_workers} workers...")
 
     # Use a pool: map returns results that we can log/inspect
-    with Pool(processes=num_workers) as pool:
+    with Pool(processes=num_workers, initializer=configure_logging) as pool:
         results = pool.map(ingest_csv, files_to_process)
 
     # summary
@@ -394,4 +541,5 @@ def ingest_all_csv(folder_path, max_workers=None):
 # ENTRY POINT
 # ===============================================================
 if __name__ == "__main__":
+    configure_logging()
     ingest_all_csv(CSV_FOLDER)
\ No newline at end of file
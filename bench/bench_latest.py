@@ -0,0 +1,68 @@
+"""
+Benchmark the /stations/latest query engines against the configured database.
+
+Runs the "lateral" and "window" queries for a growing number of stations and
+per-station limits and reports the median execution time of each, so the
+lateral engine can be seen scaling with stations x limit while the window
+engine scans the whole history regardless.
+
+    python bench/bench_latest.py --stations 1 10 50 200 --limits 1 5 20 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nhp_api import build_latest_query, engine, master_index  # noqa: E402
+from nhp_queries import execute  # noqa: E402
+
+
+def time_query(conn, query, params, repeat):
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = len(execute(conn, query, params).fetchall())
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings), rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--stations", type=int, nargs="+", default=[1, 10, 50, 200])
+    ap.add_argument("--limits", type=int, nargs="+", default=[1, 5, 20])
+    ap.add_argument("--engines", nargs="+", default=["lateral", "window"])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", help="write results as JSON to this file")
+    args = ap.parse_args()
+
+    all_ids = [r["id"] for r in master_index.filter()]
+    results = []
+
+    with engine.connect() as conn:
+        for n in args.stations:
+            ids = all_ids[:n]
+            for limit in args.limits:
+                for name in args.engines:
+                    query = build_latest_query(True, engine_name=name)
+                    ms, rows = time_query(conn, query, {"ids": ids, "limit": limit}, args.repeat)
+                    results.append({
+                        "engine": name,
+                        "stations": len(ids),
+                        "limit": limit,
+                        "rows": rows,
+                        "median_ms": round(ms, 2),
+                    })
+                    print(f"{name:8s} stations={len(ids):4d} limit={limit:3d} rows={rows:6d} median={ms:9.2f} ms")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
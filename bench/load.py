@@ -0,0 +1,360 @@
+"""
+Drive a running NHP API with a realistic request mix and report latency percentiles.
+
+For each concurrency level, --duration seconds of requests are sent from that
+many threads (one keep-alive connection each). Each request is drawn from a
+weighted mix of /stations/data, /stations/latest and /master/filter calls with
+filters taken from the live master table (districts, zones, types, date
+windows, page sizes). Reports throughput and p50/p95/p99 latency per endpoint
+and level, and writes them as JSON; --baseline prints the change against an
+earlier run.
+
+Start the server without per-client rate limiting, and with the response cache
+off if uncached numbers are wanted:
+
+    RATE_LIMIT_RATE=0 CACHE_TTL_DATA=0 CACHE_TTL_LATEST=0 uvicorn nhp_api:app --workers 4
+    python bench/load.py --url http://127.0.0.1:8000 --concurrency 1 8 32 --duration 30 --out run.json
+
+With --start-cmd the harness starts the server itself and also reports cold
+start: seconds until it accepts connections, until GET /ready returns 200 (a
+server without /ready counts as ready once it answers), and the latency of the
+first request to each endpoint. The server is stopped at the end.
+
+    python bench/load.py --start-cmd "uvicorn nhp_api:app --port 8000" --concurrency 8 --duration 10
+"""
+import argparse
+import base64
+import http.client
+import json
+import math
+import os
+import random
+import shlex
+import statistics
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+# (weight, endpoint); the request builders below pick the filters
+MIX = [
+    (45, "/stations/latest"),
+    (35, "/stations/data"),
+    (20, "/master/filter"),
+]
+
+
+class Client:
+    """One keep-alive HTTP connection with basic auth."""
+
+    def __init__(self, url, user, password, timeout):
+        parts = urlsplit(url)
+        conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.conn = conn_cls(parts.hostname, parts.port, timeout=timeout)
+        self.prefix = parts.path.rstrip("/")
+        token = base64.b64encode(f"{user}:{password}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {token}"}
+
+    def get(self, path, params):
+        url = self.prefix + path + ("?" + urlencode(params, doseq=True) if params else "")
+        try:
+            self.conn.request("GET", url, headers=self.headers)
+            resp = self.conn.getresponse()
+            body = resp.read()
+            return resp.status, len(body)
+        except (http.client.HTTPException, OSError):
+            self.conn.close()  # reconnects on the next request
+            raise
+
+
+# ------------------ Request mix ------------------
+class Workload:
+    def __init__(self, stations, rng):
+        self.rng = rng
+        self.districts = sorted({s["district"] for s in stations if s.get("district")})
+        self.zones = sorted({s["zone"] for s in stations if s.get("zone")})
+        self.types = sorted({s["type"] for s in stations if s.get("type")})
+        self.endpoints = [e for _, e in MIX]
+        self.weights = [w for w, _ in MIX]
+
+    def _meta_filter(self):
+        """Zero or one meta filter, sometimes two, the way dashboards call the API."""
+        r = self.rng.random()
+        params = {}
+        if r < 0.45 and self.districts:
+            params["district"] = self.rng.choice(self.districts).lower()
+        elif r < 0.65 and self.zones:
+            params["zone"] = self.rng.choice(self.zones)
+        elif r < 0.85 and self.types:
+            params["station_type"] = self.rng.choice(self.types)
+        if self.rng.random() < 0.15 and self.types and "station_type" not in params:
+            params["station_type"] = self.rng.choice(self.types)
+        return params
+
+    def _date_window(self):
+        days = self.rng.choice([1, 1, 1, 7, 7, 30])
+        end = date.today() - timedelta(days=self.rng.choice([0, 0, 1, 3, 10, 60, 200]))
+        return {"start_date": (end - timedelta(days=days - 1)).isoformat(), "end_date": end.isoformat()}
+
+    def next(self):
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        params = self._meta_filter()
+        if endpoint == "/stations/data":
+            if self.rng.random() < 0.8:
+                params.update(self._date_window())
+            params["page_size"] = self.rng.choice([50, 50, 100, 500])
+            params["page"] = self.rng.choice([1, 1, 1, 2, 5])
+        elif endpoint == "/stations/latest":
+            params["limit"] = self.rng.choice([1, 1, 5, 20])
+        return endpoint, params
+
+
+# ------------------ Run ------------------
+def percentile(sorted_ms, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_ms:
+        return None
+    k = max(0, math.ceil(p / 100 * len(sorted_ms)) - 1)
+    return round(sorted_ms[k], 2)
+
+
+def summarize(samples, elapsed):
+    ms = sorted(s[0] for s in samples)
+    statuses = defaultdict(int)
+    for _, status, _ in samples:
+        statuses[str(status)] += 1
+    errors = sum(n for code, n in statuses.items() if not code.startswith("2") and code != "304")
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "statuses": dict(statuses),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else None,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": round(ms[-1], 2) if ms else None,
+        "mean_bytes": int(statistics.fmean(s[2] for s in samples)) if samples else 0,
+    }
+
+
+def run_level(args, stations, concurrency, seed):
+    samples = defaultdict(list)  # endpoint -> [(ms, status, bytes)]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + args.warmup + args.duration
+    record_from = time.perf_counter() + args.warmup
+
+    def worker(n):
+        client = Client(args.url, args.user, args.password, args.timeout)
+        workload = Workload(stations, random.Random(seed * 1000 + n))
+        local = []
+        while True:
+            endpoint, params = workload.next()
+            t0 = time.perf_counter()
+            if t0 >= stop_at:
+                break
+            try:
+                status, size = client.get(endpoint, params)
+            except (http.client.HTTPException, OSError):
+                status, size = "error", 0
+            t1 = time.perf_counter()
+            if t0 >= record_from:
+                local.append((endpoint, (t1 - t0) * 1000, status, size))
+        with lock:
+            for endpoint, ms, status, size in local:
+                samples[endpoint].append((ms, status, size))
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    level = {"concurrency": concurrency, "endpoints": {}}
+    everything = []
+    for endpoint in sorted(samples):
+        level["endpoints"][endpoint] = summarize(samples[endpoint], args.duration)
+        everything.extend(samples[endpoint])
+    level["overall"] = summarize(everything, args.duration)
+    return level
+
+
+def fetch_stations(args):
+    client = Client(args.url, args.user, args.password, args.timeout)
+    client.conn.request("GET", client.prefix + "/master/filter", headers=client.headers)
+    resp = client.conn.getresponse()
+    if resp.status != 200:
+        raise SystemExit(f"/master/filter returned {resp.status}: {resp.read()[:200]!r}")
+    return json.loads(resp.read())["meta data"]
+
+
+# ------------------ Cold start ------------------
+FIRST_REQUESTS = [
+    ("/stations/latest", {}),
+    ("/stations/data", {"page_size": 50}),
+    ("/master/filter", {}),
+]
+
+
+def start_server(args):
+    """
+    Run --start-cmd and time it: (process, report). Polls GET /ready every
+    50 ms; then sends each FIRST_REQUESTS request once on a new connection.
+    """
+    t0 = time.perf_counter()
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    proc = subprocess.Popen(shlex.split(args.start_cmd), stdout=log, stderr=subprocess.STDOUT)
+    listening = ready = None
+    warmup = None
+    while ready is None:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with code {proc.returncode} during startup")
+        if time.perf_counter() - t0 > args.start_timeout:
+            proc.terminate()
+            raise SystemExit(f"server not ready after {args.start_timeout}s")
+        client = Client(args.url, args.user, args.password, args.timeout)
+        try:
+            client.conn.request("GET", client.prefix + "/ready")
+            resp = client.conn.getresponse()
+            body = resp.read()
+        except (http.client.HTTPException, OSError):
+            time.sleep(0.05)
+            continue
+        finally:
+            client.conn.close()
+        now = time.perf_counter() - t0
+        if listening is None:
+            listening = now
+        if resp.status == 200:
+            ready = now
+            warmup = json.loads(body)
+        elif resp.status == 404:
+            ready = now  # no readiness endpoint: ready once it answers
+        else:
+            time.sleep(0.05)
+
+    first = {}
+    for endpoint, params in FIRST_REQUESTS:
+        client = Client(args.url, args.user, args.password, args.timeout)
+        t = time.perf_counter()
+        try:
+            status, _ = client.get(endpoint, params)
+        except (http.client.HTTPException, OSError):
+            status = "error"
+        first[endpoint] = {"status": status, "ms": round((time.perf_counter() - t) * 1000, 2)}
+        client.conn.close()
+
+    return proc, {
+        "command": args.start_cmd,
+        "listening_s": round(listening, 3),
+        "ready_s": round(ready, 3),
+        "first_requests": first,
+        "warmup": warmup,
+    }
+
+
+def print_startup(startup, baseline=None):
+    line = f"\nstartup: listening {startup['listening_s']:.2f}s, ready {startup['ready_s']:.2f}s"
+    if baseline:
+        line += f"   (baseline ready {baseline['ready_s']:.2f}s)"
+    print(line)
+    for endpoint, r in startup["first_requests"].items():
+        base = (baseline or {}).get("first_requests", {}).get(endpoint)
+        extra = f"   (baseline {base['ms']:.1f} ms)" if base else ""
+        print(f"  first {endpoint:22s} {r['status']} {r['ms']:9.1f} ms{extra}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_level(level, baseline=None):
+    print(f"\nconcurrency={level['concurrency']}")
+    print(f"  {'endpoint':22s} {'reqs':>7s} {'err':>5s} {'rps':>8s} {'p50':>9s} {'p95':>9s} {'p99':>9s}")
+    rows = list(level["endpoints"].items()) + [("overall", level["overall"])]
+    for endpoint, s in rows:
+        line = (f"  {endpoint:22s} {s['requests']:7d} {s['errors']:5d} {s['throughput_rps']:8.1f} "
+                f"{s['p50_ms'] or 0:9.1f} {s['p95_ms'] or 0:9.1f} {s['p99_ms'] or 0:9.1f}")
+        base = None
+        if baseline is not None:
+            base_level = baseline.get(level["concurrency"])
+            if base_level:
+                base = base_level["overall"] if endpoint == "overall" else base_level["endpoints"].get(endpoint)
+        if base and base.get("p95_ms") and s["p95_ms"] is not None:
+            line += (f"   p95 {100 * (s['p95_ms'] / base['p95_ms'] - 1):+6.1f}%"
+                     f"  rps {100 * (s['throughput_rps'] / base['throughput_rps'] - 1) if base['throughput_rps'] else 0:+6.1f}%")
+        print(line)
+
+
+def run(args, baseline, startup):
+    stations = fetch_stations(args)
+
+    report = {
+        "label": args.label,
+        "commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "url": args.url,
+        "stations": len(stations),
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "seed": args.seed,
+        "mix": {e: w for w, e in MIX},
+        "startup": startup,
+        "levels": [],
+    }
+    for concurrency in args.concurrency:
+        level = run_level(args, stations, concurrency, args.seed)
+        report["levels"].append(level)
+        print_level(level, baseline)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwrote {args.out}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--user", default=os.getenv("API_USER"))
+    ap.add_argument("--password", default=os.getenv("API_PASS"))
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--duration", type=float, default=30, help="measured seconds per level")
+    ap.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before each level")
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--label", help="free-form name for this run (branch, config...)")
+    ap.add_argument("--out", help="write the report as JSON to this file")
+    ap.add_argument("--baseline", help="earlier --out file to compare against")
+    ap.add_argument("--start-cmd", help="start the server with this command and measure its cold start")
+    ap.add_argument("--start-timeout", type=float, default=120, help="seconds to wait for --start-cmd to be ready")
+    ap.add_argument("--server-log", help="write the output of --start-cmd to this file")
+    args = ap.parse_args()
+
+    baseline = baseline_startup = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            earlier = json.load(f)
+        baseline = {lvl["concurrency"]: lvl for lvl in earlier["levels"]}
+        baseline_startup = earlier.get("startup")
+
+    server, startup = None, None
+    if args.start_cmd:
+        server, startup = start_server(args)
+        print_startup(startup, baseline_startup)
+    try:
+        run(args, baseline, startup)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
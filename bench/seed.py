@@ -0,0 +1,159 @@
+"""
+Seed a local Postgres with synthetic NHP master and RTDAS data for benchmarking.
+
+Creates nhp_v2 (stations spread over districts, zones and types) and fills
+nhp_rtdas_ingest_v1 with one reading per station every --interval minutes for
+--years years, in the same TEXT layout the ingest writes ("DD/MM/YY HH:MM:SS"
+timestamps, readings as strings, AWS extras only for AWS stations). Tables,
+helper functions and indexes come from NHP_ingest_deploy.ensure_tables().
+
+Uses the DB_* settings from .env / the environment. Point it at a scratch
+database: --reset drops the existing rows first.
+
+    python bench/seed.py --stations 300 --years 2 --interval 60 --reset
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from NHP_ingest_deploy import TABLE_NAME, connect_db, ensure_tables  # noqa: E402
+
+DISTRICTS = [
+    "Kamrup Metro", "Kamrup", "Dibrugarh", "Lakhimpur", "Barpeta", "Jorhat", "Sonitpur",
+    "Nagaon", "Cachar", "Dhubri", "Goalpara", "Tinsukia", "Sivasagar", "Golaghat",
+    "Darrang", "Nalbari", "Morigaon", "Karimganj", "Dhemaji", "Bongaigaon",
+]
+ZONES = ["Upper Assam", "Lower Assam", "North Bank", "Central Assam", "Barak Valley"]
+# rough share of each station type in the real network
+TYPES = [("ARG", 0.35), ("AWLR", 0.25), ("ARG+AWLR", 0.25), ("AWS", 0.15)]
+
+MASTER_DDL = """
+    CREATE TABLE IF NOT EXISTS nhp_v2 (
+        gid SERIAL,
+        id TEXT PRIMARY KEY,
+        district TEXT,
+        name TEXT,
+        location TEXT,
+        zone TEXT,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        type TEXT
+    );
+"""
+
+# One row per (station, timestamp), generated server-side. Water level follows a
+# yearly cycle (monsoon peak) plus noise; rain is mostly zero with bursts.
+READINGS_INSERT = f"""
+    INSERT INTO {TABLE_NAME} (
+        "StationID", "DateTime", "MobileNumber", "Battery", "WaterLevel",
+        "HourlyRain", "DailyRain", "AT", "SnowDepth", "Evaporation",
+        "WS", "WD", "At.pressure", "RH", "Sun Radiation", uuid
+    )
+    SELECT
+        s.id,
+        to_char(ts, 'DD/MM/YY HH24:MI:SS'),
+        s.mobile,
+        to_char(11.8 + random() * 1.4, 'FM990.00'),
+        to_char(s.base_level + 6 * sin(2 * pi() * extract(doy FROM ts) / 365.0 - 2.1) + random(), 'FM99990.00'),
+        to_char(CASE WHEN random() < 0.15 THEN random() * 12 ELSE 0 END, 'FM990.00'),
+        to_char(random() * 60, 'FM990.00'),
+        CASE WHEN s.aws THEN to_char(18 + 10 * random(), 'FM990.0') END,
+        CASE WHEN s.aws THEN '0' END,
+        CASE WHEN s.aws THEN to_char(random() * 5, 'FM990.0') END,
+        CASE WHEN s.aws THEN to_char(random() * 8, 'FM990.0') END,
+        CASE WHEN s.aws THEN to_char(floor(random() * 360), 'FM990') END,
+        CASE WHEN s.aws THEN to_char(1000 + random() * 15, 'FM99990.0') END,
+        CASE WHEN s.aws THEN to_char(50 + random() * 50, 'FM990') END,
+        CASE WHEN s.aws THEN to_char(random() * 900, 'FM9990') END,
+        md5(s.id || ts::text)
+    FROM (
+        SELECT id, type = 'AWS' AS aws, substr(md5(id), 1, 10) AS mobile,
+               40 + (gid %% 30) AS base_level
+        FROM nhp_v2 WHERE id = ANY(%(ids)s)
+    ) s
+    CROSS JOIN generate_series(%(start)s::timestamp, %(end)s::timestamp, %(step)s::interval) ts
+    ON CONFLICT (uuid) DO NOTHING
+"""
+
+
+def make_stations(n, rng):
+    stations = []
+    names, weights = zip(*TYPES)
+    for i in range(n):
+        district = DISTRICTS[i % len(DISTRICTS)]
+        stations.append({
+            "id": "&" + format(0x00558000 + i, "08X"),
+            "district": district,
+            "name": f"{district} Station {i + 1}",
+            "location": f"{district} Site {i // len(DISTRICTS) + 1}",
+            "zone": ZONES[DISTRICTS.index(district) % len(ZONES)],
+            "latitude": round(24.2 + rng.random() * 3.7, 5),
+            "longitude": round(89.7 + rng.random() * 6.2, 5),
+            "type": rng.choices(names, weights)[0],
+        })
+    return stations
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--stations", type=int, default=300)
+    ap.add_argument("--years", type=float, default=2)
+    ap.add_argument("--interval", type=int, default=60, help="minutes between readings")
+    ap.add_argument("--batch", type=int, default=20, help="stations per INSERT")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--reset", action="store_true", help="truncate nhp_v2 and the ingest table first")
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    stations = make_stations(args.stations, rng)
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=365 * args.years)
+
+    ensure_tables()
+    with connect_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(MASTER_DDL)
+            if args.reset:
+                cur.execute(f"TRUNCATE nhp_v2, {TABLE_NAME}")
+            # the API's ::date casts read DD/MM/YY the way production does
+            cur.execute("SELECT current_database()")
+            cur.execute(f"""ALTER DATABASE "{cur.fetchone()[0]}" SET datestyle = 'ISO, DMY'""")
+            cur.executemany("""
+                INSERT INTO nhp_v2 (id, district, name, location, zone, latitude, longitude, type)
+                VALUES (%(id)s, %(district)s, %(name)s, %(location)s, %(zone)s, %(latitude)s, %(longitude)s, %(type)s)
+                ON CONFLICT (id) DO NOTHING
+            """, stations)
+        conn.commit()
+        print(f"{len(stations)} stations, readings {start:%Y-%m-%d} .. {end:%Y-%m-%d} every {args.interval} min")
+
+        t0 = time.perf_counter()
+        total = 0
+        for i in range(0, len(stations), args.batch):
+            ids = [s["id"] for s in stations[i:i + args.batch]]
+            with conn.cursor() as cur:
+                cur.execute(READINGS_INSERT, {
+                    "ids": ids, "start": start, "end": end, "step": f"{args.interval} minutes",
+                })
+                total += cur.rowcount
+            conn.commit()
+            print(f"  {i + len(ids):5d}/{len(stations)} stations, {total:,} rows, {time.perf_counter() - t0:6.1f}s")
+
+    # VACUUM cannot run in the transaction block `with connect_db()` opens
+    conn = connect_db()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"VACUUM ANALYZE {TABLE_NAME}")
+            cur.execute("VACUUM ANALYZE nhp_v2")
+    finally:
+        conn.close()
+    print(f"Done: {total:,} rows in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Gunicorn settings for serving nhp_api with several worker processes.
+
+    gunicorn -c gunicorn_conf.py nhp_api:app
+
+- The app is preloaded in the arbiter and the workers are forked from it.
+- The arbiter loads nhp_v2 once and publishes it to shared memory (nhp_shm);
+  every worker maps that copy instead of querying the table itself.
+- Each worker warms up in the app's lifespan hook before it accepts requests:
+  opens its DB pool with the common statements prepared, maps the master
+  table and loads the latest-readings snapshot (GET /ready reports it). Every
+  worker has its own pool, so the database sees up to
+  WEB_CONCURRENCY x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+- pandas / numpy / pyarrow are imported in the arbiter before forking, so
+  workers share them instead of each importing its own copy.
+
+Graceful reloads:
+- kill -HUP <arbiter>: new workers are started, old ones finish their
+  in-flight requests (up to graceful_timeout) and exit. With a preloaded app
+  this does not pick up new code.
+- New code: kill -USR2 <arbiter> starts a new arbiter with the new code on the
+  same socket; once its workers are up, kill -TERM the old arbiter (pid in
+  <pidfile>.oldbin), which drains its workers the same way.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault("MASTER_SHM", "1")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+pidfile = os.getenv("PIDFILE", None)
+
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))           # silent worker is killed after this
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))  # in-flight requests may finish within this
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))           # recycle workers after N requests (0 = never)
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = "-"
+
+_publisher = None
+
+
+def when_ready(server):
+    """Arbiter: publish the master table and load the heavy libraries before the first worker is forked."""
+    global _publisher
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    import nhp_api
+    import nhp_db
+    from nhp_master import MasterPublisher
+    from nhp_shm import SharedTable
+
+    # own short-lived connections; nothing from the arbiter's pool leaks into forks
+    publisher_engine = create_engine(nhp_db.engine.url, poolclass=NullPool)
+    _publisher = MasterPublisher(publisher_engine, SharedTable())
+    try:
+        version = _publisher.publish_once()
+        server.log.info("master table published to shared memory (version %s)", version)
+    except Exception as e:
+        server.log.warning("master table not published, workers will load it themselves: %s", e)
+    _publisher.start()
+    nhp_api.load_heavy_modules()
+
+
+def post_fork(server, worker):
+    # drop any pooled connections inherited from the arbiter
+    import nhp_db
+    for eng in nhp_db.all_engines():
+        eng.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    import nhp_db
+    for eng in nhp_db.all_engines():
+        eng.dispose()
+
+
+def on_exit(server):
+    if _publisher is not None:
+        _publisher.stop()
@@ -1,22 +1,16 @@
 from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-import psycopg2
-import pandas as pd
 from dotenv import load_dotenv
 import os
 from typing import Optional
+from sqlalchemy import text
+
+from nhp_db import engine
+from nhp_queries import where
 
 # ------------------ Load Environment ------------------
 load_dotenv()
 
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-}
-
 USERNAME = os.getenv("API_USER")
 PASSWORD = os.getenv("API_PASS")
 
@@ -33,7 +27,8 @@ def get_current_user(credentials: HTTPBasicCredentials = Depends(security)):
 
 # ------------------ DB Connection ------------------
 def get_connection():
-    return psycopg2.connect(**DB_CONFIG)
+    """Pooled connection from the engine shared with nhp_api (see nhp_db)."""
+    return engine.connect()
 
 # ------------------ Helper: case-insensitive LIKE pattern ------------------
 def make_pattern(value: str) -> str:
@@ -47,16 +42,18 @@ def make_pattern(value: str) -> str:
     return f"%{value}%"
 
 # ------------------ Core Query Function ------------------
-def fetch_master_data(filter_clause: str = "", params: list = []):
-    query = f"""
+def fetch_master_data(filter_clause: str = "", params: Optional[dict] = None):
+    query = text(f"""
         SELECT gid, id, district, name, location, zone, latitude, longitude, type
         FROM nhp_v2
-        WHERE 1=1 {filter_clause}
+        {filter_clause}
         ORDER BY id;
-    """
+    """)
+    import pandas as pd  # imported on the first query, not with the app
+
     try:
         with get_connection() as conn:
-            df = pd.read_sql(query, conn, params=params)
+            df = pd.read_sql(query, conn, params=params or {})
         return df
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -108,21 +105,21 @@ def get_filtered(
     type: Optional[str] = Query(None, description="Sensor type (case-insensitive)"),
     user: str = Depends(get_current_user)
 ):
-    filters, params = [], []
+    filters, params = [], {}
     if district:
-        filters.append("AND LOWER(district) ILIKE %s")
-        params.append(make_pattern(district))
+        filters.append("LOWER(district) ILIKE :district")
+        params["district"] = make_pattern(district)
     if location:
-        filters.append("AND LOWER(location) ILIKE %s")
-        params.append(make_pattern(location))
+        filters.append("LOWER(location) ILIKE :location")
+        params["location"] = make_pattern(location)
     if zone:
-        filters.append("AND LOWER(zone) ILIKE %s")
-        params.append(make_pattern(zone))
+        filters.append("LOWER(zone) ILIKE :zone")
+        params["zone"] = make_pattern(zone)
     if type:
-        filters.append("AND LOWER(type) ILIKE %s")
-        params.append(make_pattern(type))
+        filters.append("LOWER(type) ILIKE :type")
+        params["type"] = make_pattern(type)
 
-    df = fetch_master_data(" ".join(filters), params)
+    df = fetch_master_data(where(filters), params)
     
     return {
         "count": len(df),
@@ -1,27 +1,106 @@
 #==================================================================================================================================================
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, WebSocketException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+import anyio
+import asyncio
+import base64
+import binascii
 import os
+import json
+import hashlib
+import time
+import weakref
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
-import pandas as pd
-from sqlalchemy import create_engine, text
+from pydantic import BaseModel, Field
+from sqlalchemy.exc import OperationalError
 
-load_dotenv()
+from nhp_cancel import CANCELLED, CancelOnDisconnectMiddleware, ClientDisconnected, current_request, is_query_canceled
+from nhp_limits import RATE_LIMIT_KEY, AdmissionGate, Overloaded, RateLimiter
+from nhp_master import MasterIndex
+from nhp_queries import execute, prepare, template, where
+import nhp_db
+import nhp_metrics
+from nhp_metrics import MetricsMiddleware, current_endpoint, stage
+from nhp_shm import MASTER_SHM, SharedTable
+from nhp_slowlog import SlowQueryLog, instrument_slow_queries
+from nhp_snapshot import LATEST_SNAPSHOT, LatestSnapshot
+from nhp_stream import STREAM_HEARTBEAT, STREAM_MAX_ROWS_PER_STATION, ReadingHub
+from nhp_warmup import WARMUP, WARMUP_TIMEOUT, Warmup
+from nhp_cache import ResponseCache, cache_key
+from nhp_flight import SingleFlight
+from nhp_geo import GeoFilter, parse_bbox
+from nhp_export import ndjson_line, stream_copy, stream_frames, stream_rows
+from nhp_formats import (
+    ARROW_STREAM_TYPE, MASTER_FIELDS, PARQUET_TYPE, arrow_available, arrow_schema, arrow_stream,
+    parquet_stream, safe_key, to_columnar,
+)
 
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-}
+if TYPE_CHECKING:
+    import pandas as pd
+
+load_dotenv()
 
 security = HTTPBasic()
 USERNAME = os.getenv("API_USER")
 PASSWORD = os.getenv("API_PASS")
 
-app = FastAPI(title="NHP RTDAS API", version="1.2")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up before taking traffic (see warm-up section below). After
+    WARMUP_TIMEOUT seconds the app serves cold and /ready stays 503 until the
+    warm-up has finished in the background.
+    """
+    if WARMUP:
+        warmup.start()
+        await run_in_threadpool(warmup.wait, WARMUP_TIMEOUT)
+    yield
+    latest_snapshot.stop()
+    reading_hub.stop()
+
+
+app = FastAPI(title="NHP RTDAS API", version="1.2", lifespan=lifespan)
+app.add_middleware(CancelOnDisconnectMiddleware)
+app.add_middleware(MetricsMiddleware)  # outermost (added last): current_endpoint() works inside the others
+
+# Serve the master metadata API from this process too, on the same pool
+META_API_PREFIX = os.getenv("META_API_PREFIX", "/meta")
+if META_API_PREFIX:
+    import meta_data_api
+    app.mount(META_API_PREFIX, meta_data_api.app)
+    # its endpoints are labelled with the prefix; same statement timeouts as before unless set
+    for _route in meta_data_api.app.routes:
+        if getattr(_route, "path", None) in nhp_db.STATEMENT_TIMEOUTS:
+            nhp_db.STATEMENT_TIMEOUTS.setdefault(META_API_PREFIX + _route.path, nhp_db.STATEMENT_TIMEOUTS[_route.path])
+
+
+# ------------------ Cancelled statements ------------------
+# 499 (nginx's "client closed request"): nobody reads it, but it keeps abandoned
+# requests apart from real errors in the request metrics
+@app.exception_handler(ClientDisconnected)
+def client_disconnected(request: Request, exc: ClientDisconnected):
+    return Response(status_code=499)
+
+
+@app.exception_handler(OperationalError)
+def statement_cancelled(request: Request, exc: OperationalError):
+    """statement_timeout -> 504 naming the budget; cancelled for a gone client -> 499; anything else stays a 500."""
+    if not is_query_canceled(exc):
+        raise exc
+    state = current_request()
+    if state is not None and state.disconnected:
+        return Response(status_code=499)
+    endpoint = current_endpoint()
+    CANCELLED.inc(endpoint, "timeout")
+    return JSONResponse(status_code=504, content={
+        "detail": f"Query exceeded the {nhp_db.statement_timeout_for(endpoint)} ms limit of {endpoint}; "
+                  "narrow the date range or filters",
+    })
 
 
 def get_current_user(credentials: HTTPBasicCredentials = Depends(security)):
@@ -29,21 +108,150 @@ def get_current_user(credentials: HTTPBasicCredentials = Depends(security)):
         raise HTTPException(status_code=401, detail="Unauthorized")
     return credentials.username
 
-engine_url = (
-    f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}"
-    f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['dbname']}"
-)
-engine = create_engine(engine_url)
 
-def make_pattern(value: str) -> str:
+def get_websocket_user(websocket: WebSocket) -> str:
+    """Basic auth for WebSocket routes (HTTPBasic only handles plain HTTP requests)."""
+    scheme, _, param = websocket.headers.get("authorization", "").partition(" ")
+    try:
+        username, _, password = base64.b64decode(param).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        username = password = None
+    if scheme.lower() != "basic" or username != USERNAME or password != PASSWORD:
+        raise WebSocketException(code=1008, reason="Unauthorized")
+    key = username if RATE_LIMIT_KEY == "user" else (websocket.client.host if websocket.client else "unknown")
+    try:
+        rate_limiter.check(key)
+    except Overloaded:
+        raise WebSocketException(code=1013, reason="Too many requests")
+    return username
+
+# ------------------ Rate limiting / admission control ------------------
+rate_limiter = RateLimiter()
+heavy_gate = AdmissionGate()
+
+
+def rate_limit(request: Request, user: str = Depends(get_current_user)):
+    """Token bucket per client IP (or per credential with RATE_LIMIT_KEY=user)."""
+    key = user if RATE_LIMIT_KEY == "user" else (request.client.host if request.client else "unknown")
+    try:
+        rate_limiter.check(key)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": e.retry_after_header})
+
+
+def acquire_heavy_slot() -> float:
+    try:
+        return heavy_gate.acquire()
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail="Server busy, retry later", headers={"Retry-After": e.retry_after_header})
+
+
+def run_heavy(fn):
+    """
+    fn() while holding one of the HEAVY_MAX_CONCURRENT slots. Called inside
+    flights.do(), so requests that share a query in flight take no slot.
+    """
+    acquired_at = acquire_heavy_slot()
+    try:
+        return fn()
+    finally:
+        heavy_gate.release(acquired_at)
+
+
+class HeavyStream:
     """
-    Normalize and create a fuzzy search pattern.
-    Removes common punctuation for flexible matching and returns %value%.
+    Body of a streaming heavy response, holding the heavy slot its handler took.
+
+    close() closes the wrapped stream and gives the slot back, once. It runs
+    when the stream ends or fails, when the response is over (also when the
+    client left before Starlette started iterating, which a generator's
+    finally never sees) and, as a last resort, when the object is collected.
     """
-    value = value.strip().lower()
-    for ch in ['-', '(', ')', ',']:
-        value = value.replace(ch, '')
-    return f"%{value}%"
+
+    def __init__(self, stream, acquired_at: float):
+        self._stream = stream
+        self._release = weakref.finalize(self, heavy_gate.release, acquired_at)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._stream)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+
+
+class HeavyStreamingResponse(StreamingResponse):
+    """StreamingResponse over `stream` that takes a heavy slot (503 if none frees up) for as long as it runs."""
+
+    def __init__(self, stream, **kwargs):
+        self.stream = HeavyStream(stream, acquire_heavy_slot())
+        try:
+            super().__init__(self.stream, **kwargs)
+        except BaseException:
+            self.stream.close()
+            raise
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # closing may wait for a COPY to stop; shielded so a cancelled request still gets here
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(self.stream.close)
+
+# Shared pool (nhp_db); the metadata API mounted below uses the same one.
+# Read-only endpoints take their engine from read_engine(), which routes to a
+# read replica when DB_REPLICA_URLS is set and its lag allows.
+engine = nhp_db.engine
+read_engine = nhp_db.read_engine
+
+# Statements over SLOW_QUERY_MS, with sampled EXPLAIN (ANALYZE, BUFFERS) plans
+slow_query_log = SlowQueryLog(engine)
+for _eng in nhp_db.all_engines():
+    instrument_slow_queries(_eng, slow_query_log)
+
+# In-process copy of nhp_v2; resolves meta filters to station IDs.
+# Under gunicorn_conf.py it is read from the host-wide shared-memory copy.
+master_index = MasterIndex(engine, shared=SharedTable() if MASTER_SHM else None)
+
+# Serialized responses shared by all workers on this host
+response_cache = ResponseCache()
+
+# Identical requests in flight at the same time share one query and its body
+flights = SingleFlight()
+
+GEO_MAX_RADIUS_KM = float(os.getenv("GEO_MAX_RADIUS_KM", "1000"))
+
+
+def geo_filter(
+    bbox: Optional[str] = Query(None, description="Bounding box: min_lon,min_lat,max_lon,max_lat"),
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Latitude of the radius centre"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Longitude of the radius centre"),
+    radius_km: Optional[float] = Query(None, gt=0, le=GEO_MAX_RADIUS_KM, description="Radius around lat/lon in km"),
+) -> Optional[GeoFilter]:
+    """Spatial station filter from the query string; None when neither bbox nor radius is given."""
+    if radius_km is not None and (lat is None or lon is None):
+        raise HTTPException(status_code=400, detail="radius_km needs lat and lon")
+    box = None
+    if bbox:
+        try:
+            box = parse_bbox(bbox)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid bbox: {e}")
+    if box is None and radius_km is None:
+        return None
+    return GeoFilter(box, lat, lon, radius_km)
 
 BASE_FIELDS = [
     "MobileNumber",
@@ -72,8 +280,299 @@ def dq(col: str) -> str:
     return f'"{col}"'
 
 
-@app.get("/stations/data")
+# ------------------ Validators: per-station reading digests ------------------
+# A single MAX(reading time) misses readings that arrive at or before the current
+# max (late files, back-fills), so each validator hashes per-station values taken
+# with the same index probes as /stations/latest.
+def reading_digest(stations: Dict[str, tuple]) -> str:
+    """sha1 of {station: values}, independent of the order the stations came in."""
+    return hashlib.sha1("|".join(f"{sid}:{stations[sid]}" for sid in sorted(stations)).encode("utf-8")).hexdigest()
+
+
+def latest_versions_query(with_ids: bool):
+    return template(("latest_versions", with_ids), lambda: f"""
+        SELECT m.id, w.ts
+        FROM nhp_v2 m
+        CROSS JOIN LATERAL (
+            SELECT nhp_ts(d."DateTime") AS ts
+            FROM nhp_rtdas_ingest_v1 d
+            WHERE d."StationID" = m.id
+            ORDER BY nhp_ts(d."DateTime") DESC NULLS LAST
+            LIMIT :limit
+        ) w
+        {where(["m.id = ANY(:ids)"] if with_ids else [])}
+        ORDER BY m.id, w.ts DESC NULLS LAST
+    """)
+
+
+def data_versions_query(with_ids: bool, with_start: bool, with_end: bool):
+    conditions = (["station_id = ANY(:ids)"] if with_ids else []) \
+        + (["month >= CAST(date_trunc('month', CAST(:start_date AS timestamp)) AS date)"] if with_start else []) \
+        + (["month <= :end_date"] if with_end else [])
+    return template(("data_versions", with_ids, with_start, with_end), lambda: f"""
+        SELECT station_id, MAX(version)
+        FROM nhp_ingest_versions
+        {where(conditions)}
+        GROUP BY station_id
+    """)
+
+
+def latest_versions(conn, ids: Optional[List[str]], limit: int) -> str:
+    """
+    Digest of the reading times of each station's newest `limit` rows -- the
+    rows /stations/latest returns. One index probe per station.
+    """
+    times: Dict[str, list] = {}
+    for sid, ts in execute(conn, latest_versions_query(ids is not None), {"ids": ids, "limit": limit}):
+        times.setdefault(sid, []).append(ts)
+    return reading_digest({sid: tuple(t) for sid, t in times.items()})
+
+
+def data_versions(conn, ids: Optional[List[str]], start_date: Optional[str], end_date: Optional[str]) -> str:
+    """
+    Digest of each station's change counter over the months of the date window
+    (nhp_ingest_versions, kept by the ingest's triggers), so new, late,
+    back-filled and deleted readings in the window change it, and readings
+    outside it do not. One index range scan per station, whatever the table size.
+    """
+    query = data_versions_query(ids is not None, bool(start_date), bool(end_date))
+    rows = execute(conn, query, {"ids": ids, "start_date": start_date, "end_date": end_date})
+    return reading_digest(dict(rows.fetchall()))
+
+
+# ------------------ Conditional responses (ETag) ------------------
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def validator_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """
+    Return a 304 response if the request's If-None-Match still matches, else
+    None. No Last-Modified: a reading's time is not when it reached the database.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=validator_headers(etag))
+    return None
+
+
+def json_body(payload) -> bytes:
+    with stage("serialize"):
+        return json.dumps(payload, default=str).encode("utf-8")
+
+
+def read_frame(conn, query, params) -> "pd.DataFrame":
+    """
+    Run a query template as a prepared statement into a DataFrame, timed as the
+    "fetch" stage (SQL execution + DataFrame construction).
+    """
+    import pandas as pd  # loaded by the startup warm-up, not at import
+
+    with stage("fetch"):
+        result = execute(conn, query, params)
+        return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()), coerce_float=True)
+
+
+def clean_frame(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Replace NaN/NaT with None so the frame serializes to valid JSON."""
+    import pandas as pd
+
+    return df.astype(object).where(pd.notna(df), None)
+
+
+# ------------------ Helpers: /stations/data style queries ------------------
+MASTER_SELECT_COLS = [
+    "m.id AS station_id",
+    "m.longitude",
+    "m.latitude",
+    "m.zone",
+    "m.name",
+    "m.type",
+    "m.location",
+    "m.district"
+]
+
+DATA_BASE_QUERY = """
+        FROM nhp_v2 m
+        JOIN nhp_rtdas_ingest_v1 d ON m.id = d."StationID"
+"""
+
+
+def build_data_filters(ids: Optional[List[str]], start_date: Optional[str], end_date: Optional[str]):
+    """
+    Return (filters, params) for the date range and resolved station IDs.
+    `filters` is a tuple of fixed condition strings, so it doubles as the
+    filter-combination part of a query template key.
+    """
+    filters = []
+    params = {}
+
+    if start_date and end_date:
+        filters.append('d."DateTime"::date BETWEEN :start_date AND :end_date')
+        params["start_date"] = start_date
+        params["end_date"] = end_date
+    elif start_date:
+        filters.append('d."DateTime"::date >= :start_date')
+        params["start_date"] = start_date
+    elif end_date:
+        filters.append('d."DateTime"::date <= :end_date')
+        params["end_date"] = end_date
+
+    if ids is not None:
+        filters.append('d."StationID" = ANY(:ids)')
+        params["ids"] = ids
+
+    return tuple(filters), params
+
+
+def data_queries(filters: tuple, binary: bool = False, projection: Optional["Projection"] = None):
+    """Page and COUNT(*) query templates of /stations/data for one filter combination."""
+    data_query = template(("data", filters, binary, projection), lambda: f"""
+        SELECT
+            {data_select_clause(typed=binary, projection=projection)}
+        {DATA_BASE_QUERY}
+        {where(filters)}
+        ORDER BY d."DateTime" DESC
+        LIMIT :limit OFFSET :offset
+    """)
+    count_query = template(("data_count", filters), lambda: f"""
+        SELECT COUNT(*) AS total
+        {DATA_BASE_QUERY}
+        {where(filters)}
+    """)
+    return data_query, count_query
+
+
+def ingest_select_cols(typed: bool = False, fields=None) -> List[str]:
+    """d."col" for each ingest field (default: all); typed=True returns DateTime parsed to a timestamp."""
+    cols = []
+    for f in fields or BASE_FIELDS + AWS_EXTRA_FIELDS:
+        if typed and f == "DateTime":
+            cols.append('nhp_ts(d."DateTime") AS "DateTime"')
+        else:
+            cols.append(f'd.{dq(f)}')
+    return cols
+
+
+def master_select_cols(fields=None) -> List[str]:
+    """m.col for each master output field (default: all)."""
+    if fields is None:
+        return MASTER_SELECT_COLS
+    return ["m.id AS station_id" if f == "station_id" else f"m.{f}" for f in fields]
+
+
+def data_select_clause(typed: bool = False, projection: Optional["Projection"] = None) -> str:
+    """Master columns followed by the ingest columns (all, or those of `projection`), for the SELECT list."""
+    if projection is None:
+        return ",\n            ".join(MASTER_SELECT_COLS + ingest_select_cols(typed))
+    return ",\n            ".join(master_select_cols(projection.master) + ingest_select_cols(typed, projection.ingest))
+
+
+# ------------------ Helpers: field projection (fields=...) ------------------
+class Projection(NamedTuple):
+    """Output fields picked with fields=: master fields (station_id first) and ingest columns (DateTime first)."""
+    master: Tuple[str, ...]
+    ingest: Tuple[str, ...]
+
+
+def parse_projection(fields) -> Optional[Projection]:
+    """
+    "HourlyRain,DailyRain,district" (or a list of names) -> Projection; None
+    when no fields are given (the full default record). Ingest fields may use
+    the DB name ('At.pressure') or the output key ('At_pressure'). station_id
+    and DateTime are always included. Unknown or repeated fields are a 422.
+    """
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    names = [f.strip() for f in fields or [] if f and f.strip()]
+    if not names:
+        return None
+    by_key = {safe_key(f): f for f in BASE_FIELDS + AWS_EXTRA_FIELDS}
+    master, ingest = ["station_id"], ["DateTime"]
+    requested = set()
+    for name in names:
+        if name in MASTER_FIELDS:
+            picked, field = master, name
+        else:
+            picked, field = ingest, by_key.get(safe_key(name))
+            if field is None:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Unknown field '{name}', use one of: {', '.join(MASTER_FIELDS + list(by_key))}",
+                )
+        if field in requested:
+            raise HTTPException(status_code=422, detail=f"Field '{name}' is requested more than once")
+        requested.add(field)
+        if field not in picked:
+            picked.append(field)
+    return Projection(tuple(master), tuple(ingest))
+
+
+# ------------------ Helpers: binary (Arrow / Parquet) formats ------------------
+BINARY_FORMATS = {
+    "arrow": ARROW_STREAM_TYPE,
+    "parquet": PARQUET_TYPE,
+}
+
+
+def negotiate_format(request: Request, fmt: Optional[str], default: str) -> str:
+    """An explicit ?format= wins (even ?format=<default>); otherwise an Arrow/Parquet Accept header picks the binary format."""
+    if fmt is not None:
+        return fmt
+    accept = request.headers.get("accept", "")
+    if ARROW_STREAM_TYPE in accept:
+        return "arrow"
+    if PARQUET_TYPE in accept or "application/x-parquet" in accept:
+        return "parquet"
+    return default
+
+
+def require_arrow():
+    if not arrow_available():
+        raise HTTPException(status_code=406, detail="Arrow/Parquet output needs pyarrow installed on the server")
+
+
+def shape_record(r: dict, projection: Optional[Projection] = None) -> dict:
+    """
+    Master fields + base fields, plus AWS extras (renamed to safe keys) for AWS
+    stations; with a projection, exactly its fields for every station.
+    """
+    if projection is not None:
+        out = {f: r.get(f) for f in projection.master}
+        for f in projection.ingest:
+            out[safe_key(f)] = r.get(f)
+        return out
+
+    stype = (r.get("type") or "").strip().lower()
+    out = {
+        "station_id": r.get("station_id"),
+        "longitude": r.get("longitude"),
+        "latitude": r.get("latitude"),
+        "zone": r.get("zone"),
+        "name": r.get("name"),
+        "type": r.get("type"),
+        "location": r.get("location"),
+        "district": r.get("district"),
+    }
+
+    for f in BASE_FIELDS:
+        out[f] = r.get(f)
+
+    if stype == "aws":
+        for f in AWS_EXTRA_FIELDS:
+            out[safe_key(f)] = r.get(f)
+    return out
+
+
+@app.get("/stations/data", dependencies=[Depends(rate_limit)])
 def get_station_data(
+    request: Request,
     start_date: Optional[str] = Query(None, description="Filter by start date (YYYY-MM-DD, DD-MM-YYYY)"),
     end_date: Optional[str] = Query(None, description="Filter by end date (YYYY-MM-DD, DD-MM-YYYY)"),
     station_type: Optional[str] = Query(None, description="Filter by station type (AWLR, ARG, AWS, ARG+AWLR)"),
@@ -82,260 +581,1146 @@ def get_station_data(
     district: Optional[str] = Query(None, description="Filter by district name"),
     page: Optional[int] = Query(None, ge=1, description="Page number (default 1)"),
     page_size: Optional[int] = Query(None, ge=1, le=500, description="Records per page (default 50)"),
+    fmt: Optional[str] = Query(None, alias="format", description="records (default), columnar, arrow or parquet"),
+    fields: Optional[str] = Query(None, description="Comma-separated output fields, e.g. HourlyRain,DailyRain (default: all)"),
+    geo: Optional[GeoFilter] = Depends(geo_filter),
     user: str = Depends(get_current_user),
 ):
     """
     Fetch RTDAS + master station data with optional fuzzy normalized filters:
     - Date range (start_date, end_date)
     - Station_type/Zone/location/District
+    - Map area (bbox, or lat/lon + radius_km)
+    - fields: only these columns are selected and returned (station_id and DateTime always)
     - Pagination
+    - format=columnar: station metadata once per station, readings as parallel arrays
+    - format=arrow / parquet (or the matching Accept header): typed Arrow IPC stream / Parquet file
 
     AWS stations will include the 14-field payload (base 6 + 8 AWS extras).
     Other station types will include the 6-field payload.
     """
+    fmt = negotiate_format(request, fmt, "records")
+    if fmt not in ("records", "columnar", *BINARY_FORMATS):
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{fmt}', use records, columnar, arrow or parquet")
+    binary = fmt in BINARY_FORMATS
+    if binary:
+        require_arrow()
+    media_type = BINARY_FORMATS.get(fmt, "application/json")
+    projection = parse_projection(fields)
 
     page = page or 1
     page_size = page_size or 50
+    cache_params = {
+        "start_date": start_date, "end_date": end_date, "station_type": station_type,
+        "zone": zone, "location": location, "district": district,
+        "page": page, "page_size": page_size, "format": fmt, "geo": geo, "fields": projection,
+    }
 
-    base_query = """
-        FROM nhp_v2 m
-        JOIN nhp_rtdas_ingest_v1 d ON m.id = d."StationID"
-        WHERE 1=1
+    ids = master_index.resolve(geo, district=district, location=location, zone=zone, station_type=station_type)
+    if ids is not None and not ids and not binary:
+        empty = {"format": "columnar", "stations": []} if fmt == "columnar" else {"data": []}
+        return {
+            "page": page,
+            "page_size": page_size,
+            "total_records": 0,
+            "total_pages": 0,
+            **empty,
+        }
+
+    filters, params = build_data_filters(ids, start_date, end_date)
+    data_query, count_query = data_queries(filters, binary, projection)
+    params["limit"] = page_size
+    params["offset"] = (page - 1) * page_size
+
+    # outside the heavy gate: the validator reads only the change counters, not
+    # the readings, so revalidations and cache hits need no heavy slot
+    with read_engine().connect() as conn:
+        versions = data_versions(conn, ids, start_date, end_date)
+        etag = make_etag(cache_key("/stations/data", cache_params), versions, master_index.digest)
+        headers = validator_headers(etag)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+        # binary bodies carry their totals in headers, so only JSON is cached
+        cached = None if binary else response_cache.get("/stations/data", cache_params, etag)
+        if cached is not None:
+            return Response(content=cached, media_type=media_type, headers=headers)
+
+    def run():
+        with read_engine().connect() as conn:
+            df = read_frame(conn, data_query, params)
+            total_records = execute(conn, count_query, params).scalar() or 0
+
+        if binary:
+            # pagination metadata travels in headers; the body is the typed table
+            totals = {
+                "X-Total-Records": str(int(total_records)),
+                "X-Total-Pages": str((int(total_records) + page_size - 1) // page_size),
+            }
+            if projection is None:
+                schema = arrow_schema(BASE_FIELDS, AWS_EXTRA_FIELDS)
+            else:
+                schema = arrow_schema(list(projection.ingest), [], list(projection.master))
+            writer = arrow_stream if fmt == "arrow" else parquet_stream
+            with stage("serialize"):
+                return b"".join(writer([df], schema)), totals
+
+        df = clean_frame(df)
+
+        payload = {
+            "page": page,
+            "page_size": page_size,
+            "total_records": int(total_records),
+            "total_pages": (int(total_records) + page_size - 1) // page_size,
+        }
+        with stage("shape"):
+            if fmt == "columnar":
+                payload["format"] = "columnar"
+                if projection is None:
+                    payload["stations"] = to_columnar(df, BASE_FIELDS, AWS_EXTRA_FIELDS)
+                else:
+                    payload["stations"] = to_columnar(df, list(projection.ingest), [])
+            else:
+                payload["data"] = [shape_record(r, projection) for r in df.to_dict(orient="records")]
+
+        body = json_body(payload)
+        response_cache.set("/stations/data", cache_params, etag, body)
+        return body, {}
+
+    # the ETag covers the normalized params and the per-station digest: same ETag, same body
+    body, totals = flights.do("/stations/data", etag, lambda: run_heavy(run))
+    return Response(content=body, media_type=media_type, headers={**headers, **totals})
+
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    **BINARY_FORMATS,
+}
+
+EXPORT_EXTENSIONS = {"arrow": "arrows"}
+
+
+@app.get("/stations/export", dependencies=[Depends(rate_limit)])
+def export_station_data(
+    request: Request,
+    start_date: Optional[str] = Query(None, description="Filter by start date (YYYY-MM-DD, DD-MM-YYYY)"),
+    end_date: Optional[str] = Query(None, description="Filter by end date (YYYY-MM-DD, DD-MM-YYYY)"),
+    station_type: Optional[str] = Query(None, description="Filter by station type (AWLR, ARG, AWS, ARG+AWLR)"),
+    zone: Optional[str] = Query(None, description="Filter by zone name"),
+    location: Optional[str] = Query(None, description="Filter by location name"),
+    district: Optional[str] = Query(None, description="Filter by district name"),
+    fmt: Optional[str] = Query(None, alias="format", description="Output format: csv (default), ndjson, arrow or parquet"),
+    user: str = Depends(get_current_user),
+):
     """
+    Stream the full (unpaginated) /stations/data result.
+    - csv: COPY (SELECT ...) TO STDOUT, all 14 ingest columns on every row
+    - ndjson: server-side cursor, one /stations/data record per line
+    - arrow / parquet (or the matching Accept header): server-side cursor,
+      one typed record batch / row group per fetch
 
-    filters = []
-    params = {}
+    Rows are ordered by station and reading time so Postgres can walk the
+    (StationID, time) index instead of sorting the whole result.
+    """
+    fmt = negotiate_format(request, fmt, "csv")
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{fmt}', use one of: {', '.join(EXPORT_FORMATS)}")
+    binary = fmt in BINARY_FORMATS
+    if binary:
+        require_arrow()
 
-    if start_date and end_date:
-        filters.append('AND d."DateTime"::date BETWEEN :start_date AND :end_date')
+    ids = master_index.resolve(district=district, location=location, zone=zone, station_type=station_type)
+    filters, params = build_data_filters(ids, start_date, end_date)
+
+    # streamed through COPY / a server-side cursor, neither of which can run
+    # EXECUTE, so only the compiled text() of the template is used here
+    export_query = template(("export", filters, binary), lambda: f"""
+        SELECT
+            {data_select_clause(typed=binary)}
+        {DATA_BASE_QUERY}
+        {where(filters)}
+        ORDER BY d."StationID", nhp_ts(d."DateTime")
+    """).stmt
+
+    source = read_engine()
+    if fmt == "csv":
+        stream = stream_copy(source, export_query, params)
+    elif fmt == "ndjson":
+        stream = stream_rows(source, export_query, params, lambda r: ndjson_line(shape_record(r)))
+    else:
+        writer = arrow_stream if fmt == "arrow" else parquet_stream
+        stream = writer(stream_frames(source, export_query, params), arrow_schema(BASE_FIELDS, AWS_EXTRA_FIELDS))
+
+    extension = EXPORT_EXTENSIONS.get(fmt, fmt)
+    return HeavyStreamingResponse(
+        stream,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="nhp_stations_export.{extension}"'},
+    )
+
+
+# ------------------ /stations/batch ------------------
+BATCH_MAX_SPECS = int(os.getenv("BATCH_MAX_SPECS", "500"))
+BATCH_MAX_PAIRS = int(os.getenv("BATCH_MAX_PAIRS", "5000"))            # (spec, station) windows per request
+BATCH_CHUNK_PAIRS = int(os.getenv("BATCH_CHUNK_PAIRS", "200"))         # windows per SQL statement
+BATCH_MAX_ROWS_PER_STATION = int(os.getenv("BATCH_MAX_ROWS_PER_STATION", "50000"))
+
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y")
+
+
+class BatchSpec(BaseModel):
+    id: Optional[str] = Field(None, description="Caller's key for this spec, echoed back")
+    station_ids: List[str] = Field(..., min_length=1)
+    start_date: Optional[str] = Field(None, description="YYYY-MM-DD or DD-MM-YYYY, inclusive")
+    end_date: Optional[str] = Field(None, description="YYYY-MM-DD or DD-MM-YYYY, inclusive")
+    fields: Optional[List[str]] = Field(None, description="Output fields, as fields= on /stations/data (default: all)")
+
+
+class BatchRequest(BaseModel):
+    queries: List[BatchSpec] = Field(..., min_length=1)
+
+
+def parse_day(value: str, name: str) -> date:
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            continue
+    raise HTTPException(status_code=400, detail=f"Invalid {name} '{value}', use YYYY-MM-DD or DD-MM-YYYY")
+
+
+def batch_windows(specs: List[BatchSpec]):
+    """
+    Flatten the specs into (spec no, station, from, to) windows, [from, to) in
+    reading time, and pack them into chunks of about BATCH_CHUNK_PAIRS windows
+    without splitting a spec across chunks.
+    """
+    chunks, chunk = [], []
+    for n, spec in enumerate(specs):
+        start = parse_day(spec.start_date, "start_date") if spec.start_date else None
+        end = parse_day(spec.end_date, "end_date") if spec.end_date else None
+        lo = datetime.combine(start, datetime.min.time()) if start else datetime.min
+        hi = datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else datetime.max
+        windows = [(n, sid, lo, hi) for sid in dict.fromkeys(spec.station_ids)]
+        if chunk and len(chunk) + len(windows) > BATCH_CHUNK_PAIRS:
+            chunks.append(chunk)
+            chunk = []
+        chunk.extend(windows)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def batch_query():
+    """All windows of one chunk in one statement: unnest the window arrays, one index range scan per window."""
+    ingest_cols_clause = ", ".join(f'd.{dq(f)}' for f in BASE_FIELDS + AWS_EXTRA_FIELDS)
+    return template(("batch",), lambda: f"""
+        SELECT
+            w.spec,
+            {", ".join(MASTER_SELECT_COLS)},
+            {ingest_cols_clause.replace('d.', 'r.')}
+        FROM unnest(CAST(:specs AS integer[]), CAST(:ids AS text[]),
+                    CAST(:starts AS timestamp[]), CAST(:ends AS timestamp[])) AS w(spec, station_id, lo, hi)
+        JOIN nhp_v2 m ON m.id = w.station_id
+        CROSS JOIN LATERAL (
+            SELECT {ingest_cols_clause}, nhp_ts(d."DateTime") AS ts
+            FROM nhp_rtdas_ingest_v1 d
+            WHERE d."StationID" = w.station_id
+              AND nhp_ts(d."DateTime") >= w.lo
+              AND nhp_ts(d."DateTime") < w.hi
+            ORDER BY nhp_ts(d."DateTime") NULLS FIRST  -- backward walk of the DESC NULLS LAST index, no sort
+            LIMIT :limit
+        ) r
+        ORDER BY w.spec, m.id, r.ts
+    """, {"specs": "integer[]", "starts": "timestamp[]", "ends": "timestamp[]"})
+
+
+def stream_batch(source, specs: List[BatchSpec], chunks, projections: List[Optional[Projection]]):
+    """One NDJSON line per spec, written as soon as the statement covering it has run."""
+    query = batch_query()
+    with source.connect() as conn:
+        for chunk in chunks:
+            spec_nos = list(dict.fromkeys(w[0] for w in chunk))
+            params = {
+                "specs": [w[0] for w in chunk],
+                "ids": [w[1] for w in chunk],
+                "starts": [w[2] for w in chunk],
+                "ends": [w[3] for w in chunk],
+                "limit": BATCH_MAX_ROWS_PER_STATION,
+            }
+            try:
+                with stage("fetch"):
+                    rows = execute(conn, query, params).mappings().all()
+            except Exception as e:
+                conn.rollback()
+                for n in spec_nos:
+                    yield ndjson_line({"index": n, "id": specs[n].id, "error": str(e).splitlines()[0]})
+                continue
+
+            by_spec: Dict[int, list] = {n: [] for n in spec_nos}
+            for r in rows:
+                by_spec[r["spec"]].append(r)
+            for n in spec_nos:
+                spec_rows = by_spec[n]
+                per_station: Dict[str, int] = {}
+                for r in spec_rows:
+                    per_station[r["station_id"]] = per_station.get(r["station_id"], 0) + 1
+                yield ndjson_line({
+                    "index": n,
+                    "id": specs[n].id,
+                    "total_records": len(spec_rows),
+                    "truncated": any(c >= BATCH_MAX_ROWS_PER_STATION for c in per_station.values()),
+                    "unknown_station_ids": [sid for sid in specs[n].station_ids if master_index.get(sid) is None],
+                    "data": [shape_record(r, projections[n]) for r in spec_rows],
+                })
+
+
+@app.post("/stations/batch", dependencies=[Depends(rate_limit)])
+def batch_station_data(body: BatchRequest, user: str = Depends(get_current_user)):
+    """
+    Many (station_ids, start_date, end_date, fields) windows in one request.
+
+    The windows are packed into a few set-based statements (unnest of the
+    window arrays joined laterally to the (StationID, time) index), and the
+    response is NDJSON with one line per spec, in request order, each written
+    as soon as its statement has run: {"index", "id", "total_records",
+    "truncated", "unknown_station_ids", "data"}, or {"index", "id", "error"}.
+    Rows are oldest first, at most BATCH_MAX_ROWS_PER_STATION per station
+    and spec.
+    """
+    specs = body.queries
+    if len(specs) > BATCH_MAX_SPECS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_SPECS} queries per batch")
+    pairs = sum(len(set(s.station_ids)) for s in specs)
+    if pairs > BATCH_MAX_PAIRS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_PAIRS} station windows per batch, got {pairs}")
+    projections = [parse_projection(s.fields) for s in specs]
+    chunks = batch_windows(specs)
+
+    stream = stream_batch(read_engine(), specs, chunks, projections)
+    return HeavyStreamingResponse(stream, media_type="application/x-ndjson")
+
+
+# ------------------ /stations/aggregate ------------------
+BUCKET_INTERVALS = {"15m": 900, "1h": 3600, "1d": 86400}
+
+NUMERIC_FIELDS = [f for f in BASE_FIELDS + AWS_EXTRA_FIELDS if f not in ("MobileNumber", "DateTime")]
+
+# {v} is the parsed numeric reading, ts its parsed time
+AGG_FUNCS = {
+    "sum": "SUM({v})",
+    "min": "MIN({v})",
+    "max": "MAX({v})",
+    "mean": "AVG({v})",
+    "count": "COUNT({v})",
+    "first": "(ARRAY_AGG({v} ORDER BY ts ASC) FILTER (WHERE {v} IS NOT NULL))[1]",
+    "last": "(ARRAY_AGG({v} ORDER BY ts DESC) FILTER (WHERE {v} IS NOT NULL))[1]",
+}
+
+DEFAULT_AGGS = ["HourlyRain:sum", "WaterLevel:min,max,mean", "Battery:last"]
+
+
+def parse_aggs(specs: List[str]) -> dict:
+    """
+    Parse ["Field:func,func", ...] into {field: [funcs]}.
+    Field names may use the DB name ('At.pressure') or the output key ('At_pressure').
+    """
+    by_key = {safe_key(f): f for f in NUMERIC_FIELDS}
+    aggs = {}
+    for spec in specs:
+        name, _, funcs = spec.partition(":")
+        field = by_key.get(safe_key(name.strip()))
+        if field is None:
+            raise HTTPException(status_code=400, detail=f"Unknown aggregate field '{name}', use one of: {', '.join(by_key)}")
+        for func in (funcs or "mean").split(","):
+            func = func.strip().lower()
+            if func not in AGG_FUNCS:
+                raise HTTPException(status_code=400, detail=f"Unknown aggregate '{func}', use one of: {', '.join(AGG_FUNCS)}")
+            if func not in aggs.setdefault(field, []):
+                aggs[field].append(func)
+    return aggs
+
+
+@app.get("/stations/aggregate", dependencies=[Depends(rate_limit)])
+def get_station_aggregates(
+    start_date: Optional[str] = Query(None, description="Filter by start date (YYYY-MM-DD, DD-MM-YYYY)"),
+    end_date: Optional[str] = Query(None, description="Filter by end date (YYYY-MM-DD, DD-MM-YYYY)"),
+    station_type: Optional[str] = Query(None, description="Filter by station type (AWLR, ARG, AWS, ARG+AWLR)"),
+    zone: Optional[str] = Query(None, description="Filter by zone name"),
+    location: Optional[str] = Query(None, description="Filter by location name"),
+    district: Optional[str] = Query(None, description="Filter by district name"),
+    interval: str = Query("1h", description="Bucket size: 15m, 1h or 1d"),
+    agg: Optional[List[str]] = Query(None, description="Field:func[,func] (sum, min, max, mean, count, first, last); repeatable"),
+    user: str = Depends(get_current_user),
+):
+    """
+    Time-bucketed aggregates per station, computed in the database.
+    Default aggregates: sum of HourlyRain, min/max/mean of WaterLevel, last Battery.
+    Only the buckets are returned; station metadata comes once per station.
+    """
+    if interval not in BUCKET_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Unsupported interval '{interval}', use one of: {', '.join(BUCKET_INTERVALS)}")
+    aggs = parse_aggs(agg or DEFAULT_AGGS)
+
+    ids = master_index.resolve(district=district, location=location, zone=zone, station_type=station_type)
+    if ids is not None and not ids:
+        return {"interval": interval, "aggregates": aggs, "total_buckets": 0, "stations": []}
+
+    filters = ['nhp_ts(d."DateTime") IS NOT NULL']
+    params = {"bucket_secs": BUCKET_INTERVALS[interval]}
+    if ids is not None:
+        filters.append('d."StationID" = ANY(:ids)')
+        params["ids"] = ids
+    # bounds on nhp_ts() rather than ::date so the (StationID, time) index applies
+    if start_date:
+        filters.append('nhp_ts(d."DateTime") >= CAST(:start_date AS date)')
         params["start_date"] = start_date
+    if end_date:
+        filters.append('nhp_ts(d."DateTime") < CAST(:end_date AS date) + 1')
         params["end_date"] = end_date
-    elif start_date:
-        filters.append('AND d."DateTime"::date >= :start_date')
+
+    def build():
+        reading_cols = ",\n                ".join(f'nhp_num(d.{dq(f)}) AS {dq(safe_key(f))}' for f in aggs)
+        agg_cols = ",\n            ".join(
+            f'{AGG_FUNCS[func].format(v=dq(safe_key(f)))} AS {dq(safe_key(f) + "_" + func)}'
+            for f, funcs in aggs.items() for func in funcs
+        )
+        return f"""
+            WITH readings AS (
+                SELECT
+                    d."StationID" AS station_id,
+                    nhp_ts(d."DateTime") AS ts,
+                    {reading_cols}
+                FROM nhp_rtdas_ingest_v1 d
+                {where(filters)}
+            )
+            SELECT
+                station_id,
+                to_timestamp(floor(extract(epoch FROM ts) / :bucket_secs) * :bucket_secs) AT TIME ZONE 'UTC' AS bucket,
+                COUNT(*) AS readings,
+                {agg_cols}
+            FROM readings
+            GROUP BY station_id, bucket
+            ORDER BY station_id, bucket
+        """
+
+    agg_key = tuple((f, tuple(funcs)) for f, funcs in aggs.items())
+    query = template(("aggregate", tuple(filters), agg_key), build)
+
+    def run() -> bytes:
+        with read_engine().connect() as conn:
+            df = clean_frame(read_frame(conn, query, params))
+
+        stations = {}
+        for r in df.to_dict(orient="records"):
+            sid = r.pop("station_id")
+            if sid not in stations:
+                meta = master_index.get(sid) or {}
+                stations[sid] = {
+                    "station_id": sid,
+                    **{k: meta.get(k) for k in ("longitude", "latitude", "zone", "name", "type", "location", "district")},
+                    "buckets": [],
+                }
+            stations[sid]["buckets"].append(r)
+
+        return json_body({
+            "interval": interval,
+            "aggregates": aggs,
+            "total_buckets": len(df),
+            "stations": list(stations.values()),
+        })
+
+    key = cache_key("/stations/aggregate", {
+        "start_date": start_date, "end_date": end_date, "station_type": station_type, "zone": zone,
+        "location": location, "district": district, "interval": interval, "agg": aggs,
+    })
+    return Response(content=flights.do("/stations/aggregate", key, lambda: run_heavy(run)), media_type="application/json")
+
+
+@app.get("/stations/{station_id}/series", dependencies=[Depends(rate_limit)])
+def get_station_series(
+    station_id: str,
+    field: str = Query("WaterLevel", description="Reading to plot (e.g. WaterLevel, HourlyRain, Battery)"),
+    start_date: Optional[str] = Query(None, description="Filter by start date (YYYY-MM-DD, DD-MM-YYYY)"),
+    end_date: Optional[str] = Query(None, description="Filter by end date (YYYY-MM-DD, DD-MM-YYYY)"),
+    max_points: Optional[int] = Query(None, ge=3, le=20000, description="Downsample to at most this many points (LTTB)"),
+    user: str = Depends(get_current_user),
+):
+    """
+    Time series of one reading for one station, oldest first, as parallel arrays.
+    With max_points the series is reduced with Largest-Triangle-Three-Buckets,
+    which keeps the visual shape (including flood peaks) of the full series.
+    """
+    by_key = {safe_key(f): f for f in NUMERIC_FIELDS}
+    column = by_key.get(safe_key(field))
+    if column is None:
+        raise HTTPException(status_code=400, detail=f"Unknown field '{field}', use one of: {', '.join(by_key)}")
+    meta = master_index.get(station_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail=f"Station '{station_id}' not found")
+
+    filters = ['d."StationID" = :station_id']
+    params = {"station_id": station_id}
+    if start_date:
+        filters.append('nhp_ts(d."DateTime") >= CAST(:start_date AS date)')
         params["start_date"] = start_date
-    elif end_date:
-        filters.append('AND d."DateTime"::date <= :end_date')
+    if end_date:
+        filters.append('nhp_ts(d."DateTime") < CAST(:end_date AS date) + 1')
         params["end_date"] = end_date
 
-    if district:
-        filters.append("AND LOWER(m.district) ILIKE :district")
-        params["district"] = make_pattern(district)
-    if location:
-        filters.append("AND LOWER(m.location) ILIKE :location")
-        params["location"] = make_pattern(location)
-    if zone:
-        filters.append("AND LOWER(m.zone) ILIKE :zone")
-        params["zone"] = make_pattern(zone)
-    if station_type:
-        filters.append("AND LOWER(m.type) ILIKE :station_type")
-        params["station_type"] = make_pattern(station_type)
-
-    master_cols = [
-        "m.id AS station_id",
-        "m.longitude",
-        "m.latitude",
-        "m.zone",
-        "m.name",
-        "m.type",
-        "m.location",
-        "m.district"
-    ]
-
-    ingest_cols = [f'd.{dq(f)}' for f in BASE_FIELDS + AWS_EXTRA_FIELDS] 
-
-    select_clause = ",\n            ".join(master_cols + ingest_cols)
-
-    data_query = text(f"""
-        SELECT
-            {select_clause}
-        {base_query}
-        {' '.join(filters)}
-        ORDER BY d."DateTime" DESC
-        LIMIT :limit OFFSET :offset
+    query = template(("series", column, tuple(filters)), lambda: f"""
+        SELECT ts, v FROM (
+            SELECT nhp_ts(d."DateTime") AS ts, nhp_num(d.{dq(column)}) AS v
+            FROM nhp_rtdas_ingest_v1 d
+            {where(filters)}
+        ) s
+        WHERE ts IS NOT NULL AND v IS NOT NULL
+        ORDER BY ts
     """)
 
-    params["limit"] = page_size
-    params["offset"] = (page - 1) * page_size
+    def run() -> bytes:
+        import numpy as np
+        from nhp_series import lttb
 
-    count_query = text(f"""
-        SELECT COUNT(*) AS total
-        {base_query}
-        {' '.join(filters)}
-    """)
+        with read_engine().connect() as conn:
+            df = read_frame(conn, query, params)
 
-    with engine.connect() as conn:
-        df = pd.read_sql(data_query, conn, params=params)
-        total_records = conn.execute(count_query, params).scalar() or 0
-
-    records = []
-    for r in df.to_dict(orient="records"):
-        stype = (r.get("type") or "").strip().lower()
-        out = {
-            "station_id": r.get("station_id"),
-            "longitude": r.get("longitude"),
-            "latitude": r.get("latitude"),
-            "zone": r.get("zone"),
-            "name": r.get("name"),
-            "type": r.get("type"),
-            "location": r.get("location"),
-            "district": r.get("district"),
-        }
+        ts = df["ts"].to_numpy(dtype="datetime64[s]")
+        values = df["v"].to_numpy(dtype=float)
+        total_points = len(ts)
+        if max_points and total_points > max_points:
+            keep = lttb(ts.astype(np.int64), values, max_points)
+            ts, values = ts[keep], values[keep]
 
-        for f in BASE_FIELDS:
-            out[f] = r.get(f)
+        return json_body({
+            "station_id": station_id,
+            **{k: meta.get(k) for k in ("longitude", "latitude", "zone", "name", "type", "location", "district")},
+            "field": safe_key(column),
+            "total_points": total_points,
+            "returned_points": len(ts),
+            "downsampled": len(ts) < total_points,
+            "series": {
+                "DateTime": np.datetime_as_string(ts, unit="s").tolist(),
+                safe_key(column): values.tolist(),
+            },
+        })
 
-        if stype == "aws":
-            for f in AWS_EXTRA_FIELDS:
-                key = f.replace(" ", "_").replace(".", "_")
-                out[key] = r.get(f)
-        records.append(out)
+    key = cache_key("/stations/{station_id}/series", {
+        "station_id": station_id, "field": column, "start_date": start_date, "end_date": end_date,
+        "max_points": max_points,
+    })
+    return Response(content=flights.do("/stations/{station_id}/series", key, lambda: run_heavy(run)), media_type="application/json")
 
-    return {
-        "page": page,
-        "page_size": page_size,
-        "total_records": int(total_records),
-        "total_pages": (int(total_records) + page_size - 1) // page_size,
-        "data": records,
-    }
+
+# ------------------ /stations/latest query engines ------------------
+# "lateral" (default): pick stations from nhp_v2 first, then one index probe per
+#   station on (StationID, nhp_ts(DateTime) DESC) -- cost ~ stations x limit.
+# "window": the original ROW_NUMBER() over the whole ingest history.
+LATEST_QUERY_ENGINE = os.getenv("LATEST_QUERY_ENGINE", "lateral")
+
+LATEST_MASTER_COLS = """
+            m.id AS station_id,
+            m.longitude,
+            m.latitude,
+            m.zone,
+            m.name,
+            m.type,
+            m.location,
+            m.district"""
+
+
+def build_latest_query(with_ids: bool, engine_name: Optional[str] = None, projection: Optional[Projection] = None):
+    """
+    Latest-N-per-station query template; `with_ids` adds the ANY(:ids) station
+    filter, `projection` narrows the SELECT list.
+    """
+    engine_name = engine_name or LATEST_QUERY_ENGINE
+    return template(("latest", engine_name, with_ids, projection),
+                    lambda: latest_query_sql(with_ids, engine_name, projection))
 
 
-@app.get("/stations/latest")
+def latest_query_sql(with_ids: bool, engine_name: str, projection: Optional[Projection] = None) -> str:
+    if projection is None:
+        ingest_cols_clause = ", ".join(f'd.{dq(f)}' for f in BASE_FIELDS + AWS_EXTRA_FIELDS)
+        master_cols = LATEST_MASTER_COLS
+    else:
+        ingest_cols_clause = ", ".join(ingest_select_cols(fields=projection.ingest))
+        master_cols = "\n            " + ",\n            ".join(master_select_cols(projection.master))
+
+    if engine_name == "window":
+        return f"""
+            WITH ranked AS (
+                SELECT
+                    d."StationID",
+                    {ingest_cols_clause},
+                    ROW_NUMBER() OVER (PARTITION BY d."StationID" ORDER BY d."DateTime"::timestamp DESC) AS rn
+                FROM nhp_rtdas_ingest_v1 d
+                {where(['d."StationID" = ANY(:ids)'] if with_ids else [])}
+            )
+            SELECT{master_cols},
+                r."StationID" as ingest_stationid,
+                {ingest_cols_clause.replace('d.', 'r.')}
+            FROM ranked r
+            JOIN nhp_v2 m ON m.id = r."StationID"
+            WHERE r.rn <= :limit
+            ORDER BY r."StationID", r."DateTime" DESC
+        """
+
+    return f"""
+        SELECT{master_cols},
+            r."StationID" as ingest_stationid,
+            {ingest_cols_clause.replace('d.', 'r.')}
+        FROM nhp_v2 m
+        CROSS JOIN LATERAL (
+            SELECT
+                d."StationID",
+                {ingest_cols_clause},
+                nhp_ts(d."DateTime") AS ts
+            FROM nhp_rtdas_ingest_v1 d
+            WHERE d."StationID" = m.id
+            ORDER BY nhp_ts(d."DateTime") DESC NULLS LAST
+            LIMIT :limit
+        ) r
+        {where(["m.id = ANY(:ids)"] if with_ids else [])}
+        ORDER BY m.id, r.ts DESC NULLS LAST
+    """
+
+
+@app.get("/stations/latest", dependencies=[Depends(rate_limit)])
 def get_latest_station_data(
+    request: Request,
     station_type: Optional[str] = Query(None, description="Filter by station type"),
     zone: Optional[str] = Query(None, description="Filter by zone name"),
     district: Optional[str] = Query(None, description="Filter by district name"),
     location: Optional[str] = Query(None, description="Filter by location name"),
     limit: Optional[int] = Query(1, ge=1, le=20, description="Number of latest records per station (default 1, max 20)"),
+    fields: Optional[str] = Query(None, description="Comma-separated output fields, e.g. HourlyRain,DailyRain (default: all)"),
+    geo: Optional[GeoFilter] = Depends(geo_filter),
     user: str = Depends(get_current_user),
 ):
     """
     Fetch latest N records per station (default = 1, max = 20).
+    Stations can also be limited to a map area (bbox, or lat/lon + radius_km);
+    fields= selects and returns only the named columns.
     AWS stations return 14 fields, others return base 6 fields.
+    Matching stations are picked from nhp_v2 first, then each station's top N
+    rows are read through the (StationID, time DESC) index. While the
+    in-memory snapshot (nhp_snapshot) is fresh, it answers without a query.
     """
 
+    projection = parse_projection(fields)
+    cache_params = {
+        "station_type": station_type, "zone": zone, "district": district,
+        "location": location, "limit": limit, "geo": geo, "fields": projection,
+    }
+
+    ids = master_index.resolve(geo, district=district, location=location, zone=zone, station_type=station_type)
+    if ids is not None and not ids:
+        return {
+            "limit_per_station": limit,
+            "total_records": 0,
+            "data": [],
+        }
+
+    if LATEST_SNAPSHOT and limit <= latest_snapshot.depth and latest_snapshot.ready():
+        key = cache_key("/stations/latest", cache_params)
+        etag, body = latest_from_snapshot(key, ids, limit, projection)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+        return Response(content=body, media_type="application/json", headers=validator_headers(etag))
+
+    query = build_latest_query(ids is not None, projection=projection)
     params = {"limit": limit}
-    meta_filters = []
-
-    if district:
-        meta_filters.append("AND LOWER(m.district) ILIKE :district")
-        params["district"] = make_pattern(district)
-    if location:
-        meta_filters.append("AND LOWER(m.location) ILIKE :location")
-        params["location"] = make_pattern(location)
-    if zone:
-        meta_filters.append("AND LOWER(m.zone) ILIKE :zone")
-        params["zone"] = make_pattern(zone)
-    if station_type:
-        meta_filters.append("AND LOWER(m.type) ILIKE :station_type")
-        params["station_type"] = make_pattern(station_type)
-
-    meta_where = " ".join(meta_filters)
-
-    all_ingest_cols = [f'd.{dq(f)}' for f in BASE_FIELDS + AWS_EXTRA_FIELDS]
-    ingest_cols_clause = ", ".join(all_ingest_cols)
-
-    query = text(f"""
-        WITH ranked AS (
-            SELECT
-                d."StationID",
-                {ingest_cols_clause},
-                ROW_NUMBER() OVER (PARTITION BY d."StationID" ORDER BY d."DateTime"::timestamp DESC) AS rn
+    if ids is not None:
+        params["ids"] = ids
+
+    with read_engine().connect() as conn:
+        versions = latest_versions(conn, ids, limit)
+        etag = make_etag(cache_key("/stations/latest", cache_params), versions, master_index.digest)
+        headers = validator_headers(etag)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+        cached = response_cache.get("/stations/latest", cache_params, etag)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json", headers=headers)
+
+    def run() -> bytes:
+        with read_engine().connect() as conn:
+            df = clean_frame(read_frame(conn, query, params))
+
+        with stage("shape"):
+            records = [shape_record(r, projection) for r in df.to_dict(orient="records")]
+
+        body = json_body({
+            "limit_per_station": limit,
+            "total_records": len(records),
+            "data": records,
+        })
+        response_cache.set("/stations/latest", cache_params, etag, body)
+        return body
+
+    body = flights.do("/stations/latest", etag, run)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+
+# ------------------ Streaming new readings (SSE / WebSocket) ------------------
+def stream_cursors(ids: List[str]) -> Dict[str, object]:
+    """Time of the newest reading per station (None for stations without readings)."""
+    query = template(("stream_cursors",), lambda: """
+        SELECT c.id, w.ts
+        FROM unnest(CAST(:ids AS text[])) AS c(id)
+        LEFT JOIN LATERAL (
+            SELECT nhp_ts(d."DateTime") AS ts
             FROM nhp_rtdas_ingest_v1 d
-        )
-        SELECT
-            m.id AS station_id,
-            m.longitude,
-            m.latitude,
-            m.zone,
-            m.name,
-            m.type,
-            m.location,
-            m.district,
-            r."StationID" as ingest_stationid,
-            {ingest_cols_clause.replace('d.', 'r.')}
-        FROM ranked r
-        JOIN nhp_v2 m ON m.id = r."StationID"
-        WHERE r.rn <= :limit {meta_where}
-        ORDER BY r."StationID", r."DateTime" DESC;
+            WHERE d."StationID" = c.id
+            ORDER BY nhp_ts(d."DateTime") DESC NULLS LAST
+            LIMIT 1
+        ) w ON true
     """)
+    with engine.connect() as conn:
+        return dict(execute(conn, query, {"ids": ids}).fetchall())
 
+
+def stream_new_readings(cursors: Dict[str, object]):
+    """
+    Readings newer than each station's cursor, oldest first, shaped like
+    /stations/latest records; plus the new cursor per station. Read from the
+    primary: a replica may not have replayed the notified commit yet.
+    """
+    ingest_cols_clause = ", ".join(f'd.{dq(f)}' for f in BASE_FIELDS + AWS_EXTRA_FIELDS)
+    query = template(("stream_new",), lambda: f"""
+        SELECT{LATEST_MASTER_COLS},
+            {ingest_cols_clause.replace('d.', 'r.')},
+            r.ts
+        FROM unnest(CAST(:ids AS text[]), CAST(:since AS timestamp[])) AS c(id, since)
+        JOIN nhp_v2 m ON m.id = c.id
+        CROSS JOIN LATERAL (
+            SELECT {ingest_cols_clause}, nhp_ts(d."DateTime") AS ts
+            FROM nhp_rtdas_ingest_v1 d
+            WHERE d."StationID" = c.id
+              AND nhp_ts(d."DateTime") > COALESCE(c.since, '-infinity'::timestamp)
+            ORDER BY nhp_ts(d."DateTime") DESC NULLS LAST
+            LIMIT :limit
+        ) r
+        ORDER BY r.ts, m.id
+    """, {"since": "timestamp[]"})
+    ids = list(cursors)
+    params = {"ids": ids, "since": [cursors[sid] for sid in ids], "limit": STREAM_MAX_ROWS_PER_STATION}
     with engine.connect() as conn:
-        df = pd.read_sql(query, conn, params=params)
-
-    records = []
-    for r in df.to_dict(orient="records"):
-        stype = (r.get("type") or "").strip().lower()
-        out = {
-            "station_id": r.get("station_id"),
-            "longitude": r.get("longitude"),
-            "latitude": r.get("latitude"),
-            "zone": r.get("zone"),
-            "name": r.get("name"),
-            "type": r.get("type"),
-            "location": r.get("location"),
-            "district": r.get("district"),
-        }
+        rows = execute(conn, query, params).mappings().all()
+
+    latest = {}
+    for r in rows:
+        latest[r["station_id"]] = r["ts"]  # rows are oldest first
+    return [shape_record(r) for r in rows], latest
 
-        for f in BASE_FIELDS:
-            out[f] = r.get(f)
 
-        if stype == "aws":
-            for f in AWS_EXTRA_FIELDS:
-                key = f.replace(" ", "_").replace(".", "_")
-                out[key] = r.get(f)
+# One LISTEN connection per worker process, fanned out to every subscriber
+reading_hub = ReadingHub(
+    engine,
+    load_new=stream_new_readings,
+    load_cursors=stream_cursors,
+    all_ids=lambda: [r["id"] for r in master_index.filter()],
+)
 
-        records.append(out)
 
-    return {
-        "limit_per_station": limit,
-        "total_records": len(records),
-        "data": records,
-    }
+async def open_subscription(district, location, zone, station_type):
+    ids = await run_in_threadpool(
+        master_index.resolve, district=district, location=location, zone=zone, station_type=station_type,
+    )
+    if ids is not None and not ids:
+        raise HTTPException(status_code=404, detail="No stations match the filters")
+    try:
+        return await run_in_threadpool(reading_hub.subscribe, ids, asyncio.get_running_loop())
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Stream unavailable: {str(e)}")
+
+
+def stream_payload(records) -> dict:
+    return {"total_records": len(records), "data": records}
 
 
+@app.get("/stations/stream", dependencies=[Depends(rate_limit)])
+async def stream_station_data(
+    station_type: Optional[str] = Query(None, description="Filter by station type"),
+    zone: Optional[str] = Query(None, description="Filter by zone name"),
+    district: Optional[str] = Query(None, description="Filter by district name"),
+    location: Optional[str] = Query(None, description="Filter by location name"),
+    user: str = Depends(get_current_user),
+):
+    """
+    Server-Sent Events stream of new readings for the matching stations, as
+    they are committed by the ingest. Each `readings` event carries records
+    shaped like /stations/latest; a `lagged` event means the client fell
+    behind and should re-read /stations/latest and reconnect.
+    """
+    sub = await open_subscription(district, location, zone, station_type)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    records = await sub.get(STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if records is None:
+                    yield "event: lagged\ndata: {}\n\n"
+                    return
+                yield f"event: readings\ndata: {json.dumps(stream_payload(records), default=str)}\n\n"
+        finally:
+            reading_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/stations/stream/ws")
+async def stream_station_data_ws(
+    websocket: WebSocket,
+    station_type: Optional[str] = Query(None),
+    zone: Optional[str] = Query(None),
+    district: Optional[str] = Query(None),
+    location: Optional[str] = Query(None),
+    user: str = Depends(get_websocket_user),
+):
+    """WebSocket variant of /stations/stream: one JSON message per batch of new readings."""
+    try:
+        sub = await open_subscription(district, location, zone, station_type)
+    except HTTPException as e:
+        await websocket.close(code=1008 if e.status_code == 404 else 1013, reason=e.detail)
+        return
+
+    await websocket.accept()
+    # a pending receive() is how a closed client socket shows up
+    closed = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            pending = asyncio.ensure_future(sub.get(STREAM_HEARTBEAT))
+            done, _ = await asyncio.wait({pending, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if closed in done:
+                pending.cancel()
+                if closed.result()["type"] == "websocket.disconnect":
+                    return
+                closed = asyncio.ensure_future(websocket.receive())  # ignore client messages
+                continue
+            try:
+                records = pending.result()
+            except asyncio.TimeoutError:
+                await websocket.send_text('{"event": "keep-alive"}')
+                continue
+            if records is None:
+                await websocket.send_text('{"event": "lagged"}')
+                await websocket.close(code=1013)
+                return
+            await websocket.send_text(json.dumps({"event": "readings", **stream_payload(records)}, default=str))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        closed.cancel()
+        reading_hub.unsubscribe(sub)
+
+
+# ------------------ Latest-readings snapshot ------------------
+def snapshot_readings(cursors: Dict[str, object], depth: int) -> Dict[str, List[Dict]]:
+    """
+    Up to `depth` readings per station newer than its cursor, newest first, as
+    {station: [ingest fields + "ts"]}. A None cursor gets the station's newest
+    rows of any time, NULL times last, like latest_query(). Read from the
+    primary, like the stream: it is driven by the same notifications.
+    """
+    ingest_cols_clause = ", ".join(f'd.{dq(f)}' for f in BASE_FIELDS + AWS_EXTRA_FIELDS)
 
-@app.get("/master/filter")
+    def build(since: bool) -> str:
+        # separate statements: `ts > since` must stay an index condition, and
+        # rows whose time does not parse (NULL) only come with a None cursor
+        return f"""
+            SELECT c.id AS snapshot_station, r.*
+            FROM unnest(CAST(:ids AS text[]){", CAST(:since AS timestamp[])" if since else ""})
+                AS c(id{", since" if since else ""})
+            CROSS JOIN LATERAL (
+                SELECT {ingest_cols_clause}, nhp_ts(d."DateTime") AS ts
+                FROM nhp_rtdas_ingest_v1 d
+                WHERE d."StationID" = c.id
+                  {'AND nhp_ts(d."DateTime") > c.since' if since else ""}
+                ORDER BY nhp_ts(d."DateTime") DESC NULLS LAST
+                LIMIT :limit
+            ) r
+        """
+
+    newer = [sid for sid, since in cursors.items() if since is not None]
+    fresh = [sid for sid, since in cursors.items() if since is None]
+    rows = []
+    with engine.connect() as conn:
+        if newer:
+            query = template(("snapshot", True), lambda: build(True), {"since": "timestamp[]"})
+            params = {"ids": newer, "since": [cursors[sid] for sid in newer], "limit": depth}
+            rows += execute(conn, query, params).mappings().all()
+        if fresh:
+            query = template(("snapshot", False), lambda: build(False))
+            rows += execute(conn, query, {"ids": fresh, "limit": depth}).mappings().all()
+
+    out: Dict[str, List[Dict]] = {}
+    for r in rows:
+        row = dict(r)
+        out.setdefault(row.pop("snapshot_station"), []).append(row)
+    return out
+
+
+# Newest readings of every station, refreshed in the background (polls + NOTIFY)
+latest_snapshot = LatestSnapshot(
+    snapshot_readings,
+    all_ids=lambda: [r["id"] for r in master_index.filter()],
+    hub=reading_hub,
+)
+
+
+def latest_from_snapshot(key: str, ids: Optional[List[str]], limit: int, projection: Optional[Projection]):
+    """
+    /stations/latest answered from latest_snapshot: (etag, body).
+    Same records, order and validators as the database path (the ETag digests
+    the same per-station reading times as latest_versions()); both are built
+    once per snapshot version and view, from one version of the rows.
+    """
+    stations = master_index.filter() if ids is None else [master_index.get(sid) for sid in ids]
+
+    def render() -> Tuple[str, bytes]:
+        readings = latest_snapshot.readings()
+        records, times = [], {}
+        for m in stations:
+            station = {
+                "station_id": m["id"], "longitude": m["longitude"], "latitude": m["latitude"],
+                "zone": m["zone"], "name": m["name"], "type": m["type"],
+                "location": m["location"], "district": m["district"],
+            }
+            rows = readings.get(m["id"], [])[:limit]
+            if rows:
+                times[m["id"]] = tuple(r["ts"] for r in rows)
+            for reading in rows:
+                records.append(shape_record({**station, **reading}, projection))
+        etag = make_etag(key, reading_digest(times), master_index.digest)
+        return etag, json_body({
+            "limit_per_station": limit,
+            "total_records": len(records),
+            "data": records,
+        })
+
+    # the master digest keeps views of a reloaded master table apart
+    return latest_snapshot.view(f"{key}|{master_index.digest}", render)
+
+
+@app.get("/master/filter", dependencies=[Depends(rate_limit)])
 def get_filtered(
+    request: Request,
     district: Optional[str] = Query(None, description="District name (case-insensitive)"),
     location: Optional[str] = Query(None, description="Location name (case-insensitive)"),
     zone: Optional[str] = Query(None, description="Zone name (case-insensitive)"),
     station_type: Optional[str] = Query(None, description="Sensor type (case-insensitive)"),
+    geo: Optional[GeoFilter] = Depends(geo_filter),
     user: str = Depends(get_current_user)
 ):
     """
-    Fetch master/meta data with fuzzy normalized filters.
+    Fetch master/meta data with fuzzy normalized filters and an optional map
+    area (bbox, or lat/lon + radius_km).
+    Served from the in-process master index; the ETag follows the master table content.
     """
 
-    filters = []
-    params = {}
+    try:
+        master_index.ensure_fresh()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    params = {"district": district, "location": location, "zone": zone, "station_type": station_type}
+    etag = make_etag(cache_key("/master/filter", {**params, "geo": geo}), master_index.digest)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+
+    rows = master_index.filter(geo, **params)
+    meta_cols = ["id", "district", "name", "location", "zone", "latitude", "longitude", "type"]
+    body = json_body({
+        "total_records": len(rows),
+        "meta data": [{c: r.get(c) for c in meta_cols} for r in rows],
+    })
+    return Response(content=body, media_type="application/json", headers=validator_headers(etag))
+
+
+@app.get("/master/nearby", dependencies=[Depends(rate_limit)])
+def get_nearby(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90, description="Latitude"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude"),
+    k: int = Query(10, ge=1, le=500, description="Number of stations (default 10, max 500)"),
+    radius_km: Optional[float] = Query(None, gt=0, le=GEO_MAX_RADIUS_KM, description="Only stations within this many km"),
+    district: Optional[str] = Query(None, description="District name (case-insensitive)"),
+    location: Optional[str] = Query(None, description="Location name (case-insensitive)"),
+    zone: Optional[str] = Query(None, description="Zone name (case-insensitive)"),
+    station_type: Optional[str] = Query(None, description="Sensor type (case-insensitive)"),
+    user: str = Depends(get_current_user),
+):
+    """
+    The k stations nearest to lat/lon (great-circle distance), nearest first,
+    optionally within radius_km and matching the fuzzy meta filters.
+    Served from the master index's spatial grid.
+    """
+    try:
+        master_index.ensure_fresh()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    filters = {"district": district, "location": location, "zone": zone, "station_type": station_type}
+    etag = make_etag(cache_key("/master/nearby", {**filters, "lat": lat, "lon": lon, "k": k, "radius_km": radius_km}),
+                     master_index.digest)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+
+    found = master_index.nearest(lat, lon, k, radius_km, **filters)
+    meta_cols = ["id", "district", "name", "location", "zone", "latitude", "longitude", "type"]
+    body = json_body({
+        "total_records": len(found),
+        "meta data": [{**{c: r.get(c) for c in meta_cols}, "distance_km": round(d, 3)} for r, d in found],
+    })
+    return Response(content=body, media_type="application/json", headers=validator_headers(etag))
 
-    if district:
-        filters.append("AND LOWER(district) ILIKE :district")
-        params["district"] = make_pattern(district)
-    if location:
-        filters.append("AND LOWER(location) ILIKE :location")
-        params["location"] = make_pattern(location)
-    if zone:
-        filters.append("AND LOWER(zone) ILIKE :zone")
-        params["zone"] = make_pattern(zone)
-    if station_type:
-        filters.append("AND LOWER(type) ILIKE :station_type")
-        params["station_type"] = make_pattern(station_type)
-
-    query = text(f"""
-        SELECT id, district, name, location, zone, latitude, longitude, type
-        FROM nhp_v2
-        WHERE 1=1 {' '.join(filters)}
-        ORDER BY "id";
-    """)
 
+@app.post("/master/refresh", dependencies=[Depends(rate_limit)])
+def refresh_master_index(user: str = Depends(get_current_user)):
+    """
+    Reload the in-process master index from nhp_v2 on demand.
+    """
     try:
-        with engine.connect() as conn:
-            df = pd.read_sql(query, conn, params=params)
+        master_index.refresh()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
     return {
-        "total_records": len(df),
-        "meta data": df.to_dict(orient="records"),
-    }
\ No newline at end of file
+        "version": master_index.version,
+        "loaded_at": master_index.loaded_at,
+    }
+
+
+@app.get("/metrics")
+def metrics(user: str = Depends(get_current_user)):
+    """
+    Prometheus text-format metrics for this worker process: request counts,
+    latency, response bytes, SQL execution time, rows, per-stage time
+    (fetch / shape / serialize) and connection-pool wait and usage.
+    """
+    return PlainTextResponse(nhp_metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/slow-queries")
+def slow_queries(
+    limit: int = Query(50, ge=1, le=500, description="Number of query shapes to return"),
+    user: str = Depends(get_current_user),
+):
+    """
+    Slow statements recorded on this host, grouped by query shape (one shape per
+    filter combination), slowest total time first. Each shape carries its most
+    recent sampled EXPLAIN (ANALYZE, BUFFERS) plan and the params it ran with.
+    """
+    try:
+        shapes = slow_query_log.summary(limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Slow-query log error: {str(e)}")
+
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "explain_rate": slow_query_log.explain_rate,
+        "dropped": slow_query_log.dropped,
+        "shapes": shapes,
+    }
+
+
+@app.get("/debug/pool")
+def pool_status(user: str = Depends(get_current_user)):
+    """
+    Connection-pool settings and current usage for this worker process
+    (shared with the mounted metadata API), plus replica lag and read routes.
+    """
+    return {
+        **nhp_db.pool_stats(),
+        "replicas": nhp_db.router.stats(),
+        "read_routes": nhp_db.READ_ROUTES,
+    }
+
+
+@app.get("/debug/stream")
+def stream_status(user: str = Depends(get_current_user)):
+    """State of this worker's LISTEN connection and its stream subscribers."""
+    return reading_hub.stats()
+
+
+@app.get("/debug/coalescing")
+def coalescing_status(user: str = Depends(get_current_user)):
+    """Requests that shared an identical in-flight query in this worker, per endpoint."""
+    return flights.stats()
+
+
+@app.get("/debug/snapshot")
+def snapshot_status(user: str = Depends(get_current_user)):
+    """State of this worker's in-memory /stations/latest snapshot."""
+    return latest_snapshot.stats()
+
+
+# ------------------ Startup warm-up / readiness ------------------
+def load_heavy_modules():
+    """Import the libraries request handlers load on first use (pandas, numpy, pyarrow)."""
+    import pandas  # noqa: F401
+    import nhp_series  # noqa: F401
+    arrow_available()
+
+
+def startup_templates() -> list:
+    """Query templates of the most common requests (no projection, JSON output)."""
+    tpls = [latest_versions_query(False), latest_versions_query(True),
+            build_latest_query(False), build_latest_query(True)]
+    for ids in (None, ["-"]):
+        for start_date, end_date in ((None, None), ("-", "-"), ("-", None)):
+            filters, _ = build_data_filters(ids, start_date, end_date)
+            tpls.extend(data_queries(filters))
+            tpls.append(data_versions_query(ids is not None, bool(start_date), bool(end_date)))
+    return tpls
+
+
+def prepare_startup_statements(conn):
+    for tpl in startup_templates():
+        prepare(conn, tpl)
+
+
+def wait_for_snapshot():
+    if not LATEST_SNAPSHOT:
+        return
+    latest_snapshot.start()
+    deadline = time.monotonic() + WARMUP_TIMEOUT
+    while not latest_snapshot.ready():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"latest snapshot not loaded: {latest_snapshot.error}")
+        time.sleep(0.05)
+
+
+# Run by the lifespan hook: every pooled connection is opened and has the common
+# statements prepared, the master table is mapped and the snapshot is loaded
+# before the first request, so a rolling restart does not show up as a spike.
+warmup = Warmup([
+    ("imports", load_heavy_modules),
+    ("pool", lambda: nhp_db.warm_pool(setup=prepare_startup_statements)),
+    ("master", master_index.ensure_fresh),
+    ("snapshot", wait_for_snapshot),
+])
+
+
+@app.get("/ready")
+def readiness():
+    """Readiness probe (no auth): 200 once this worker is warm (or WARMUP=0), 503 before."""
+    ready = warmup.ready() or not WARMUP
+    return JSONResponse(status_code=200 if ready else 503, content={**warmup.stats(), "ready": ready})
@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from nhp_master import normalize
+
+# ------------------ Config ------------------
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(tempfile.gettempdir(), "nhp_api_cache.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# seconds an entry may be served, per endpoint (0 disables caching for it)
+CACHE_TTLS = {
+    "/stations/latest": int(os.getenv("CACHE_TTL_LATEST", "30")),
+    "/stations/data": int(os.getenv("CACHE_TTL_DATA", "300")),
+}
+
+# query params matched through nhp_master.normalize() (MasterIndex.resolve)
+FUZZY_PARAMS = {"district", "location", "zone", "station_type"}
+
+
+# ------------------ Helper: cache key ------------------
+def cache_key(endpoint: str, params: Dict) -> str:
+    """
+    Build a stable key from the endpoint and its query params.
+    Fuzzy filters are normalized with nhp_master.normalize(), empty params are dropped.
+    """
+    norm = {}
+    for k, v in params.items():
+        if v is None or v == "":
+            continue
+        norm[k] = normalize(v) if k in FUZZY_PARAMS else v
+    return endpoint + "?" + json.dumps(norm, sort_keys=True, default=str)
+
+
+# ------------------ Response Cache ------------------
+class ResponseCache:
+    """
+    Serialized-response cache shared by all worker processes on the host.
+
+    Backed by a SQLite file in WAL mode. Each entry stores the validator it
+    was built from -- the response's ETag, which covers the per-station reading
+    digest and the master table digest; a lookup with a different validator
+    drops the entry. Entries also expire after the endpoint TTL, and the least
+    recently used ones are evicted once the cache exceeds max_bytes.
+    Cache errors are never raised to the caller -- they count as a miss.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES, ttls: Optional[Dict[str, int]] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT,
+                    validator TEXT,
+                    body BLOB,
+                    size INTEGER,
+                    created_at REAL,
+                    accessed_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_idx ON responses (accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, endpoint: str, params: Dict, validator: str) -> Optional[bytes]:
+        ttl = self.ttls.get(endpoint, 0)
+        if ttl <= 0:
+            return None
+        key = cache_key(endpoint, params)
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT body, validator, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            body, stored_validator, created_at = row
+            if now - created_at > ttl or stored_validator != validator:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return body
+        except sqlite3.Error:
+            return None
+
+    def set(self, endpoint: str, params: Dict, validator: str, body: bytes):
+        if self.ttls.get(endpoint, 0) <= 0 or len(body) > self.max_bytes:
+            return
+        key = cache_key(endpoint, params)
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, validator, body, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, validator, body, len(body), now, now),
+            )
+            self._evict()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self):
+        # keep the most recently used entries whose running size fits in max_bytes
+        self._conn().execute("""
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS running
+                    FROM responses
+                ) WHERE running > ?
+            )
+        """, (self.max_bytes,))
+
+    def clear(self):
+        try:
+            self._conn().execute("DELETE FROM responses")
+        except sqlite3.Error:
+            pass
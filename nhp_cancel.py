@@ -0,0 +1,150 @@
+import asyncio
+import contextvars
+import threading
+from typing import Optional, Set
+
+from sqlalchemy import event
+
+from nhp_metrics import Counter, current_endpoint, register
+
+CANCELLED = register(Counter(
+    "nhp_db_statements_cancelled_total",
+    "Statements ended early: client went away (disconnect) or statement_timeout hit (timeout)",
+    ["endpoint", "reason"],
+))
+
+# SQLSTATE query_canceled: statement_timeout and pg_cancel_backend / cancel() alike
+QUERY_CANCELED = "57014"
+
+
+class ClientDisconnected(Exception):
+    """The HTTP client of the request has gone away; no further statements are run for it."""
+
+
+# ------------------ Per-request state ------------------
+class RequestState:
+    """
+    DB connections a request has checked out, and whether its client is gone.
+
+    Once the client disconnects, cancel() is sent on every connection the
+    request still holds, so the statement stops on the server, the handler
+    raises and the connection goes back to the pool. `shared` is set while
+    other requests wait on this one's query (nhp_flight); it is then left to
+    finish for them.
+    """
+
+    def __init__(self):
+        self.connections: Set = set()
+        self.disconnected = False
+        self.shared = False
+        self._lock = threading.Lock()
+
+    def add(self, dbapi_conn):
+        with self._lock:
+            self.connections.add(dbapi_conn)
+
+    def discard(self, dbapi_conn):
+        with self._lock:
+            self.connections.discard(dbapi_conn)
+
+    def cancel(self, endpoint: str = "none"):
+        """Client gone: cancel whatever the request is running (unless others share it). Blocks briefly."""
+        self.disconnected = True
+        if self.shared:
+            return
+        with self._lock:
+            for dbapi_conn in list(self.connections):
+                try:
+                    dbapi_conn.cancel()
+                    CANCELLED.inc(endpoint, "disconnect")
+                except Exception:
+                    pass  # connection already broken; the pool will find out
+
+
+_request: contextvars.ContextVar = contextvars.ContextVar("nhp_request_state", default=None)
+
+
+def current_request() -> Optional[RequestState]:
+    return _request.get()
+
+
+def is_query_canceled(exc: BaseException) -> bool:
+    """True for a statement stopped by statement_timeout or a cancel request."""
+    return getattr(getattr(exc, "orig", exc), "pgcode", None) == QUERY_CANCELED
+
+
+# ------------------ DB hooks ------------------
+def instrument_cancellation(engine):
+    """Track which request holds each checked-out connection of `engine`, and refuse work for gone clients."""
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_conn, record, proxy):
+        state = current_request()
+        if state is not None:
+            state.add(dbapi_conn)
+            record.info["nhp_request"] = state
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_conn, record):
+        state = record.info.pop("nhp_request", None)
+        if state is not None:
+            state.discard(dbapi_conn)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        state = current_request()
+        if state is not None and state.disconnected and not state.shared:
+            raise ClientDisconnected()
+
+
+# ------------------ Middleware ------------------
+class CancelOnDisconnectMiddleware:
+    """
+    Pure ASGI middleware: watches each HTTP request for a client disconnect
+    while the app is still working on it, and cancels the request's running
+    statements (RequestState.cancel) when one arrives.
+
+    The watcher owns the receive channel and hands messages on to the app
+    through a queue, so request bodies and the disconnects that streaming
+    responses listen for still reach it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = RequestState()
+        token = _request.set(state)
+        inbox: asyncio.Queue = asyncio.Queue()
+        responded = False
+
+        async def watch():
+            while True:
+                try:
+                    message = await receive()
+                except Exception:
+                    message = {"type": "http.disconnect"}
+                await inbox.put(message)
+                if message["type"] == "http.disconnect":
+                    if not responded:
+                        # the worker thread is blocked in the driver; cancel from here
+                        await asyncio.get_running_loop().run_in_executor(None, state.cancel, current_endpoint())
+                    return
+
+        async def send_wrapper(message):
+            nonlocal responded
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                responded = True
+            await send(message)
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await self.app(scope, inbox.get, send_wrapper)
+        finally:
+            responded = True
+            watcher.cancel()
+            _request.reset(token)
@@ -0,0 +1,271 @@
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import URL, make_url
+
+from nhp_cancel import instrument_cancellation
+from nhp_metrics import DB_READS, TimedQueuePool, current_endpoint, instrument_engine
+
+load_dotenv()
+
+# ------------------ Config ------------------
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "port": os.getenv("DB_PORT"),
+    "dbname": os.getenv("DB_NAME"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+}
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))              # connections kept open per process
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))       # extra connections allowed under burst
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))     # seconds to wait for a free connection
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"    # test connections on checkout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))     # seconds before a connection is replaced
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))  # seconds for a new connection
+
+# statement_timeout (ms) per endpoint; 0 = no limit. DB_STATEMENT_TIMEOUT_MS is
+# the default, STATEMENT_TIMEOUTS="/stations/data=20000,/stations/export=0" overrides.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+STATEMENT_TIMEOUTS = {
+    "/master/filter": 5000,
+    "/master/nearby": 5000,
+    "/stations/latest": 10000,
+    "/stations/data": 20000,
+    "/stations/{station_id}/series": 20000,
+    "/stations/export": 0,
+}
+
+
+def _parse_map(spec: str, cast=str) -> Dict:
+    """'a=1,b=2' -> {'a': cast('1'), 'b': cast('2')}"""
+    out = {}
+    for item in spec.split(","):
+        if "=" in item:
+            key, value = item.rsplit("=", 1)
+            out[key.strip()] = cast(value.strip())
+    return out
+
+
+STATEMENT_TIMEOUTS.update(_parse_map(os.getenv("STATEMENT_TIMEOUTS", ""), int))
+
+# Read replicas: comma-separated SQLAlchemy URLs (postgresql+psycopg2://user:pw@host:port/db).
+DB_REPLICA_URLS = [u.strip() for u in os.getenv("DB_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "30"))              # seconds, for "replica" reads
+REPLICA_MAX_LAG_FRESH = float(os.getenv("REPLICA_MAX_LAG_FRESH", "5"))   # seconds, for "fresh" reads
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))  # seconds between lag checks
+
+# endpoint -> where its reads go: "replica" (lag <= REPLICA_MAX_LAG), "fresh"
+# (lag <= REPLICA_MAX_LAG_FRESH) or "primary". Unlisted endpoints use the primary;
+# READ_ROUTES="/stations/data=primary,..." overrides.
+READ_ROUTES = {
+    "/stations/data": "replica",
+    "/stations/export": "replica",
+    "/stations/batch": "replica",
+    "/stations/aggregate": "replica",
+    "/stations/{station_id}/series": "replica",
+    "/stations/latest": "fresh",
+}
+READ_ROUTES.update(_parse_map(os.getenv("READ_ROUTES", "")))
+
+
+def statement_timeout_for(endpoint: str) -> int:
+    return STATEMENT_TIMEOUTS.get(endpoint, DB_STATEMENT_TIMEOUT_MS)
+
+
+# ------------------ Engine ------------------
+def make_engine(url=None, pool_gauges: bool = True):
+    """
+    Pooled engine for the NHP database (the primary from DB_CONFIG unless `url`
+    is given). Sizes, timeouts, pre-ping and recycle come from the DB_POOL_*
+    settings; checkouts are timed for /metrics. Each checkout gets the
+    endpoint's statement_timeout and is cancelled if the client disconnects
+    (nhp_cancel).
+    """
+    if url is None:
+        url = URL.create(
+            "postgresql+psycopg2",
+            username=DB_CONFIG["user"],
+            password=DB_CONFIG["password"],
+            host=DB_CONFIG["host"],
+            port=int(DB_CONFIG["port"]) if DB_CONFIG["port"] else None,
+            database=DB_CONFIG["dbname"],
+        )
+    eng = create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_recycle=DB_POOL_RECYCLE,
+        connect_args={"connect_timeout": DB_CONNECT_TIMEOUT},
+    )
+    instrument_engine(eng, pool_gauges=pool_gauges)
+    instrument_cancellation(eng)
+
+    @event.listens_for(eng, "checkout")
+    def _apply_statement_timeout(dbapi_conn, record, proxy):
+        # SET only when the endpoint's timeout differs from what this connection
+        # already has, so most checkouts cost no extra round trip
+        wanted = statement_timeout_for(current_endpoint())
+        if record.info.get("statement_timeout") != wanted:
+            with dbapi_conn.cursor() as cur:
+                cur.execute("SET statement_timeout = %s", (wanted,))
+            dbapi_conn.commit()  # keep the SET past the pool's reset-on-return rollback
+            record.info["statement_timeout"] = wanted
+
+    return eng
+
+
+# Shared by nhp_api and meta_data_api (one pool per worker process)
+engine = make_engine()
+
+
+# ------------------ Replica routing ------------------
+class Replica:
+    def __init__(self, url: str):
+        self.url = make_url(url)
+        self.engine = make_engine(self.url, pool_gauges=False)
+        self.lag: Optional[float] = None  # seconds behind the primary; None = unknown / unreachable
+        self.error: Optional[str] = None
+        self.checked_at = 0.0
+
+    def check(self):
+        """Measure replay lag (0 when fully replayed or not a standby)."""
+        try:
+            with self.engine.connect() as conn:
+                self.lag = float(conn.execute(text("""
+                    SELECT CASE
+                        WHEN NOT pg_is_in_recovery() THEN 0
+                        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                    END
+                """)).scalar())
+            self.error = None
+        except Exception as e:
+            self.lag = None
+            self.error = str(e).splitlines()[0]
+        self.checked_at = time.time()
+
+
+class ReadRouter:
+    """
+    Picks the engine for a read-only query.
+
+    Each endpoint has a policy (READ_ROUTES). "replica" and "fresh" reads go to
+    the least-lagged replica whose lag is within REPLICA_MAX_LAG /
+    REPLICA_MAX_LAG_FRESH, and to the primary when none qualifies (or none is
+    configured). Lag is re-measured at most every check_interval seconds, by
+    whichever request finds it out of date; the others keep using the last
+    measurement meanwhile.
+    """
+
+    def __init__(self, primary, replica_urls: List[str], check_interval: float = REPLICA_CHECK_INTERVAL):
+        self.primary = primary
+        self.replicas = [Replica(u) for u in replica_urls]
+        self.check_interval = check_interval
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh_lag(self):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        # first check blocks everyone (nothing to route on yet); later ones only the caller
+        if not self._lock.acquire(blocking=self._checked_at == 0.0):
+            return
+        try:
+            if time.monotonic() - self._checked_at >= self.check_interval:
+                for replica in self.replicas:
+                    replica.check()
+                self._checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def engine_for(self, endpoint: Optional[str] = None):
+        endpoint = endpoint or current_endpoint()
+        policy = READ_ROUTES.get(endpoint, "primary")
+        if policy == "primary" or not self.replicas:
+            DB_READS.inc(endpoint, "primary")
+            return self.primary
+
+        self._refresh_lag()
+        max_lag = REPLICA_MAX_LAG_FRESH if policy == "fresh" else REPLICA_MAX_LAG
+        usable = [r for r in self.replicas if r.lag is not None and r.lag <= max_lag]
+        if not usable:
+            DB_READS.inc(endpoint, "primary")
+            return self.primary
+        best = min(r.lag for r in usable)
+        # replicas within a second of the best one share the load
+        replica = random.choice([r for r in usable if r.lag - best <= 1.0])
+        DB_READS.inc(endpoint, f"replica:{replica.url.host}:{replica.url.port}")
+        return replica.engine
+
+    def engines(self) -> list:
+        return [self.primary] + [r.engine for r in self.replicas]
+
+    def stats(self) -> List[Dict]:
+        return [
+            {
+                "host": r.url.host,
+                "port": r.url.port,
+                "database": r.url.database,
+                "lag_seconds": r.lag,
+                "error": r.error,
+                "checked_at": r.checked_at,
+                **pool_stats(r.engine),
+            }
+            for r in self.replicas
+        ]
+
+
+router = ReadRouter(engine, DB_REPLICA_URLS)
+
+
+def read_engine(endpoint: Optional[str] = None):
+    """Engine for read-only queries of `endpoint` (default: the request being served)."""
+    return router.engine_for(endpoint)
+
+
+def all_engines() -> list:
+    """The primary followed by every replica engine."""
+    return router.engines()
+
+
+def warm_pool(eng=None, connections: int = DB_POOL_SIZE, setup=None):
+    """
+    Open `connections` pooled connections up front (on every engine by default)
+    so first requests skip the connect; `setup(conn)` runs on each of them,
+    e.g. to prepare statements.
+    """
+    engines = [eng] if eng is not None else all_engines()
+    conns = []
+    try:
+        for e in engines:
+            for _ in range(connections):
+                conns.append(e.connect())
+                if setup is not None:
+                    setup(conns[-1])
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def pool_stats(eng=None) -> Dict:
+    pool = (eng or engine).pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout": DB_POOL_TIMEOUT,
+        "pre_ping": DB_POOL_PRE_PING,
+        "recycle": DB_POOL_RECYCLE,
+        "statement_timeouts": {"default": DB_STATEMENT_TIMEOUT_MS, **STATEMENT_TIMEOUTS},
+    }
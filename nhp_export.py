@@ -0,0 +1,128 @@
+import json
+import queue
+import threading
+from typing import Callable, Dict, Iterator
+
+# ------------------ Config ------------------
+COPY_CHUNK_BYTES = 64 * 1024   # bytes gathered from COPY before handing them to the response
+COPY_QUEUE_CHUNKS = 16         # chunks buffered between the COPY thread and the response
+FETCH_ROWS = 5000              # rows per round trip on the server-side cursor
+
+_DONE = object()
+
+
+# ------------------ Helpers ------------------
+def dbapi_connection(raw):
+    """Underlying psycopg2 connection of a pooled SQLAlchemy connection."""
+    return getattr(raw, "dbapi_connection", None) or raw.connection
+
+
+def render_sql(engine, cur, stmt, params: Dict) -> str:
+    """
+    Render a text() statement with its bound params inlined (psycopg2 mogrify).
+    COPY does not accept bind parameters, so the SELECT is rendered first.
+    """
+    sql = str(stmt.compile(dialect=engine.dialect))
+    return cur.mogrify(sql, params).decode("utf-8")
+
+
+class _QueueWriter:
+    """File-like sink for copy_expert(); batches rows and blocks when the queue is full."""
+
+    def __init__(self, q: queue.Queue, cancelled: threading.Event):
+        self.q = q
+        self.cancelled = cancelled
+        self.buf = bytearray()
+
+    def write(self, data):
+        if self.cancelled.is_set():
+            raise RuntimeError("export cancelled")
+        self.buf += data if isinstance(data, (bytes, bytearray)) else data.encode("utf-8")
+        if len(self.buf) >= COPY_CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            _put(self.q, bytes(self.buf), self.cancelled)
+            self.buf = bytearray()
+
+
+def _put(q: queue.Queue, item, cancelled: threading.Event):
+    while not cancelled.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+# ------------------ Streams ------------------
+def stream_copy(engine, stmt, params: Dict, options: str = "FORMAT csv, HEADER true") -> Iterator[bytes]:
+    """
+    Stream `COPY (stmt) TO STDOUT` in chunks.
+
+    COPY runs on a pooled connection in a worker thread and feeds a bounded
+    queue, so memory stays at about COPY_QUEUE_CHUNKS x COPY_CHUNK_BYTES no matter
+    how many rows are exported. If the consumer stops early (client went away)
+    the backend COPY is cancelled and the connection goes back to the pool.
+    """
+    q: queue.Queue = queue.Queue(maxsize=COPY_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    raw = engine.raw_connection()
+
+    def run():
+        writer = _QueueWriter(q, cancelled)
+        try:
+            with raw.cursor() as cur:
+                select_sql = render_sql(engine, cur, stmt, params)
+                cur.copy_expert(f"COPY ({select_sql}) TO STDOUT WITH ({options})", writer)
+            writer.flush()
+            _put(q, _DONE, cancelled)
+        except Exception as e:
+            _put(q, e, cancelled)
+
+    worker = threading.Thread(target=run, name="nhp-export-copy", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if worker.is_alive():
+            cancelled.set()
+            dbapi_connection(raw).cancel()
+            worker.join()
+        try:
+            raw.rollback()
+        finally:
+            raw.close()
+
+
+def stream_rows(engine, stmt, params: Dict, encode: Callable[[dict], bytes]) -> Iterator[bytes]:
+    """
+    Stream rows from a server-side (named) cursor, FETCH_ROWS at a time, each
+    row passed through `encode`. Closing the generator closes the cursor.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=FETCH_ROWS).execute(stmt, params)
+        for rows in result.mappings().partitions(FETCH_ROWS):
+            yield b"".join(encode(dict(r)) for r in rows)
+
+
+def stream_frames(engine, stmt, params: Dict):
+    """Like stream_rows(), but yields one DataFrame per FETCH_ROWS partition."""
+    import pandas as pd
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=FETCH_ROWS).execute(stmt, params)
+        columns = list(result.keys())
+        for rows in result.partitions(FETCH_ROWS):
+            yield pd.DataFrame(rows, columns=columns)
+
+
+def ndjson_line(record: dict) -> bytes:
+    return json.dumps(record, default=str).encode("utf-8") + b"\n"
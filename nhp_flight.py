@@ -0,0 +1,135 @@
+import copy
+import os
+import threading
+from typing import Callable, Dict, Hashable, Optional
+
+from nhp_cancel import ClientDisconnected, current_request, is_query_canceled
+from nhp_metrics import Counter, Gauge, register
+
+# ------------------ Config ------------------
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") == "1"   # share in-flight queries between identical requests
+COALESCE_WAIT = float(os.getenv("COALESCE_WAIT", "120"))         # seconds a follower waits before running its own
+
+COALESCED = register(Counter(
+    "nhp_coalesced_requests_total",
+    "Requests that ran their query (leader), shared one already in flight (follower) or gave up waiting (timeout)",
+    ["endpoint", "role"],
+))
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "abandoned", "followers", "owner")
+
+    def __init__(self):
+        self.owner = current_request()  # the leader's request (nhp_cancel)
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False  # failed because the leader's own client left
+        self.followers = 0
+
+
+def _shared_error(error: BaseException) -> BaseException:
+    """A copy of the leader's exception for a follower to raise (one instance must not be raised in two threads)."""
+    try:
+        fresh = copy.copy(error)
+    except Exception:
+        fresh = None
+    if fresh is None or fresh is error:
+        fresh = RuntimeError(f"coalesced request failed: {error!r}")
+    return fresh
+
+
+# ------------------ Single flight ------------------
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests within one worker process.
+
+    do(endpoint, key, fn): the first caller for a key (the leader) runs fn();
+    callers arriving with the same key while it runs (followers) wait for it
+    and get the same result, or a copy of its exception chained to it. A
+    leader whose client disconnects is not cancelled once it has followers;
+    if it was cancelled before they joined, one of them runs fn() again as
+    the new leader. Nothing is kept once the
+    leader finishes -- later requests run again (or hit the response cache).
+    Keys must cover everything the result depends on, e.g. the ETag, which
+    already includes the normalized parameters and the per-station reading digest.
+    """
+
+    def __init__(self, enabled: bool = COALESCE_REQUESTS, wait: float = COALESCE_WAIT):
+        self.enabled = enabled
+        self.wait = wait
+        self._calls: Dict[tuple, _Call] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}  # endpoint -> role -> requests
+        self._lock = threading.Lock()
+        register(Gauge("nhp_coalesce_in_flight", "Distinct queries currently in flight", lambda: len(self._calls)))
+        register(Gauge("nhp_coalesce_ratio", "Share of coalescable requests served by another request's query",
+                       self.ratio))
+
+    def _count(self, endpoint: str, role: str):
+        COALESCED.inc(endpoint, role)
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, {"leader": 0, "follower": 0, "timeout": 0})
+            counts[role] += 1
+
+    def do(self, endpoint: str, key: Hashable, fn: Callable):
+        if not self.enabled:
+            return fn()
+        flight = (endpoint, key)
+        while True:
+            with self._lock:
+                call = self._calls.get(flight)
+                leader = call is None
+                if leader:
+                    call = self._calls[flight] = _Call()
+                else:
+                    call.followers += 1
+                    if call.owner is not None:
+                        call.owner.shared = True  # others wait on it: keep it running if its client leaves
+            if leader:
+                break
+            if not call.done.wait(self.wait):
+                # the leader is stuck; do not hold this request any longer
+                self._count(endpoint, "timeout")
+                return fn()
+            if call.abandoned:
+                continue  # its client left before we joined: the first follower back leads a new run
+            self._count(endpoint, "follower")
+            if call.error is not None:
+                raise _shared_error(call.error) from call.error
+            return call.result
+
+        self._count(endpoint, "leader")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            owner = call.owner
+            call.abandoned = isinstance(e, ClientDisconnected) or (
+                owner is not None and owner.disconnected and is_query_canceled(e))
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(flight, None)
+            call.done.set()
+
+    def ratio(self, endpoint: Optional[str] = None) -> float:
+        """followers / all coalescable requests, for one endpoint or all of them."""
+        with self._lock:
+            counts = [c for e, c in self._counts.items() if endpoint is None or e == endpoint]
+        total = sum(sum(c.values()) for c in counts)
+        return sum(c["follower"] for c in counts) / total if total else 0.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = {e: dict(c) for e, c in self._counts.items()}
+            in_flight = [
+                {"endpoint": e, "followers": call.followers} for (e, _), call in self._calls.items()
+            ]
+        return {
+            "enabled": self.enabled,
+            "endpoints": {e: {**c, "ratio": self.ratio(e)} for e, c in counts.items()},
+            "ratio": self.ratio(),
+            "in_flight": in_flight,
+        }
@@ -0,0 +1,178 @@
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# numpy / pandas / pyarrow are imported on first use, so importing the API stays
+# cheap; the startup warm-up (nhp_api) loads them before traffic arrives
+pa = None  # pyarrow, set by arrow_available()
+pq = None
+_arrow_checked = False
+
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_TYPE = "application/vnd.apache.parquet"
+
+# ------------------ Field layout ------------------
+MASTER_FIELDS = ["station_id", "longitude", "latitude", "zone", "name", "type", "location", "district"]
+
+
+def safe_key(field: str) -> str:
+    """Output key for an ingest column ('At.pressure' -> 'At_pressure')."""
+    return field.replace(" ", "_").replace(".", "_")
+
+
+# ------------------ Columnar ------------------
+def to_columnar(df: "pd.DataFrame", base_fields: List[str], aws_fields: List[str]) -> List[Dict]:
+    """
+    Group a /stations/data frame by station.
+
+    Each station carries its master metadata once plus a "readings" object of
+    parallel arrays (one per field, same order as the input rows). AWS stations
+    also get the AWS extra fields. Grouping uses a stable argsort and boundary
+    detection on the station_id column instead of building a dict per row.
+    """
+    if df.empty:
+        return []
+
+    import numpy as np
+
+    station_ids = df["station_id"].to_numpy()
+    order = np.argsort(station_ids, kind="stable")
+    sorted_ids = station_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    ends = np.r_[starts[1:], len(sorted_ids)]
+
+    fields = base_fields + aws_fields
+    columns = {f: df[f].to_numpy()[order] for f in fields if f in df.columns}
+    meta = {f: df[f].to_numpy()[order] for f in MASTER_FIELDS if f in df.columns}
+
+    stations = []
+    for start, end in zip(starts, ends):
+        station = {f: values[start] for f, values in meta.items()}
+        stype = (station.get("type") or "").strip().lower()
+        wanted = fields if stype == "aws" else base_fields
+        station["count"] = int(end - start)
+        station["readings"] = {
+            safe_key(f): columns[f][start:end].tolist()
+            for f in wanted if f in columns
+        }
+        stations.append(station)
+    return stations
+
+
+# ------------------ Arrow / Parquet ------------------
+FLOAT_MASTER_FIELDS = {"longitude", "latitude"}
+STRING_INGEST_FIELDS = {"MobileNumber"}
+
+
+def arrow_available() -> bool:
+    """Import pyarrow on first call; False when it is not installed (optional dependency)."""
+    global pa, pq, _arrow_checked
+    if not _arrow_checked:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            pa, pq = pyarrow, pyarrow.parquet
+        except ImportError:
+            pass
+        _arrow_checked = True
+    return pa is not None
+
+
+def arrow_schema(base_fields: List[str], aws_fields: List[str], master_fields: List[str] = MASTER_FIELDS):
+    """
+    Typed schema for station rows: master text fields, float coordinates,
+    DateTime as timestamp and sensor readings as float64 (stored as TEXT in the DB).
+    """
+    arrow_available()
+    fields = [
+        pa.field(f, pa.float64() if f in FLOAT_MASTER_FIELDS else pa.string())
+        for f in master_fields
+    ]
+    for f in base_fields + aws_fields:
+        if f == "DateTime":
+            ftype = pa.timestamp("us")
+        elif f in STRING_INGEST_FIELDS:
+            ftype = pa.string()
+        else:
+            ftype = pa.float64()
+        fields.append(pa.field(safe_key(f), ftype))
+    return pa.schema(fields)
+
+
+def _source_column(df: "pd.DataFrame", name: str):
+    # schema names use safe keys; the frame still has the DB column names
+    import pandas as pd
+
+    for col in df.columns:
+        if col == name or safe_key(col) == name:
+            return df[col]
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def frame_to_batch(df: "pd.DataFrame", schema):
+    """Convert a station-row frame to a RecordBatch, coercing unparseable values to null."""
+    import numpy as np
+    import pandas as pd
+
+    arrays = []
+    for field in schema:
+        col = _source_column(df, field.name)
+        if pa.types.is_floating(field.type):
+            arrays.append(pa.array(pd.to_numeric(col, errors="coerce"), type=field.type, from_pandas=True))
+        elif pa.types.is_timestamp(field.type):
+            arrays.append(pa.array(pd.to_datetime(col, errors="coerce"), type=field.type, from_pandas=True))
+        else:
+            values = [None if v is None or (isinstance(v, float) and np.isnan(v)) else str(v) for v in col]
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ByteSink:
+    """Write-only file object whose contents are drained after every batch."""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self.buf += data
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = bytes(self.buf)
+        self.buf.clear()
+        return out
+
+
+def arrow_stream(frames: Iterable["pd.DataFrame"], schema) -> Iterator[bytes]:
+    """Arrow IPC stream: schema message, then one record batch per frame."""
+    arrow_available()
+    sink = _ByteSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for df in frames:
+            writer.write_batch(frame_to_batch(df, schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def parquet_stream(frames: Iterable["pd.DataFrame"], schema) -> Iterator[bytes]:
+    """Parquet file written incrementally: one row group per frame, footer at the end."""
+    arrow_available()
+    sink = _ByteSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for df in frames:
+            writer.write_table(pa.Table.from_batches([frame_to_batch(df, schema)], schema=schema))
+            yield sink.drain()
+    yield sink.drain()
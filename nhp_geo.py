@@ -0,0 +1,221 @@
+import heapq
+import math
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+# ------------------ Config ------------------
+GEO_CELL_DEG = float(os.getenv("GEO_CELL_DEG", "0.25"))   # grid cell size in degrees (~28 km of latitude)
+# "memory": in-process grid over the master table (default)
+# "postgis": spatial predicates run in Postgres when the postgis extension is installed
+GEO_BACKEND = os.getenv("GEO_BACKEND", "memory")
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180
+
+
+class GeoFilter(NamedTuple):
+    """Spatial station filter: a lon/lat bounding box and/or a radius around a point (both must match)."""
+    bbox: Optional[Tuple[float, float, float, float]] = None  # min_lon, min_lat, max_lon, max_lat
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    radius_km: Optional[float] = None
+
+
+def parse_bbox(spec: str) -> Tuple[float, float, float, float]:
+    """'min_lon,min_lat,max_lon,max_lat' -> tuple of floats; ValueError if malformed."""
+    parts = [float(p) for p in spec.split(",")]
+    if len(parts) != 4:
+        raise ValueError("bbox needs 4 numbers: min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat within -180..180 / -90..90")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _coord(value) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+# ------------------ Grid index ------------------
+class GeoGrid:
+    """
+    Uniform lat/lon grid over the master rows (indexes into `rows`).
+
+    Box and radius queries only look at the cells the query area overlaps;
+    k-nearest searches rings of cells outwards from the query point and stops
+    once no unvisited cell can hold a closer station. Rows without usable
+    coordinates are left out. Distances are great-circle (haversine) km.
+    """
+
+    def __init__(self, rows: List[Dict], cell_deg: float = GEO_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.points: Dict[int, Tuple[float, float]] = {}
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, r in enumerate(rows):
+            lat, lon = _coord(r.get("latitude")), _coord(r.get("longitude"))
+            if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                continue
+            self.points[i] = (lat, lon)
+            self.cells.setdefault(self._cell(lat, lon), []).append(i)
+        if self.cells:
+            self._rows = (min(c[0] for c in self.cells), max(c[0] for c in self.cells))
+            self._cols = (min(c[1] for c in self.cells), max(c[1] for c in self.cells))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _cells_in(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> Iterable[int]:
+        r0, c0 = self._cell(min_lat, min_lon)
+        r1, c1 = self._cell(max_lat, max_lon)
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self.cells):
+            # box larger than the occupied grid: walk the occupied cells instead
+            for (r, c), members in self.cells.items():
+                if r0 <= r <= r1 and c0 <= c <= c1:
+                    yield from members
+            return
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                yield from self.cells.get((r, c), ())
+
+    # ---- queries ----
+    def in_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> List[int]:
+        out = []
+        for i in self._cells_in(min_lon, min_lat, max_lon, max_lat):
+            lat, lon = self.points[i]
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                out.append(i)
+        return sorted(out)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, int]]:
+        """(distance_km, row) for rows within radius_km, nearest first."""
+        dlat = radius_km / KM_PER_DEG
+        coslat = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+        dlon = min(180.0, radius_km / (KM_PER_DEG * max(coslat, 1e-6)))
+        out = []
+        for i in self._cells_in(lon - dlon, lat - dlat, lon + dlon, lat + dlat):
+            d = haversine_km(lat, lon, *self.points[i])
+            if d <= radius_km:
+                out.append((d, i))
+        return sorted(out)
+
+    def nearest(self, lat: float, lon: float, k: int, max_km: Optional[float] = None,
+                allowed: Optional[Set[int]] = None) -> List[Tuple[float, int]]:
+        """(distance_km, row) of the k rows closest to lat/lon (only `allowed` rows, if given), nearest first."""
+        if not self.cells or k <= 0:
+            return []
+        r0, c0 = self._cell(lat, lon)
+        # furthest ring that still reaches an occupied cell
+        max_ring = max(abs(r0 - self._rows[0]), abs(r0 - self._rows[1]),
+                       abs(c0 - self._cols[0]), abs(c0 - self._cols[1]))
+        best: List[Tuple[float, int]] = []  # max-heap of the k best as (-distance, row)
+        for ring in range(max_ring + 1):
+            for r in range(r0 - ring, r0 + ring + 1):
+                edge = r in (r0 - ring, r0 + ring)
+                for c in (range(c0 - ring, c0 + ring + 1) if edge else (c0 - ring, c0 + ring)):
+                    for i in self.cells.get((r, c), ()):
+                        if allowed is not None and i not in allowed:
+                            continue
+                        d = haversine_km(lat, lon, *self.points[i])
+                        if max_km is not None and d > max_km:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-d, i))
+                        elif d < -best[0][0]:
+                            heapq.heapreplace(best, (-d, i))
+            # anything in a further ring is at least `ring` whole cells away on one axis
+            bound_deg = ring * self.cell_deg
+            coslat = math.cos(math.radians(min(89.9, abs(lat) + bound_deg + self.cell_deg)))
+            bound_km = bound_deg * KM_PER_DEG * min(1.0, coslat)
+            if max_km is not None and bound_km > max_km:
+                break
+            if len(best) == k and bound_km >= -best[0][0]:
+                break
+        return sorted((-d, i) for d, i in best)
+
+    def match(self, geo: GeoFilter) -> List[int]:
+        """Rows matching every part of `geo`, in row order."""
+        idx: Optional[Set[int]] = None
+        if geo.bbox is not None:
+            idx = set(self.in_bbox(*geo.bbox))
+        if geo.radius_km is not None:
+            near = {i for _, i in self.within(geo.lat, geo.lon, geo.radius_km)}
+            idx = near if idx is None else idx & near
+        return sorted(idx) if idx is not None else sorted(self.points)
+
+
+# ------------------ PostGIS pushdown ------------------
+# Expects the expression index below on the master table, so ST_DWithin / <-> use it:
+#   CREATE INDEX nhp_v2_geog_idx ON nhp_v2
+#   USING gist ((ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography));
+_GEOG = "(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography)"
+_POINT = "(ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)::geography)"
+_postgis: Dict[str, bool] = {}
+
+
+def postgis_available(engine) -> bool:
+    """True if the postgis extension is installed in the engine's database (checked once per engine)."""
+    key = str(engine.url)
+    if key not in _postgis:
+        try:
+            with engine.connect() as conn:
+                _postgis[key] = bool(conn.execute(
+                    text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+                ).scalar())
+        except Exception:
+            return False
+    return _postgis[key]
+
+
+def use_postgis(engine) -> bool:
+    return GEO_BACKEND == "postgis" and postgis_available(engine)
+
+
+def postgis_match(engine, table: str, geo: GeoFilter) -> List[str]:
+    """Station IDs in `table` matching `geo`, evaluated in Postgres."""
+    conditions, params = [], {}
+    if geo.bbox is not None:
+        conditions.append(f"{_GEOG} && ST_MakeEnvelope(:min_lon, :min_lat, :max_lon, :max_lat, 4326)::geography")
+        params.update(zip(("min_lon", "min_lat", "max_lon", "max_lat"), geo.bbox))
+    if geo.radius_km is not None:
+        conditions.append(f"ST_DWithin({_GEOG}, {_POINT}, :radius_m)")
+        params.update(lat=geo.lat, lon=geo.lon, radius_m=geo.radius_km * 1000)
+    where = " AND ".join(conditions) or "latitude IS NOT NULL AND longitude IS NOT NULL"
+    with engine.connect() as conn:
+        return [r[0] for r in conn.execute(text(f"SELECT id FROM {table} WHERE {where} ORDER BY id"), params)]
+
+
+def postgis_nearest(engine, table: str, lat: float, lon: float, k: int, max_km: Optional[float] = None,
+                    ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+    """(station id, distance_km) of the k stations nearest to lat/lon, evaluated in Postgres (KNN <->)."""
+    conditions = ["latitude IS NOT NULL", "longitude IS NOT NULL"]
+    params = {"lat": lat, "lon": lon, "k": k}
+    if max_km is not None:
+        conditions.append(f"ST_DWithin({_GEOG}, {_POINT}, :radius_m)")
+        params["radius_m"] = max_km * 1000
+    if ids is not None:
+        conditions.append("id = ANY(:ids)")
+        params["ids"] = ids
+    query = text(f"""
+        SELECT id, ST_Distance({_GEOG}, {_POINT}) / 1000 AS distance_km
+        FROM {table}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {_GEOG} <-> {_POINT}
+        LIMIT :k
+    """)
+    with engine.connect() as conn:
+        return [(r[0], float(r[1])) for r in conn.execute(query, params)]
@@ -0,0 +1,140 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+# ------------------ Config ------------------
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "5"))      # tokens refilled per second
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))   # bucket size
+RATE_LIMIT_KEY = os.getenv("RATE_LIMIT_KEY", "ip")              # "ip" or "user"
+
+HEAVY_MAX_CONCURRENT = int(os.getenv("HEAVY_MAX_CONCURRENT", "4"))  # heavy queries running at once
+HEAVY_MAX_QUEUE = int(os.getenv("HEAVY_MAX_QUEUE", "8"))            # requests allowed to wait for a slot
+HEAVY_MAX_WAIT = float(os.getenv("HEAVY_MAX_WAIT", "10"))           # seconds a request may wait
+
+
+class Overloaded(Exception):
+    """Raised when a request is refused; retry_after is a hint in seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+# ------------------ Token buckets ------------------
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Take one token; returns 0 if allowed, else seconds until a token is available."""
+        # `now` may predate a bucket created after it was read: never refill backwards
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Per-key token buckets (key = client IP or credential).
+    Keeps at most max_keys buckets, dropping the least recently seen ones.
+    Limits are per worker process.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT_RATE, burst: float = RATE_LIMIT_BURST, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: str):
+        """Consume a token for `key` or raise Overloaded."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take(now)
+        if wait > 0:
+            raise Overloaded(wait)
+
+
+# ------------------ Admission control ------------------
+class AdmissionGate:
+    """
+    Concurrency cap with a bounded wait queue for expensive endpoints.
+
+    At most max_concurrent holders; up to max_queue more may wait up to
+    max_wait seconds. Anything beyond that is refused at once with Overloaded,
+    so excess load is shed before it reaches the connection pool.
+    """
+
+    def __init__(self, max_concurrent: int = HEAVY_MAX_CONCURRENT, max_queue: int = HEAVY_MAX_QUEUE,
+                 max_wait: float = HEAVY_MAX_WAIT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._avg_hold = 1.0  # moving average of slot hold time, for Retry-After hints
+        self._cond = threading.Condition()
+
+    def _retry_after(self) -> float:
+        return self._avg_hold * (1 + self.waiting / max(1, self.max_concurrent))
+
+    def acquire(self) -> float:
+        """Wait for a slot; returns the acquisition time. Raises Overloaded if refused."""
+        with self._cond:
+            if self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise Overloaded(self._retry_after())
+                self.waiting += 1
+                try:
+                    deadline = time.monotonic() + self.max_wait
+                    while self.active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            raise Overloaded(self._retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            return time.monotonic()
+
+    def release(self, acquired_at: Optional[float] = None):
+        with self._cond:
+            self.active -= 1
+            if acquired_at is not None:
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - acquired_at)
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        acquired_at = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from nhp_geo import GeoFilter, GeoGrid, postgis_match, postgis_nearest, use_postgis
+from nhp_shm import SharedTable
+
+# ------------------ Config ------------------
+MASTER_TABLE = "nhp_v2"
+MASTER_COLUMNS = ["gid", "id", "district", "name", "location", "zone", "latitude", "longitude", "type"]
+MASTER_INDEX_TTL = int(os.getenv("MASTER_INDEX_TTL", "300"))  # seconds between automatic reloads
+
+# API filter name -> master column it matches against
+FILTER_FIELDS = {
+    "district": "district",
+    "location": "location",
+    "zone": "zone",
+    "station_type": "type",
+}
+
+
+# ------------------ Helper: normalization ------------------
+def normalize(value) -> str:
+    """
+    Normalize a value for fuzzy matching.
+    Lowercases, trims and removes common punctuation ('-', '(', ')', ',').
+    Applied to both the query value and the master column so they compare alike.
+    """
+    value = str(value or "").strip().lower()
+    for ch in ['-', '(', ')', ',']:
+        value = value.replace(ch, '')
+    return value
+
+
+# ------------------ Loading ------------------
+def query_master_rows(engine) -> List[Dict]:
+    query = text(f"""
+        SELECT {', '.join(MASTER_COLUMNS)}
+        FROM {MASTER_TABLE}
+        ORDER BY id;
+    """)
+    with engine.connect() as conn:
+        return [dict(r) for r in conn.execute(query).mappings()]
+
+
+def master_digest(rows: List[Dict]) -> str:
+    return hashlib.sha1(json.dumps(rows, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# ------------------ Master Index ------------------
+class MasterIndex:
+    """
+    In-process, normalized copy of the master station table.
+
+    District/zone/location/type filters are resolved here to a list of station
+    IDs so the ingest table can be queried with "StationID" = ANY(:ids) instead
+    of a leading-wildcard ILIKE inside the join.
+    The table is reloaded when older than `ttl` seconds or on refresh().
+    Station coordinates are kept in a GeoGrid for bbox / radius / nearest
+    queries (pushed down to PostGIS instead with GEO_BACKEND=postgis).
+
+    With a `shared` table (multi-worker serving) the rows come from the copy a
+    MasterPublisher keeps in shared memory instead of a query per worker; the
+    index falls back to its own reloads if that copy is missing or stops being
+    republished.
+    """
+
+    def __init__(self, engine, ttl: int = MASTER_INDEX_TTL, shared: Optional[SharedTable] = None):
+        self.engine = engine
+        self.ttl = ttl
+        self.shared = shared
+        self._published_at = 0.0
+        self._lock = threading.Lock()
+        # (rows, rows by id, normalized filter columns, geo grid) swapped as one tuple
+        self._state = ([], {}, {}, GeoGrid([]))
+        self.loaded_at = 0.0
+        self.version = 0
+        self.digest = ""  # content hash, identical in every worker for the same table
+
+    def refresh(self):
+        """Reload the master table from the database and swap it in (publishing it to the shared table, if any)."""
+        rows = query_master_rows(self.engine)
+        digest = master_digest(rows)
+        if self.shared is not None:
+            self.shared.publish(rows, digest)
+        self._load(rows, digest)
+
+    def _load(self, rows: List[Dict], digest: Optional[str] = None):
+        norm = {col: [normalize(r.get(col)) for r in rows] for col in set(FILTER_FIELDS.values())}
+        grid = GeoGrid(rows)
+        digest = digest or master_digest(rows)
+        with self._lock:
+            self._state = (rows, {r["id"]: r for r in rows}, norm, grid)
+            self.digest = digest
+            self.loaded_at = time.time()
+            self.version += 1
+
+    def _sync_shared(self) -> bool:
+        """
+        Pick up a newly published shared table. Returns False when there is none
+        or it has not been republished for 3 x ttl (publisher not running).
+        """
+        if self.shared.changed():
+            snap = self.shared.load()
+            if snap is not None:
+                self._load(snap.rows, snap.digest)
+                self._published_at = snap.published_at
+        return bool(self._state[0]) and time.time() - self._published_at < 3 * self.ttl
+
+    def ensure_fresh(self):
+        """Reload if the index is empty or older than ttl. Keeps serving stale data if a reload fails."""
+        if self.shared is not None and self._sync_shared():
+            return
+        if self._state[0] and time.time() - self.loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._state[0] and time.time() - self.loaded_at < self.ttl:
+                return
+            stale = bool(self._state[0])
+        try:
+            self.refresh()
+        except Exception:
+            if not stale:
+                raise
+            # retry on the next ttl window instead of on every request
+            self.loaded_at = time.time()
+
+    @staticmethod
+    def _match(state, filters: Dict[str, Optional[str]]) -> Optional[List[int]]:
+        needles = {
+            FILTER_FIELDS[k]: normalize(v)
+            for k, v in filters.items()
+            if v and k in FILTER_FIELDS
+        }
+        if not needles:
+            return None
+        rows, _, norm, _ = state
+        return [
+            i for i in range(len(rows))
+            if all(needle in norm[col][i] for col, needle in needles.items())
+        ]
+
+    def _geo_match(self, state, geo: Optional[GeoFilter]) -> Optional[List[int]]:
+        if geo is None or (geo.bbox is None and geo.radius_km is None):
+            return None
+        rows, _, _, grid = state
+        if use_postgis(self.engine):
+            ids = set(postgis_match(self.engine, MASTER_TABLE, geo))
+            return [i for i, r in enumerate(rows) if r["id"] in ids]
+        return grid.match(geo)
+
+    def _select(self, state, geo: Optional[GeoFilter], filters) -> Optional[List[int]]:
+        idx = self._match(state, filters)
+        geo_idx = self._geo_match(state, geo)
+        if geo_idx is None:
+            return idx
+        if idx is None:
+            return geo_idx
+        keep = set(geo_idx)
+        return [i for i in idx if i in keep]
+
+    def resolve(self, geo: Optional[GeoFilter] = None, **filters) -> Optional[List[str]]:
+        """
+        Resolve fuzzy meta filters (district, location, zone, station_type) and
+        an optional spatial filter to station IDs.
+        Returns None when no filter is given (i.e. all stations), else a possibly empty list.
+        """
+        self.ensure_fresh()
+        state = self._state
+        rows = state[0]
+        idx = self._select(state, geo, filters)
+        if idx is None:
+            return None
+        return [rows[i]["id"] for i in idx]
+
+    def filter(self, geo: Optional[GeoFilter] = None, **filters) -> List[Dict]:
+        """Return master rows matching the fuzzy meta filters (and spatial filter), ordered by id."""
+        self.ensure_fresh()
+        state = self._state
+        rows = state[0]
+        idx = self._select(state, geo, filters)
+        if idx is None:
+            return list(rows)
+        return [rows[i] for i in idx]
+
+    def nearest(self, lat: float, lon: float, k: int, max_km: Optional[float] = None,
+                **filters) -> List[Tuple[Dict, float]]:
+        """(master row, distance_km) of the k stations nearest to lat/lon that match the meta filters."""
+        self.ensure_fresh()
+        state = self._state
+        rows, by_id, _, grid = state
+        idx = self._match(state, filters)
+        if use_postgis(self.engine):
+            ids = [rows[i]["id"] for i in idx] if idx is not None else None
+            found = postgis_nearest(self.engine, MASTER_TABLE, lat, lon, k, max_km, ids)
+            return [(by_id[sid], d) for sid, d in found if sid in by_id]
+        allowed = set(idx) if idx is not None else None
+        return [(rows[i], d) for d, i in grid.nearest(lat, lon, k, max_km, allowed)]
+
+    def get(self, station_id: str) -> Optional[Dict]:
+        self.ensure_fresh()
+        return self._state[1].get(station_id)
+
+
+# ------------------ Shared-memory publisher ------------------
+class MasterPublisher:
+    """
+    Loads the master table once per ttl and publishes it to a SharedTable for
+    every worker on the host. Runs as a daemon thread in the process that
+    forks the workers (the gunicorn arbiter), so the table is queried once per
+    host rather than once per worker. It republishes every ttl even when the
+    table is unchanged; workers treat a copy older than 3 x ttl as abandoned.
+    """
+
+    def __init__(self, engine, shared: SharedTable, ttl: int = MASTER_INDEX_TTL):
+        self.engine = engine
+        self.shared = shared
+        self.ttl = ttl
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish_once(self) -> int:
+        rows = query_master_rows(self.engine)
+        return self.shared.publish(rows, master_digest(rows))
+
+    def _run(self):
+        while not self._stop.wait(self.ttl):
+            try:
+                self.publish_once()
+            except Exception:
+                pass  # workers keep the last table, or fall back to their own reloads
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="nhp-master-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,231 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# ------------------ Registry ------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 20000, 100000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence, le=None) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, data):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, bound)} {cumulative}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, '+Inf')} {data[-1]}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {data[-2]}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {data[-1]}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose samples are read from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, collect: Callable[[], float]):
+        self.name, self.help, self.collect = name, help, collect
+
+    def render(self) -> List[str]:
+        try:
+            value = float(self.collect())
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+REGISTRY: list = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ------------------ Metrics ------------------
+REQUESTS = register(Counter("nhp_http_requests_total", "HTTP requests handled", ["endpoint", "method", "status"]))
+LATENCY = register(Histogram("nhp_http_request_duration_seconds", "Time from request to last body byte", ["endpoint"]))
+RESPONSE_BYTES = register(Histogram("nhp_http_response_bytes", "Response body size", ["endpoint"], SIZE_BUCKETS))
+DB_TIME = register(Histogram("nhp_db_execute_seconds", "SQL execution time per statement (cursor execute), ok or error",
+                             ["endpoint", "outcome"]))
+DB_ROWS = register(Histogram("nhp_db_rows_returned", "Rows returned per statement", ["endpoint"], ROW_BUCKETS))
+STAGE_TIME = register(Histogram("nhp_stage_duration_seconds", "Time per request stage (fetch, shape, serialize)", ["endpoint", "stage"]))
+POOL_WAIT = register(Histogram("nhp_db_pool_wait_seconds", "Time to check a connection out of the pool", ["endpoint"]))
+POOL_CHECKOUTS = register(Counter("nhp_db_pool_checkouts_total", "Connections checked out of the pool", ["endpoint"]))
+DB_READS = register(Counter("nhp_db_reads_total", "Read connections routed to the primary or a replica", ["endpoint", "target"]))
+
+# the ASGI scope of the request being served and its root_path on arrival;
+# routing fills in scope["route"], and each Mount appends its path to root_path
+_scope: contextvars.ContextVar = contextvars.ContextVar("nhp_metrics_scope", default=None)
+
+
+def current_endpoint() -> str:
+    current = _scope.get()
+    if current is None:
+        return "none"
+    scope, root_path = current
+    path = getattr(scope.get("route"), "path", None)
+    if not path:
+        return "unmatched"
+    # a mounted app's route paths are relative to the mount: prefix them, so
+    # /meta/master/filter and the app's own /master/filter stay apart
+    return scope.get("root_path", "")[len(root_path):] + path
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block of the current request as `name` (e.g. "shape", "serialize")."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_TIME.observe(time.perf_counter() - t0, current_endpoint(), name)
+
+
+# ------------------ Middleware ------------------
+class MetricsMiddleware:
+    """Pure ASGI middleware: request count, latency (to the last body byte) and response size."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _scope.set((scope, scope.get("root_path", "")))
+        t0 = time.perf_counter()
+        state = {"status": 500, "bytes": 0, "done": False}
+
+        def record():
+            if state["done"]:
+                return
+            state["done"] = True
+            endpoint = current_endpoint()
+            REQUESTS.inc(endpoint, scope["method"], str(state["status"]))
+            LATENCY.observe(time.perf_counter() - t0, endpoint)
+            RESPONSE_BYTES.observe(state["bytes"], endpoint)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    record()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
+            _scope.reset(token)
+
+
+# ------------------ DB hooks ------------------
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (including new connects)."""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            endpoint = current_endpoint()
+            POOL_WAIT.observe(time.perf_counter() - t0, endpoint)
+            POOL_CHECKOUTS.inc(endpoint)
+
+
+def instrument_engine(engine, pool_gauges: bool = True):
+    """Record per-statement execution time and row counts, plus pool gauges (primary only), for `engine`."""
+
+    # the start time lives on the statement's execution context: a statement
+    # that raises (timeout, cancel) never reaches after_cursor_execute
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context.nhp_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t0, context.nhp_query_start = context.nhp_query_start, None
+        endpoint = current_endpoint()
+        DB_TIME.observe(time.perf_counter() - t0, endpoint, "ok")
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            DB_ROWS.observe(cursor.rowcount, endpoint)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exc_context):
+        t0 = getattr(exc_context.execution_context, "nhp_query_start", None)
+        if t0 is not None:  # None: failed before executing, or while fetching after it
+            exc_context.execution_context.nhp_query_start = None
+            DB_TIME.observe(time.perf_counter() - t0, current_endpoint(), "error")
+
+    pool = engine.pool
+    if pool_gauges and isinstance(pool, QueuePool):
+        register(Gauge("nhp_db_pool_size", "Configured pool size", pool.size))
+        register(Gauge("nhp_db_pool_checked_out", "Connections currently checked out", pool.checkedout))
+        register(Gauge("nhp_db_pool_checked_in", "Idle connections in the pool", pool.checkedin))
+        register(Gauge("nhp_db_pool_overflow", "Connections open beyond pool size", lambda: max(0, pool.overflow())))
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+from sqlalchemy import text
+
+# ------------------ Config ------------------
+# Set to 0 behind a transaction-pooling proxy (pgbouncer), where session-level
+# prepared statements do not survive between transactions.
+PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "1") == "1"
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "256"))
+MAX_PREPARED_PER_CONN = int(os.getenv("MAX_PREPARED_PER_CONN", "128"))
+
+# Postgres types of the bind params used by the API queries. Declared in PREPARE
+# so ANY(:ids) and the date bounds do not depend on type inference.
+PARAM_TYPES = {
+    "ids": "text[]",
+    "station_id": "text",
+    "start_date": "date",
+    "end_date": "date",
+    "limit": "bigint",
+    "offset": "bigint",
+    "bucket_secs": "integer",
+}
+
+# same rule sqlalchemy.text() uses for :name binds (skips ::casts)
+_BIND = re.compile(r"(?<![:\w\\]):(\w+)(?!:)")
+
+
+def where(conditions: Iterable[str]) -> str:
+    """WHERE clause joining `conditions` with AND; empty string when there are none."""
+    conditions = list(conditions)
+    return "WHERE " + "\n          AND ".join(conditions) if conditions else ""
+
+
+# ------------------ Templates ------------------
+class QueryTemplate:
+    """
+    One compiled query for one filter combination.
+
+    `stmt` is the text() construct (used for streaming / COPY, which cannot run
+    EXECUTE); `prepare_sql` and `execute_stmt` run the same query as a named
+    server-side prepared statement, so Postgres parses it once per connection
+    and can reuse the plan.
+    """
+
+    def __init__(self, sql: str, param_types: Optional[Dict[str, str]] = None):
+        self.sql = sql
+        self.stmt = text(sql)
+        self.name = "nhp_" + hashlib.sha1(sql.encode("utf-8")).hexdigest()[:16]
+        types = {**PARAM_TYPES, **(param_types or {})}
+
+        self.params = []
+        for p in _BIND.findall(sql):
+            if p not in self.params:
+                self.params.append(p)
+        missing = [p for p in self.params if p not in types]
+        if missing:
+            raise ValueError(f"no Postgres type declared for bind param(s): {', '.join(missing)}")
+
+        positional = _BIND.sub(lambda m: f"${self.params.index(m.group(1)) + 1}", sql)
+        arg_types = ", ".join(types[p] for p in self.params)
+        self.prepare_sql = f"PREPARE {self.name} ({arg_types}) AS {positional}" if self.params \
+            else f"PREPARE {self.name} AS {positional}"
+        args = ", ".join(f":{p}" for p in self.params)
+        self.execute_stmt = text(f"EXECUTE {self.name}({args})" if self.params else f"EXECUTE {self.name}")
+        self.driver_sql: Optional[str] = None  # the query as sent by the driver, filled on first run
+
+
+_templates: "OrderedDict[tuple, QueryTemplate]" = OrderedDict()
+_by_name: Dict[str, QueryTemplate] = {}
+_lock = threading.Lock()
+
+
+def template(key: tuple, build: Callable[[], str], param_types: Optional[Dict[str, str]] = None) -> QueryTemplate:
+    """
+    Template for `key` (endpoint + filter combination), built by `build()` on
+    first use and kept in a small LRU. Requests with the same combination reuse
+    the compiled statement instead of re-assembling the SQL.
+    """
+    with _lock:
+        tpl = _templates.get(key)
+        if tpl is not None:
+            _templates.move_to_end(key)
+            return tpl
+    tpl = QueryTemplate(build(), param_types)
+    with _lock:
+        tpl = _templates.setdefault(key, tpl)
+        _by_name[tpl.name] = tpl
+        while len(_templates) > TEMPLATE_CACHE_SIZE:
+            _, old = _templates.popitem(last=False)
+            _by_name.pop(old.name, None)
+    return tpl
+
+
+def prepared_template(statement: str) -> Optional[QueryTemplate]:
+    """Template behind an `EXECUTE nhp_...` statement (for logging the real SQL)."""
+    if not statement.startswith("EXECUTE nhp_"):
+        return None
+    return _by_name.get(statement[len("EXECUTE "):].split("(", 1)[0])
+
+
+# ------------------ Execution ------------------
+def execute(conn, tpl: QueryTemplate, params: Dict):
+    """
+    Run `tpl` on `conn` as a prepared statement, preparing it first if this
+    pooled connection has not seen it yet. Prepared names are tracked in the
+    DBAPI connection's info dict, which lives as long as the physical connection.
+    """
+    prepare(conn, tpl)
+    bound = {p: params.get(p) for p in tpl.params}
+    if not PREPARED_STATEMENTS:
+        return conn.execute(tpl.stmt, bound)
+    return conn.execute(tpl.execute_stmt, bound)
+
+
+def prepare(conn, tpl: QueryTemplate):
+    """PREPARE `tpl` on `conn` unless this pooled connection already has it (e.g. to warm up at startup)."""
+    if tpl.driver_sql is None:
+        tpl.driver_sql = str(tpl.stmt.compile(dialect=conn.dialect))
+    if not PREPARED_STATEMENTS:
+        return
+    prepared = conn.connection.info.setdefault("nhp_prepared", set())
+    if tpl.name not in prepared:
+        if len(prepared) >= MAX_PREPARED_PER_CONN:
+            conn.exec_driver_sql("DEALLOCATE ALL")
+            prepared.clear()
+        conn.exec_driver_sql(tpl.prepare_sql)
+        prepared.add(tpl.name)
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+# ------------------ Downsampling ------------------
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of the `n_out` points to keep (first and last always kept).
+    Inner points are split into n_out - 2 equal buckets; from each bucket the point
+    forming the largest triangle with the previously kept point and the average of
+    the next bucket is kept, which preserves peaks and troughs (flood crests).
+
+    Bucket averages are precomputed with cumulative sums and each bucket's
+    triangle areas are a single vectorized expression; only the walk from bucket
+    to bucket (each choice depends on the previous one) is a Python loop.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    widths = ends - starts
+    avg_x = (cx[ends] - cx[starts]) / widths
+    avg_y = (cy[ends] - cy[starts]) / widths
+    # bucket i looks ahead to bucket i + 1; the last inner bucket looks at the final point
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        s, e = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[s:e] - ay) - (ax - x[s:e]) * (next_y[i] - ay))
+        a = s + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
@@ -0,0 +1,109 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+# ------------------ Config ------------------
+MASTER_SHM = os.getenv("MASTER_SHM", "0") == "1"  # read nhp_v2 from the shared copy (set by gunicorn_conf.py)
+SHM_DIR = os.getenv("NHP_SHM_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+MASTER_SHM_PATH = os.getenv("MASTER_SHM_PATH", os.path.join(SHM_DIR, "nhp_master.bin"))
+SHM_CHECK_INTERVAL = float(os.getenv("SHM_CHECK_INTERVAL", "1"))  # seconds between checks for a new table
+
+# magic, version, published_at, sha1 digest, payload length
+_HEADER = struct.Struct("<8sQd40sQ")
+_MAGIC = b"NHPSHM01"
+
+
+class Snapshot(NamedTuple):
+    version: int
+    published_at: float
+    digest: str
+    rows: List[Dict]
+
+
+# ------------------ Shared table ------------------
+class SharedTable:
+    """
+    A read-only table published once and mapped by every worker on the host.
+
+    The publisher writes header + JSON rows to a temp file in SHM_DIR (tmpfs)
+    and renames it over `path`, so a new table appears atomically. Readers
+    mmap the file read-only; a reader still holding the previous mapping keeps
+    a valid (old) table until it notices the new inode. Checks for a new table
+    are a stat() at most every check_interval seconds.
+    """
+
+    def __init__(self, path: str = MASTER_SHM_PATH, check_interval: float = SHM_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._seen = None  # (st_ino, st_mtime_ns) of the last file loaded
+        self._checked_at = 0.0
+
+    # ---- publisher ----
+    def publish(self, rows: List[Dict], digest: str) -> int:
+        """Write `rows` as the new table; returns its version."""
+        current = self._read_header()
+        version = (current[0] + 1) if current else 1
+        payload = json.dumps(rows, default=str).encode("utf-8")
+        header = _HEADER.pack(_MAGIC, version, time.time(), digest.encode("ascii"), len(payload))
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".nhp_shm.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(payload)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return version
+
+    # ---- readers ----
+    def _read_header(self):
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read(_HEADER.size)
+        except OSError:
+            return None
+        if len(raw) < _HEADER.size:
+            return None
+        magic, version, published_at, digest, length = _HEADER.unpack(raw)
+        if magic != _MAGIC:
+            return None
+        return version, published_at, digest.decode("ascii"), length
+
+    def changed(self) -> bool:
+        """True if a table newer than the last one loaded has been published (rate-limited stat)."""
+        now = time.monotonic()
+        if self._seen is not None and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return (st.st_ino, st.st_mtime_ns) != self._seen
+
+    def load(self) -> Optional[Snapshot]:
+        """Map the current table and decode it; None if nothing has been published."""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return None
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_size < _HEADER.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, version, published_at, digest, length = _HEADER.unpack_from(mm, 0)
+                if magic != _MAGIC:
+                    return None
+                rows = json.loads(mm[_HEADER.size:_HEADER.size + length])
+        self._seen = (st.st_ino, st.st_mtime_ns)
+        self._checked_at = time.monotonic()
+        return Snapshot(version, published_at, digest.decode("ascii"), rows)
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+from nhp_export import dbapi_connection
+from nhp_metrics import current_endpoint
+from nhp_queries import prepared_template
+
+# ------------------ Config ------------------
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))                        # record statements slower than this
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))   # share of slow statements re-run under EXPLAIN
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))  # min seconds between plans of one shape
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "30000"))
+SLOW_QUERY_LOG_PATH = os.getenv("SLOW_QUERY_LOG_PATH", os.path.join(tempfile.gettempdir(), "nhp_api_slowlog.sqlite3"))
+SLOW_QUERY_MAX_ROWS = int(os.getenv("SLOW_QUERY_MAX_ROWS", "10000"))
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+# ------------------ Helper: query shape ------------------
+def query_shape(statement: str) -> str:
+    """
+    Statement text with whitespace collapsed and inline literals replaced by '?'.
+    Bound params are already placeholders, so every filter combination of an
+    endpoint maps to one shape.
+    """
+    return _SPACE.sub(" ", _LITERAL.sub("?", statement)).strip()
+
+
+def shape_id(shape: str) -> str:
+    return hashlib.sha1(shape.encode("utf-8")).hexdigest()[:16]
+
+
+# ------------------ Slow-query log ------------------
+class SlowQueryLog:
+    """
+    Records statements slower than threshold_ms, with their bound params, in a
+    local SQLite file.
+
+    A sampled share of them (explain_rate, at most one per shape every
+    explain_interval seconds) is re-run under EXPLAIN (ANALYZE, BUFFERS) on
+    the engine that ran it (a replica's plan and cache differ from the
+    primary's) and the plan is stored with the sample. Writing and explaining happen on a
+    background thread over a bounded queue, so the request never waits on
+    either; when the queue is full the sample is dropped.
+    """
+
+    def __init__(self, engine, path: str = SLOW_QUERY_LOG_PATH, threshold_ms: float = SLOW_QUERY_MS,
+                 explain_rate: float = SLOW_QUERY_EXPLAIN_RATE, explain_interval: float = SLOW_QUERY_EXPLAIN_INTERVAL,
+                 max_rows: int = SLOW_QUERY_MAX_ROWS):
+        self.engine = engine
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.explain_interval = explain_interval
+        self.max_rows = max_rows
+        self.dropped = 0
+        self._last_explain: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=64)
+        self._local = threading.local()
+        self._worker: Optional[threading.Thread] = None
+
+    # ---- storage ----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS slow_queries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    shape_id TEXT,
+                    shape TEXT,
+                    endpoint TEXT,
+                    param_names TEXT,
+                    statement TEXT,
+                    params TEXT,
+                    duration_ms REAL,
+                    row_count INTEGER,
+                    plan TEXT,
+                    created_at REAL,
+                    error TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS slow_queries_shape_idx ON slow_queries (shape_id, created_at)")
+            self._local.conn = conn
+        return conn
+
+    # ---- recording (request thread) ----
+    def _want_plan(self, sid: str, now: float) -> bool:
+        if random.random() >= self.explain_rate:
+            return False
+        with self._lock:
+            if now - self._last_explain.get(sid, 0.0) < self.explain_interval:
+                return False
+            self._last_explain[sid] = now
+            return True
+
+    def observe(self, statement: str, parameters, duration_ms: float, row_count: Optional[int],
+                error: Optional[str] = None, engine=None):
+        """
+        Record a statement that took duration_ms on `engine` (default: the log's
+        engine); `error` if it failed (timed out, cancelled, ...).
+        """
+        if duration_ms < self.threshold_ms:
+            return
+        tpl = prepared_template(statement)
+        if tpl is not None and tpl.driver_sql:
+            # log (and EXPLAIN) the query behind EXECUTE; the prepared name only exists on one connection
+            statement = tpl.driver_sql
+        shape = query_shape(statement)
+        sid = shape_id(shape)
+        now = time.time()
+        explain = statement.lstrip().upper().startswith(("SELECT", "WITH")) and self._want_plan(sid, now)
+        item = {
+            "shape_id": sid,
+            "shape": shape,
+            "endpoint": current_endpoint(),
+            "statement": statement,
+            "parameters": parameters,
+            "duration_ms": duration_ms,
+            "row_count": row_count,
+            "created_at": now,
+            "explain": explain,
+            "error": error,
+            "engine": engine if engine is not None else self.engine,
+        }
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="nhp-slowlog", daemon=True)
+                    self._worker.start()
+
+    # ---- background thread ----
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(item)
+            except Exception:
+                pass  # the log is best effort; a failure here must not kill the thread
+
+    def _explain(self, engine, statement: str, parameters, analyze: bool = True) -> str:
+        # raw connection: the EXPLAIN does not go through the engine events (no recursion)
+        raw = engine.raw_connection()
+        try:
+            with dbapi_connection(raw).cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = %s", (SLOW_QUERY_EXPLAIN_TIMEOUT_MS,))
+                cur.execute(("EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN ") + statement, parameters)
+                plan = "\n".join(r[0] for r in cur.fetchall())
+            raw.rollback()
+            return plan
+        except Exception as e:
+            raw.rollback()
+            return f"EXPLAIN failed: {e}"
+        finally:
+            raw.close()
+
+    def _write(self, item: dict):
+        params = item["parameters"]
+        param_names = ",".join(sorted(params)) if isinstance(params, dict) else ""
+        plan = None
+        if item["explain"]:
+            # a failed statement gets its plan without ANALYZE: re-running it would just time out again
+            plan = self._explain(item["engine"], item["statement"], params, analyze=item["error"] is None)
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO slow_queries (shape_id, shape, endpoint, param_names, statement, params, "
+            "duration_ms, row_count, plan, created_at, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (item["shape_id"], item["shape"], item["endpoint"], param_names, item["statement"],
+             json.dumps(params, default=str), item["duration_ms"], item["row_count"], plan, item["created_at"],
+             item["error"]),
+        )
+        conn.execute(
+            "DELETE FROM slow_queries WHERE id <= (SELECT MAX(id) FROM slow_queries) - ?",
+            (self.max_rows,),
+        )
+
+    # ---- reading ----
+    def summary(self, limit: int = 50) -> List[dict]:
+        """One entry per query shape, slowest total time first, with its latest plan and params."""
+        conn = self._conn()
+        rows = conn.execute("""
+            SELECT s.shape_id, s.endpoint, s.param_names, COUNT(*) AS samples, COUNT(s.error),
+                   AVG(s.duration_ms), MAX(s.duration_ms), SUM(s.duration_ms), MAX(s.created_at), MIN(s.shape)
+            FROM slow_queries s
+            GROUP BY s.shape_id, s.endpoint, s.param_names
+            ORDER BY SUM(s.duration_ms) DESC
+            LIMIT ?
+        """, (limit,)).fetchall()
+
+        out = []
+        for sid, endpoint, param_names, samples, errors, avg_ms, max_ms, total_ms, last_seen, shape in rows:
+            plan_row = conn.execute(
+                "SELECT plan, params, duration_ms FROM slow_queries "
+                "WHERE shape_id = ? AND plan IS NOT NULL ORDER BY created_at DESC LIMIT 1",
+                (sid,),
+            ).fetchone()
+            out.append({
+                "shape_id": sid,
+                "endpoint": endpoint,
+                "params": param_names.split(",") if param_names else [],
+                "samples": samples,
+                "errors": errors,
+                "avg_ms": round(avg_ms, 1),
+                "max_ms": round(max_ms, 1),
+                "total_ms": round(total_ms, 1),
+                "last_seen": last_seen,
+                "shape": shape,
+                "plan": plan_row[0] if plan_row else None,
+                "plan_params": json.loads(plan_row[1]) if plan_row else None,
+                "plan_duration_ms": plan_row[2] if plan_row else None,
+            })
+        return out
+
+    def clear(self):
+        self._conn().execute("DELETE FROM slow_queries")
+
+
+def instrument_slow_queries(engine, log: SlowQueryLog):
+    """Time every statement on `engine` and hand the slow ones to `log`."""
+
+    # start times live on the execution context, like nhp_metrics: failed
+    # statements skip after_cursor_execute and are logged from handle_error
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context.nhp_slowlog_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t0, context.nhp_slowlog_start = context.nhp_slowlog_start, None
+        duration_ms = (time.perf_counter() - t0) * 1000
+        if executemany or duration_ms < log.threshold_ms:
+            return
+        row_count = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        log.observe(statement, parameters, duration_ms, row_count, engine=conn.engine)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exc_context):
+        context = exc_context.execution_context
+        t0 = getattr(context, "nhp_slowlog_start", None)
+        if t0 is None:
+            return
+        context.nhp_slowlog_start = None
+        duration_ms = (time.perf_counter() - t0) * 1000
+        if context.executemany or duration_ms < log.threshold_ms:
+            return
+        error = str(exc_context.original_exception).strip().splitlines()
+        log.observe(exc_context.statement, exc_context.parameters, duration_ms, None,
+                    error=error[0] if error else type(exc_context.original_exception).__name__,
+                    engine=exc_context.engine)
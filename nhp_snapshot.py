@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set
+
+from nhp_metrics import Counter, Gauge, register
+
+# ------------------ Config ------------------
+LATEST_SNAPSHOT = os.getenv("LATEST_SNAPSHOT", "1") == "1"                    # serve /stations/latest from memory
+LATEST_SNAPSHOT_DEPTH = int(os.getenv("LATEST_SNAPSHOT_DEPTH", "20"))          # readings kept per station (max limit)
+LATEST_SNAPSHOT_INTERVAL = float(os.getenv("LATEST_SNAPSHOT_INTERVAL", "5"))   # seconds between cursor polls
+LATEST_SNAPSHOT_FULL_INTERVAL = float(os.getenv("LATEST_SNAPSHOT_FULL_INTERVAL", "300"))  # seconds between full reloads
+LATEST_SNAPSHOT_MAX_AGE = float(os.getenv("LATEST_SNAPSHOT_MAX_AGE", "60"))    # older than this: answer from the DB
+LATEST_SNAPSHOT_VIEWS = int(os.getenv("LATEST_SNAPSHOT_VIEWS", "256"))         # pre-serialized responses kept
+LATEST_SNAPSHOT_PRERENDER = int(os.getenv("LATEST_SNAPSHOT_PRERENDER", "32"))  # most-requested views rebuilt per refresh
+
+SNAPSHOT_VIEWS = register(Counter("nhp_latest_snapshot_views_total", "/stations/latest responses from the snapshot", ["outcome"]))
+SNAPSHOT_REFRESHES = register(Counter("nhp_latest_snapshot_refreshes_total", "Snapshot refreshes", ["kind", "outcome"]))
+
+
+class _View:
+    __slots__ = ("version", "value", "render", "hits")
+
+    def __init__(self, version, value, render):
+        self.version, self.value, self.render, self.hits = version, value, render, 1
+
+
+# ------------------ Snapshot ------------------
+class LatestSnapshot:
+    """
+    The newest `depth` readings of every station, kept in process and updated
+    by a background thread.
+
+    `load(cursors, depth)` returns {station: rows newest first} with up to
+    `depth` rows newer than each station's cursor, each row carrying its
+    parsed time as "ts". A None cursor (no rows yet, or only rows whose time
+    does not parse) asks for the station's newest `depth` rows of any time,
+    NULL times last, which replace what the snapshot holds. The thread polls every `interval`
+    seconds with the cursors of all stations (one index probe per station)
+    and, when a ReadingHub is given, is woken by the ingest's NOTIFY to fetch
+    just the notified stations. Every `full_interval` it reloads from scratch,
+    which also picks up back-filled or deleted readings.
+
+    Rendered responses are cached per view key and snapshot version (view());
+    after each change the most requested views are rebuilt in the background,
+    so polling clients get pre-serialized bodies.
+    """
+
+    def __init__(self, load: Callable, all_ids: Callable[[], List[str]], depth: int = LATEST_SNAPSHOT_DEPTH,
+                 interval: float = LATEST_SNAPSHOT_INTERVAL, full_interval: float = LATEST_SNAPSHOT_FULL_INTERVAL,
+                 max_age: float = LATEST_SNAPSHOT_MAX_AGE, hub=None):
+        self.load = load
+        self.all_ids = all_ids
+        self.depth = depth
+        self.interval = interval
+        self.full_interval = full_interval
+        self.max_age = max_age
+        self.hub = hub
+        self.version = 0
+        self.refreshed_at = 0.0   # last successful refresh (time.time())
+        self.loaded_at = 0.0      # last full reload
+        self.error: Optional[str] = None
+        self._rows: Dict[str, List[Dict]] = {}
+        self._views: "OrderedDict[str, _View]" = OrderedDict()
+        self._pending: Optional[Set[str]] = set()  # notified stations not fetched yet (None = all)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        register(Gauge("nhp_latest_snapshot_age_seconds", "Seconds since the snapshot was last refreshed",
+                       lambda: time.time() - self.refreshed_at if self.refreshed_at else -1))
+
+    # ---- reading (request side) ----
+    def ready(self) -> bool:
+        """Loaded and refreshed within max_age; starts the refresh thread on first use."""
+        self.start()
+        return bool(self.loaded_at) and time.time() - self.refreshed_at < self.max_age
+
+    def rows(self, station_id: str) -> List[Dict]:
+        return self._rows.get(station_id, [])
+
+    def readings(self) -> Dict[str, List[Dict]]:
+        """{station: rows} of the current version; replaced, never changed in place, by refreshes."""
+        return self._rows
+
+    def view(self, key: str, render: Callable):
+        """
+        render()'s result for `key` at the current snapshot version: cached if
+        already built for this version, else rendered now and cached.
+        """
+        version = self.version
+        with self._lock:
+            entry = self._views.get(key)
+            if entry is not None:
+                self._views.move_to_end(key)
+                entry.hits += 1
+                entry.render = render
+                if entry.version == version:
+                    SNAPSHOT_VIEWS.inc("hit")
+                    return entry.value
+        value = render()
+        SNAPSHOT_VIEWS.inc("render")
+        with self._lock:
+            entry = self._views.get(key)
+            if entry is None:
+                self._views[key] = _View(version, value, render)
+                while len(self._views) > LATEST_SNAPSHOT_VIEWS:
+                    self._views.popitem(last=False)
+            elif entry.version <= version:
+                entry.version, entry.value = version, value
+        return value
+
+    # ---- refresh thread ----
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="nhp-latest-snapshot", daemon=True)
+                    self._thread.start()
+                    if self.hub is not None and self._notified not in self.hub.callbacks:
+                        self.hub.on_notify(self._notified)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _notified(self, stations: Optional[Set[str]]):
+        # listener thread: only record what to fetch and wake the refresh thread
+        with self._lock:
+            if stations is None or self._pending is None:
+                self._pending = None
+            else:
+                self._pending.update(stations)
+        self._wake.set()
+
+    def _run(self):
+        notified = False
+        while not self._stop.is_set():
+            try:
+                if not self.loaded_at or time.time() - self.loaded_at >= self.full_interval:
+                    self._refresh(full=True)
+                else:
+                    with self._lock:
+                        pending, self._pending = self._pending, set()
+                    # woken by NOTIFY: just those stations; timed out: poll them all
+                    self._refresh(stations=pending if notified else None)
+                self.error = None
+            except Exception as e:
+                self.error = str(e).splitlines()[0] if str(e) else type(e).__name__
+            notified = self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _refresh(self, full: bool = False, stations: Optional[Set[str]] = None):
+        """Full reload, or fetch rows newer than the cursors of `stations` (None = all stations)."""
+        kind = "full" if full else ("notify" if stations is not None else "poll")
+        ids = self.all_ids()
+        current = self._rows
+        if full:
+            cursors = {sid: None for sid in ids}
+        else:
+            wanted = ids if stations is None else [sid for sid in ids if sid in stations]
+            cursors = {sid: current[sid][0]["ts"] if current.get(sid) else None for sid in wanted}
+        if not cursors and not full:
+            return
+        try:
+            fetched = self.load(cursors, self.depth) if cursors else {}
+        except Exception:
+            SNAPSHOT_REFRESHES.inc(kind, "error")
+            raise
+        SNAPSHOT_REFRESHES.inc(kind, "ok")
+
+        now = time.time()
+        if full:
+            rows = fetched
+            changed = rows != current
+            self.loaded_at = now
+        else:
+            known = set(ids)
+            changed = bool(set(current) - known)
+            rows = {sid: r for sid, r in current.items() if sid in known}
+            for sid, new in fetched.items():
+                if cursors.get(sid) is None:
+                    # no cursor: `new` is the station's whole top `depth`
+                    changed = changed or new != rows.get(sid, [])
+                    if new:
+                        rows[sid] = new[:self.depth]
+                elif new:
+                    changed = True
+                    rows[sid] = (new + rows.get(sid, []))[:self.depth]
+        if changed:
+            self._rows = rows
+            self.version += 1
+            self._prerender()
+        self.refreshed_at = now
+
+    def _prerender(self):
+        """Rebuild the most requested views for the new version before clients ask."""
+        version = self.version
+        with self._lock:
+            top = sorted(self._views.values(), key=lambda v: v.hits, reverse=True)[:LATEST_SNAPSHOT_PRERENDER]
+            for entry in self._views.values():
+                entry.hits = 0  # popularity is counted per refresh
+        for entry in top:
+            try:
+                value = entry.render()
+            except Exception:
+                continue
+            SNAPSHOT_VIEWS.inc("prerender")
+            with self._lock:
+                if entry.version < version:
+                    entry.version, entry.value = version, value
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": LATEST_SNAPSHOT,
+            "ready": bool(self.loaded_at) and time.time() - self.refreshed_at < self.max_age,
+            "version": self.version,
+            "stations": len(self._rows),
+            "readings": sum(len(r) for r in self._rows.values()),
+            "refreshed_at": self.refreshed_at,
+            "loaded_at": self.loaded_at,
+            "views": len(self._views),
+            "error": self.error,
+        }
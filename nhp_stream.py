@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import select
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from nhp_export import dbapi_connection
+from nhp_metrics import Counter, Gauge, register
+
+# ------------------ Config ------------------
+NOTIFY_CHANNEL = os.getenv("NOTIFY_CHANNEL", "nhp_readings")  # must match the ingest (NHP_ingest_deploy.py)
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))          # events buffered per subscriber
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))           # seconds between keep-alives
+STREAM_MAX_ROWS_PER_STATION = int(os.getenv("STREAM_MAX_ROWS_PER_STATION", "100"))  # per notification
+STREAM_RECONNECT_DELAY = float(os.getenv("STREAM_RECONNECT_DELAY", "5"))  # seconds, after the listener drops
+
+STREAM_EVENTS = register(Counter("nhp_stream_events_total", "Reading batches pushed to stream subscribers", ["outcome"]))
+
+
+# ------------------ Subscribers ------------------
+class Subscriber:
+    """One streaming client: its station filter (None = all) and an asyncio queue on its event loop."""
+
+    def __init__(self, ids: Optional[List[str]], loop: asyncio.AbstractEventLoop, maxsize: int = STREAM_QUEUE_SIZE):
+        self.ids: Optional[Set[str]] = set(ids) if ids is not None else None
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.lagged = False
+
+    def wants(self, station_id: str) -> bool:
+        return self.ids is None or station_id in self.ids
+
+    def _offer(self, item):
+        # runs on the subscriber's event loop
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # too slow to keep up: end its stream instead of buffering without bound
+            self.lagged = True
+            STREAM_EVENTS.inc("dropped")
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    def offer(self, item):
+        """Thread-safe enqueue from the listener thread."""
+        self.loop.call_soon_threadsafe(self._offer, item)
+
+    async def get(self, timeout: float):
+        """Next batch of records, None once the stream was cut for lagging; raises TimeoutError when idle."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+# ------------------ Hub ------------------
+class ReadingHub:
+    """
+    Fans new readings out to streaming subscribers from a single LISTEN
+    connection per process.
+
+    The ingest NOTIFYs NOTIFY_CHANNEL with the station IDs it just committed.
+    The listener thread collects the notifications that arrive together, then
+    runs one query for rows newer than the last reading pushed for each watched
+    station (`load_new(cursors)` -> (records, new cursors)) and hands each
+    subscriber the records for its stations. Cursors are seeded when a station
+    is first watched (`load_cursors(ids)`), so a subscriber only receives
+    readings committed after it subscribed. After the listener reconnects, all
+    watched stations are re-checked, which covers notifications missed
+    meanwhile.
+    """
+
+    def __init__(self, engine, load_new: Callable, load_cursors: Callable, all_ids: Callable[[], List[str]],
+                 channel: str = NOTIFY_CHANNEL):
+        self.engine = engine
+        self.load_new = load_new
+        self.load_cursors = load_cursors
+        self.all_ids = all_ids
+        self.channel = channel
+        self.subscribers: Set[Subscriber] = set()
+        self.callbacks: List[Callable[[Optional[Set[str]]], None]] = []
+        self.cursors: Dict[str, object] = {}  # station id -> time of the last reading pushed
+        self.notifications = 0
+        self.last_event_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._listening = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        register(Gauge("nhp_stream_subscribers", "Open streaming subscriptions", lambda: len(self.subscribers)))
+
+    # ---- subscriptions (request side) ----
+    def subscribe(self, ids: Optional[List[str]], loop: asyncio.AbstractEventLoop) -> Subscriber:
+        """
+        Register a subscriber for `ids` (None = all stations). Blocking: starts
+        the listener if needed and seeds cursors for newly watched stations, so
+        call it from a worker thread.
+        """
+        self.start()
+        if not self._listening.wait(timeout=10):
+            raise RuntimeError(f"stream listener not connected: {self.error}")
+        wanted = ids if ids is not None else self.all_ids()
+        with self._lock:
+            new = [sid for sid in wanted if sid not in self.cursors]
+        if new:
+            seeded = self.load_cursors(new)
+            with self._lock:
+                for sid in new:
+                    self.cursors.setdefault(sid, seeded.get(sid))
+        sub = Subscriber(ids, loop)
+        with self._lock:
+            self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            self.subscribers.discard(sub)
+            if any(s.ids is None for s in self.subscribers):
+                return
+            watched = set().union(*(s.ids for s in self.subscribers)) if self.subscribers else set()
+            # forget stations nobody watches, so a later subscriber starts from "now"
+            for sid in [sid for sid in self.cursors if sid not in watched]:
+                del self.cursors[sid]
+
+    def on_notify(self, callback: Callable[[Optional[Set[str]]], None]):
+        """
+        Also call `callback(stations)` on the listener thread for every batch of
+        notifications (None = any station may have changed, e.g. after a reconnect).
+        It must return quickly; starts the listener.
+        """
+        self.callbacks.append(callback)
+        self.start()
+
+    def _run_callbacks(self, stations: Optional[Set[str]]):
+        for callback in self.callbacks:
+            try:
+                callback(stations)
+            except Exception:
+                pass  # a failing consumer must not stop the listener
+
+    # ---- listener thread ----
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="nhp-stream-listener", daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        # own connection outside the pool; it stays in LISTEN for the life of the process
+        listen_engine = create_engine(self.engine.url, poolclass=NullPool)
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = listen_engine.raw_connection()
+                conn = dbapi_connection(raw)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                self._listening.set()
+                self.error = None
+                self._run_callbacks(None)
+                self._dispatch(None)  # catch up on anything committed while disconnected
+                self._listen(conn)
+            except Exception as e:
+                self._listening.clear()
+                self.error = str(e).splitlines()[0] if str(e) else type(e).__name__
+                self._stop.wait(STREAM_RECONNECT_DELAY)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+        self._listening.clear()
+        listen_engine.dispose()
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            stations: Optional[Set[str]] = set()
+            while conn.notifies:
+                note = conn.notifies.pop(0)
+                self.notifications += 1
+                try:
+                    named = json.loads(note.payload)["stations"]
+                except (ValueError, KeyError, TypeError):
+                    named = None  # bare NOTIFY: re-check every watched station
+                if named is None or stations is None:
+                    stations = None
+                else:
+                    stations.update(named)
+            self._run_callbacks(stations)
+            self._dispatch(stations)
+
+    def _dispatch(self, stations: Optional[Set[str]]):
+        """Push rows newer than the cursors of the notified (None = all) watched stations."""
+        with self._lock:
+            cursors = {
+                sid: ts for sid, ts in self.cursors.items()
+                if stations is None or sid in stations
+            }
+            subscribers = list(self.subscribers)
+        if not cursors or not subscribers:
+            return
+
+        records, latest = self.load_new(cursors)
+        if not records:
+            return
+        with self._lock:
+            for sid, ts in latest.items():
+                if sid in self.cursors:
+                    self.cursors[sid] = ts
+        self.last_event_at = time.time()
+
+        for sub in subscribers:
+            mine = [r for r in records if sub.wants(r["station_id"])]
+            if mine:
+                sub.offer(mine)
+                STREAM_EVENTS.inc("sent")
+
+    def stats(self) -> Dict:
+        return {
+            "channel": self.channel,
+            "listening": self._listening.is_set(),
+            "error": self.error,
+            "subscribers": len(self.subscribers),
+            "watched_stations": len(self.cursors),
+            "notifications": self.notifications,
+            "last_event_at": self.last_event_at,
+        }
@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# ------------------ Config ------------------
+WARMUP = os.getenv("WARMUP", "1") == "1"                       # warm up in the app's lifespan startup
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))      # seconds startup waits before serving cold
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", "5"))  # seconds between attempts after a failure
+
+
+# ------------------ Warm-up ------------------
+class Warmup:
+    """
+    Runs named startup steps once, in order, on a background thread.
+
+    A failing step is retried every WARMUP_RETRY_DELAY seconds (steps that
+    already succeeded are not repeated) until all of them have run, so a
+    worker started while the database is unreachable warms up once it is
+    back. ready() turns true after the last step; readiness checks use it.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], None]]], retry_delay: float = WARMUP_RETRY_DELAY):
+        self.steps = steps
+        self.retry_delay = retry_delay
+        self.timings: Dict[str, float] = {}  # step -> seconds
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.started_at = time.time()
+                self._thread = threading.Thread(target=self._run, name="nhp-warmup", daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until warm (True) or until `timeout` seconds have passed (False)."""
+        return self._done.wait(timeout)
+
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def _run(self):
+        while True:
+            self.attempts += 1
+            for name, step in self.steps:
+                if name in self.timings:
+                    continue
+                t0 = time.perf_counter()
+                try:
+                    step()
+                except Exception as e:
+                    self.error = f"{name}: " + (str(e).splitlines()[0] if str(e) else type(e).__name__)
+                    break
+                self.timings[name] = round(time.perf_counter() - t0, 3)
+            else:
+                self.error = None
+                self.finished_at = time.time()
+                self._done.set()
+                return
+            time.sleep(self.retry_delay)
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready(),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+            "steps": self.timings,
+            "attempts": self.attempts,
+            "error": self.error,
+        }
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+import nhp_cancel
+from nhp_cancel import ClientDisconnected, RequestState
+from nhp_flight import SingleFlight
+
+
+def run_flight(flights, leader_fn, follower_fn, followers=3, leader_state=None):
+    """Start a leader running leader_fn, let `followers` join it, then let it finish; returns (leader, followers) outcomes."""
+    release = threading.Event()
+    outcomes = {}
+
+    def leader_body():
+        release.wait(5)
+        return leader_fn()
+
+    def call(name, fn, state=None):
+        if state is not None:
+            nhp_cancel._request.set(state)
+        try:
+            outcomes[name] = ("ok", flights.do("/x", "k", fn))
+        except BaseException as e:
+            outcomes[name] = ("error", e)
+
+    threads = [threading.Thread(target=call, args=("leader", leader_body, leader_state))]
+    threads[0].start()
+    while not flights._calls:
+        time.sleep(0.001)
+    for i in range(followers):
+        threads.append(threading.Thread(target=call, args=(i, follower_fn)))
+        threads[-1].start()
+    while flights._calls[("/x", "k")].followers < followers:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join(5)
+    return outcomes.pop("leader"), [outcomes[i] for i in range(followers)]
+
+
+def test_followers_share_the_result():
+    runs = []
+    leader, followers = run_flight(SingleFlight(enabled=True), lambda: runs.append(1) or "body",
+                                   lambda: pytest.fail("follower ran its own query"))
+    assert leader == ("ok", "body") and followers == [("ok", "body")] * 3
+    assert runs == [1]
+
+
+def test_followers_get_a_fresh_exception_chained_to_the_leaders():
+    def fail():
+        raise ValueError("bad query")
+
+    (kind, error), followers = run_flight(SingleFlight(enabled=True), fail, fail)
+    assert kind == "error" and isinstance(error, ValueError)
+    raised = [e for _, e in followers]
+    assert all(type(e) is ValueError and e.args == ("bad query",) for e in raised)
+    assert all(e is not error and e.__cause__ is error for e in raised)
+    assert len({id(e) for e in raised}) == 3
+
+
+def test_uncopyable_exception_becomes_a_runtime_error():
+    class Odd(Exception):
+        def __init__(self, code, detail):
+            super().__init__(f"{code}: {detail}")
+
+    def fail():
+        raise Odd(1, "x")
+
+    (_, error), followers = run_flight(SingleFlight(enabled=True), fail, fail, followers=1)
+    (_, raised), = followers
+    assert type(raised) is RuntimeError and raised.__cause__ is error
+
+
+def test_one_follower_reruns_when_the_leaders_client_left():
+    runs = []
+
+    def gone():
+        raise ClientDisconnected()
+
+    def rerun():
+        runs.append(1)
+        time.sleep(0.05)  # the others join this run
+        return "body"
+
+    (kind, error), followers = run_flight(SingleFlight(enabled=True), gone, rerun)
+    assert kind == "error" and isinstance(error, ClientDisconnected)
+    assert followers == [("ok", "body")] * 3
+    assert runs == [1]
+
+
+class QueryCanceled(Exception):
+    pgcode = nhp_cancel.QUERY_CANCELED
+
+
+def test_statement_cancelled_for_a_gone_leader_is_rerun():
+    state = RequestState()
+
+    def cancelled():
+        state.disconnected = True  # the client left; its running statement was cancelled
+        raise QueryCanceled()
+
+    leader, followers = run_flight(SingleFlight(enabled=True), cancelled, lambda: "body",
+                                   followers=2, leader_state=state)
+    assert isinstance(leader[1], QueryCanceled)
+    assert followers == [("ok", "body")] * 2
+
+
+def test_statement_timeout_of_a_connected_leader_is_shared():
+    state = RequestState()
+
+    def timeout():
+        raise QueryCanceled()
+
+    _, followers = run_flight(SingleFlight(enabled=True), timeout,
+                              lambda: pytest.fail("follower ran its own query"), followers=2, leader_state=state)
+    assert all(isinstance(e, QueryCanceled) for _, e in followers)
@@ -0,0 +1,21 @@
+import pytest
+from starlette.requests import Request
+
+from nhp_api import ARROW_STREAM_TYPE, PARQUET_TYPE, negotiate_format
+
+
+def request(accept=None):
+    headers = [(b"accept", accept.encode())] if accept else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("fmt, accept, expected", [
+    (None, None, "records"),
+    (None, ARROW_STREAM_TYPE, "arrow"),
+    (None, PARQUET_TYPE, "parquet"),
+    ("columnar", ARROW_STREAM_TYPE, "columnar"),
+    ("records", ARROW_STREAM_TYPE, "records"),  # an explicit default still wins over Accept
+    ("parquet", ARROW_STREAM_TYPE, "parquet"),
+])
+def test_explicit_format_wins_over_accept(fmt, accept, expected):
+    assert negotiate_format(request(accept), fmt, "records") == expected
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from nhp_geo import GeoFilter, GeoGrid, haversine_km
+
+
+def stations(n, seed):
+    rnd = random.Random(seed)
+    # spread like the NHP network: mostly India, a dense cluster, a few rows without coordinates
+    rows = [{"latitude": rnd.uniform(6, 36), "longitude": rnd.uniform(68, 98)} for _ in range(n)]
+    rows += [{"latitude": rnd.gauss(26.1, 0.05), "longitude": rnd.gauss(91.7, 0.05)} for _ in range(n // 4)]
+    rows += [{"latitude": None, "longitude": 90.0}, {"latitude": "x", "longitude": 80.0}, {}]
+    rnd.shuffle(rows)
+    return rows
+
+
+def brute(rows, lat, lon):
+    return sorted(
+        (haversine_km(lat, lon, r["latitude"], r["longitude"]), i)
+        for i, r in enumerate(rows)
+        if isinstance(r.get("latitude"), float) and isinstance(r.get("longitude"), float)
+    )
+
+
+def queries(seed, n=20):
+    rnd = random.Random(seed)
+    return [(rnd.uniform(0, 40), rnd.uniform(62, 104)) for _ in range(n)]
+
+
+@pytest.mark.parametrize("cell_deg", [0.1, 0.25, 2.0])
+def test_nearest_matches_brute_force(cell_deg):
+    rows = stations(400, 1)
+    grid = GeoGrid(rows, cell_deg)
+    assert len(grid) == len(rows) - 3
+    for lat, lon in queries(2):
+        expected = brute(rows, lat, lon)
+        for k in (1, 5, 50):
+            assert grid.nearest(lat, lon, k) == pytest.approx(expected[:k])
+    # more than there are: every located row, nearest first
+    assert grid.nearest(20.0, 80.0, len(rows)) == pytest.approx(brute(rows, 20.0, 80.0))
+
+
+@pytest.mark.parametrize("cell_deg", [0.1, 0.25, 2.0])
+def test_nearest_with_max_distance_and_allowed_rows(cell_deg):
+    rows = stations(300, 3)
+    grid = GeoGrid(rows, cell_deg)
+    allowed = set(random.Random(4).sample(range(len(rows)), 60))
+    for lat, lon in queries(5):
+        expected = brute(rows, lat, lon)
+        assert grid.nearest(lat, lon, 10, max_km=150) == pytest.approx([e for e in expected if e[0] <= 150][:10])
+        assert grid.nearest(lat, lon, 10, allowed=allowed) == pytest.approx([e for e in expected
+                                                                             if e[1] in allowed][:10])
+
+
+@pytest.mark.parametrize("cell_deg", [0.1, 0.25, 2.0])
+def test_within_matches_brute_force(cell_deg):
+    rows = stations(400, 6)
+    grid = GeoGrid(rows, cell_deg)
+    for lat, lon in queries(7):
+        expected = brute(rows, lat, lon)
+        for radius in (5, 40, 300, 3000):
+            assert grid.within(lat, lon, radius) == pytest.approx([e for e in expected if e[0] <= radius])
+
+
+def test_bbox_and_match():
+    rows = stations(400, 8)
+    grid = GeoGrid(rows, 0.25)
+    box = (85.0, 20.0, 92.5, 27.0)
+    inside = [i for i, r in enumerate(rows) if isinstance(r.get("latitude"), float)
+              and box[1] <= r["latitude"] <= box[3] and box[0] <= r["longitude"] <= box[2]]
+    assert grid.in_bbox(*box) == inside
+    near = {i for d, i in brute(rows, 26.1, 91.7) if d <= 100}
+    assert grid.match(GeoFilter(bbox=box, lat=26.1, lon=91.7, radius_km=100)) == sorted(near & set(inside))
+    assert grid.match(GeoFilter()) == sorted(grid.points)
+
+
+def test_empty_grid():
+    grid = GeoGrid([{}, {"latitude": None}])
+    assert len(grid) == 0
+    assert grid.nearest(26.0, 91.0, 3) == []
+    assert grid.within(26.0, 91.0, 100) == []
@@ -0,0 +1,134 @@
+import asyncio
+import gc
+import threading
+import time
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+import nhp_api
+from nhp_limits import AdmissionGate
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    gate = AdmissionGate(max_concurrent=1, max_queue=2, max_wait=5)
+    monkeypatch.setattr(nhp_api, "heavy_gate", gate)
+    return gate
+
+
+def scope(spec_version: str = "2.3") -> dict:
+    return {"type": "http", "asgi": {"version": "3.0", "spec_version": spec_version},
+            "method": "GET", "path": "/stations/export", "headers": []}
+
+
+async def gone():
+    return {"type": "http.disconnect"}
+
+
+def body(started: list):
+    started.append(True)
+    yield b"a,b\n"
+    yield b"1,2\n"
+
+
+def queued_response(gate, started: list):
+    """A handler that had to wait behind a running export, as in the report: the slot frees up after a while."""
+    running = gate.acquire()
+    made = []
+    handler = threading.Thread(target=lambda: made.append(nhp_api.HeavyStreamingResponse(body(started))))
+    handler.start()
+    while gate.waiting == 0:
+        time.sleep(0.005)
+    gate.release(running)
+    handler.join(timeout=5)
+    assert gate.active == 1
+    return made[0]
+
+
+def test_slot_released_when_client_left_while_queued(gate):
+    started, sent = [], []
+
+    async def send(message):
+        sent.append(message)
+
+    response = queued_response(gate, started)
+    asyncio.run(response(scope(), gone, send))
+
+    assert not started  # the disconnect won: the body was never iterated
+    assert gate.active == 0
+    gate.acquire()  # the next heavy request is admitted at once
+
+
+def test_slot_released_when_first_send_fails(gate):
+    # ASGI 2.4 servers report a gone client as OSError from send()
+    started = []
+
+    async def send(message):
+        raise OSError("connection reset")
+
+    response = queued_response(gate, started)
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(response(scope("2.4"), gone, send))
+    assert not started
+    assert gate.active == 0
+
+
+def test_slot_released_once_after_a_full_response(gate):
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(60)
+
+    async def send(message):
+        sent.append(message)
+
+    started = []
+    response = nhp_api.HeavyStreamingResponse(body(started))
+    asyncio.run(response(scope(), receive, send))
+    assert b"".join(m.get("body", b"") for m in sent[1:]) == b"a,b\n1,2\n"
+    assert gate.active == 0
+
+
+def test_slot_released_when_stream_fails(gate):
+    def failing():
+        yield b"a,b\n"
+        raise RuntimeError("COPY failed")
+
+    stream = nhp_api.HeavyStream(failing(), gate.acquire())
+    assert next(stream) == b"a,b\n"
+    with pytest.raises(RuntimeError):
+        next(stream)
+    assert gate.active == 0
+    stream.close()
+    assert gate.active == 0
+
+
+def test_slot_released_when_response_is_dropped(gate):
+    started = []
+    nhp_api.HeavyStreamingResponse(body(started))
+    gc.collect()
+    assert gate.active == 0
+
+
+def test_batch_slot_released_when_client_left_while_queued(gate, monkeypatch):
+    started = []
+    monkeypatch.setattr(nhp_api, "read_engine", lambda: None)
+    monkeypatch.setattr(nhp_api, "stream_batch", lambda *args: body(started))
+    request = nhp_api.BatchRequest(queries=[{"station_ids": ["A1"]}])
+
+    running = gate.acquire()
+    made = []
+    handler = threading.Thread(target=lambda: made.append(nhp_api.batch_station_data(request, user="u")))
+    handler.start()
+    while gate.waiting == 0:
+        time.sleep(0.005)
+    gate.release(running)
+    handler.join(timeout=5)
+
+    async def send(message):
+        pass
+
+    asyncio.run(made[0](scope(), gone, send))
+    assert not started
+    assert gate.active == 0
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from nhp_limits import AdmissionGate, Overloaded, RateLimiter, TokenBucket
+
+
+# ------------------ Token buckets ------------------
+def test_bucket_allows_a_burst_then_refuses():
+    bucket = TokenBucket(rate=2, burst=5)
+    now = bucket.updated
+    assert [bucket.take(now) for _ in range(5)] == [0.0] * 5
+    assert bucket.take(now) == pytest.approx(0.5)  # one token at 2/s
+
+
+def test_bucket_refills_at_rate_up_to_burst():
+    bucket = TokenBucket(rate=2, burst=5)
+    now = bucket.updated
+    for _ in range(5):
+        bucket.take(now)
+    assert bucket.take(now + 0.5) == 0.0
+    assert bucket.take(now + 0.5) > 0
+    # a long idle period refills to the burst size, not beyond
+    later = now + 60
+    assert [bucket.take(later) for _ in range(5)] == [0.0] * 5
+    assert bucket.take(later) > 0
+
+
+def test_rate_limiter_keys_are_independent():
+    limiter = RateLimiter(rate=1, burst=2)
+    limiter.check("a")
+    limiter.check("a")
+    with pytest.raises(Overloaded) as e:
+        limiter.check("a")
+    assert e.value.retry_after_header == "1"
+    limiter.check("b")
+
+
+def test_rate_limiter_drops_least_recently_seen_keys():
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+    limiter.check("a")
+    limiter.check("b")
+    limiter.check("c")  # evicts "a"
+    limiter.check("a")  # fresh bucket
+    assert list(limiter._buckets) == ["c", "a"]
+
+
+def test_rate_limiter_disabled_with_zero_rate():
+    limiter = RateLimiter(rate=0, burst=0)
+    for _ in range(100):
+        limiter.check("a")
+
+
+def test_new_key_gets_its_full_burst():
+    # RateLimiter.check reads the clock before creating the bucket
+    limiter = RateLimiter(rate=0.001, burst=1)
+    limiter.check("a")
+
+
+# ------------------ Admission control ------------------
+def test_gate_admits_up_to_max_concurrent():
+    gate = AdmissionGate(max_concurrent=2, max_queue=0, max_wait=1)
+    gate.acquire()
+    gate.acquire()
+    assert gate.active == 2
+    with pytest.raises(Overloaded):
+        gate.acquire()  # no queue: refused at once
+    assert gate.rejected == 1
+
+
+def test_gate_waiter_times_out():
+    gate = AdmissionGate(max_concurrent=1, max_queue=1, max_wait=0.1)
+    gate.acquire()
+    t0 = time.monotonic()
+    with pytest.raises(Overloaded):
+        gate.acquire()
+    assert 0.1 <= time.monotonic() - t0 < 1
+    assert gate.waiting == 0 and gate.active == 1 and gate.rejected == 1
+
+
+def test_gate_refuses_beyond_the_queue():
+    gate = AdmissionGate(max_concurrent=1, max_queue=1, max_wait=5)
+    gate.acquire()
+    waiter = threading.Thread(target=lambda: gate.release(gate.acquire()))
+    waiter.start()
+    while gate.waiting == 0:
+        time.sleep(0.005)
+    with pytest.raises(Overloaded):
+        gate.acquire()
+    gate.release()
+    waiter.join(timeout=5)
+    assert gate.active == 0 and gate.waiting == 0
+
+
+def test_gate_release_hands_the_slot_to_a_waiter():
+    gate = AdmissionGate(max_concurrent=1, max_queue=4, max_wait=5)
+    acquired_at = gate.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(gate.acquire()))
+    waiter.start()
+    while gate.waiting == 0:
+        time.sleep(0.005)
+    gate.release(acquired_at)
+    waiter.join(timeout=5)
+    assert got and gate.active == 1 and gate.waiting == 0
+
+
+def test_gate_slot_releases_on_error():
+    gate = AdmissionGate(max_concurrent=1, max_queue=0, max_wait=0)
+    with pytest.raises(RuntimeError):
+        with gate.slot():
+            assert gate.active == 1
+            raise RuntimeError("query failed")
+    assert gate.active == 0
+    with gate.slot():
+        pass
+
+
+def test_gate_retry_after_tracks_hold_time():
+    gate = AdmissionGate(max_concurrent=1, max_queue=0, max_wait=0)
+    for _ in range(20):
+        gate.release(gate.acquire() - 4.0)  # held for ~4 s
+    gate.acquire()
+    with pytest.raises(Overloaded) as e:
+        gate.acquire()
+    assert 3.5 < e.value.retry_after < 4.5
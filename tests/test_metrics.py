@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from nhp_metrics import DB_TIME, instrument_engine
+
+
+def count(outcome: str) -> int:
+    return DB_TIME._values.get(("none", outcome), [0])[-1]
+
+
+@pytest.fixture
+def engine():
+    eng = create_engine("sqlite://")
+    instrument_engine(eng, pool_gauges=False)
+    return eng
+
+
+def test_statement_time_recorded(engine):
+    ok = count("ok")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1")).scalar()
+    assert count("ok") == ok + 1
+
+
+def test_failed_statement_recorded_as_error_without_leaking(engine):
+    ok, errors = count("ok"), count("error")
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM no_such_table"))
+            conn.rollback()
+        conn.execute(text("SELECT 1"))
+        assert not any(k.startswith("nhp_") for k in conn.info)
+    assert count("error") == errors + 3
+    assert count("ok") == ok + 1
+
+
+def test_error_raised_by_a_listener_is_recorded(engine):
+    # e.g. nhp_cancel refusing a statement for a gone client
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def refuse(*args):
+        raise RuntimeError("client gone")
+
+    errors = count("error")
+    with engine.connect() as conn:
+        with pytest.raises(RuntimeError):
+            conn.execute(text("SELECT 1"))
+    assert count("error") == errors + 1
+
+
+def test_mounted_endpoints_are_labelled_with_their_prefix():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from nhp_metrics import MetricsMiddleware, current_endpoint
+
+    sub, app = FastAPI(), FastAPI()
+    sub.get("/master/filter")(lambda: current_endpoint())
+    app.get("/master/filter")(lambda: current_endpoint())
+    app.get("/stations/{station_id}/series")(lambda station_id: current_endpoint())
+    app.mount("/meta", sub)
+    app.add_middleware(MetricsMiddleware)
+
+    for root_path in ("", "/api"):  # e.g. behind a proxy: the server's root_path is not part of the label
+        client = TestClient(app, root_path=root_path)
+        assert client.get(root_path + "/master/filter").json() == "/master/filter"
+        assert client.get(root_path + "/meta/master/filter").json() == "/meta/master/filter"
+        assert client.get(root_path + "/stations/A1/series").json() == "/stations/{station_id}/series"
@@ -0,0 +1,54 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import nhp_api
+from nhp_api import Projection, parse_projection
+
+
+def test_no_fields_is_the_full_record():
+    assert parse_projection(None) is None
+    assert parse_projection("") is None
+    assert parse_projection([" ", ""]) is None
+
+
+def test_fields_split_by_source_with_keys_always_first():
+    assert parse_projection("HourlyRain, district,At_pressure") == Projection(
+        ("station_id", "district"), ("DateTime", "HourlyRain", "At.pressure"))
+    assert parse_projection(["station_id", "DateTime", "Sun_Radiation"]) == Projection(
+        ("station_id",), ("DateTime", "Sun Radiation"))
+
+
+@pytest.mark.parametrize("fields", ["HourlyRain,NoSuchField", ["district", "distrikt"]])
+def test_unknown_field_is_422(fields):
+    with pytest.raises(HTTPException) as e:
+        parse_projection(fields)
+    assert e.value.status_code == 422 and "Unknown field" in e.value.detail
+
+
+@pytest.mark.parametrize("fields", ["HourlyRain,HourlyRain", "At.pressure,At_pressure",
+                                    ["district", " district"], "DateTime,DateTime"])
+def test_duplicate_field_is_422(fields):
+    with pytest.raises(HTTPException) as e:
+        parse_projection(fields)
+    assert e.value.status_code == 422 and "more than once" in e.value.detail
+
+
+@pytest.fixture
+def client(monkeypatch):
+    nhp_api.app.dependency_overrides[nhp_api.get_current_user] = lambda: "u"
+    nhp_api.app.dependency_overrides[nhp_api.rate_limit] = lambda: None
+    monkeypatch.setattr(nhp_api, "read_engine", lambda: pytest.fail("query run for an invalid batch"))
+    yield TestClient(nhp_api.app)
+    nhp_api.app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("fields", [["HourlyRain", "NoSuchField"], ["DailyRain", "DailyRain"]])
+def test_batch_spec_with_bad_fields_is_422(client, fields):
+    active = nhp_api.heavy_gate.active
+    response = client.post("/stations/batch", json={"queries": [
+        {"station_ids": ["A1"]},
+        {"station_ids": ["A2"], "fields": fields},
+    ]})
+    assert response.status_code == 422
+    assert nhp_api.heavy_gate.active == active
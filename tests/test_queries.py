@@ -0,0 +1,91 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+
+import nhp_queries
+from nhp_queries import QueryTemplate, execute, prepared_template, template
+
+DB_URL = os.getenv("NHP_TEST_DB_URL")  # e.g. postgresql+psycopg2://user:pw@host/db
+
+
+def test_binds_are_typed_and_numbered_in_order_of_first_use():
+    tpl = QueryTemplate("SELECT * FROM t WHERE id = ANY(:ids) AND ts >= :start_date "
+                        "AND ts < :end_date AND id <> ALL(:ids) LIMIT :limit")
+    assert tpl.params == ["ids", "start_date", "end_date", "limit"]
+    assert tpl.prepare_sql == (
+        f"PREPARE {tpl.name} (text[], date, date, bigint) AS SELECT * FROM t WHERE id = ANY($1) "
+        "AND ts >= $2 AND ts < $3 AND id <> ALL($1) LIMIT $4"
+    )
+    assert str(tpl.execute_stmt) == f"EXECUTE {tpl.name}(:ids, :start_date, :end_date, :limit)"
+
+
+def test_casts_are_not_binds_and_types_can_be_overridden():
+    tpl = QueryTemplate("SELECT CAST(:day AS date), now()::timestamp", {"day": "text"})
+    assert tpl.params == ["day"]
+    assert tpl.prepare_sql == f"PREPARE {tpl.name} (text) AS SELECT CAST($1 AS date), now()::timestamp"
+
+
+def test_statement_without_binds():
+    tpl = QueryTemplate("SELECT 1")
+    assert tpl.params == []
+    assert tpl.prepare_sql == f"PREPARE {tpl.name} AS SELECT 1"
+    assert str(tpl.execute_stmt) == f"EXECUTE {tpl.name}"
+
+
+def test_undeclared_bind_type_is_refused():
+    with pytest.raises(ValueError, match="no_such_param"):
+        QueryTemplate("SELECT :no_such_param")
+
+
+def test_template_is_built_once_per_key():
+    built = []
+
+    def build():
+        built.append(1)
+        return "SELECT :station_id AS test_template_is_built_once"
+
+    tpl = template(("test_template_is_built_once",), build)
+    assert template(("test_template_is_built_once",), build) is tpl
+    assert len(built) == 1
+    assert prepared_template(f"EXECUTE {tpl.name}(:station_id)") is tpl
+
+
+# ------------------ Against Postgres ------------------
+@pytest.fixture
+def pg():
+    if not DB_URL:
+        pytest.skip("NHP_TEST_DB_URL not set")
+    eng = create_engine(DB_URL, pool_size=1, max_overflow=0)
+    yield eng
+    eng.dispose()
+
+
+@pytest.fixture
+def tpl():
+    return QueryTemplate("SELECT CAST(:limit AS bigint) + 1 AS n, CAST(:ids AS text[]) AS ids")
+
+
+def test_prepared_statement_reused_after_rollback(pg, tpl, monkeypatch):
+    monkeypatch.setattr(nhp_queries, "PREPARED_STATEMENTS", True)
+    with pg.connect() as conn:
+        assert execute(conn, tpl, {"limit": 1, "ids": ["a"]}).one() == (2, ["a"])
+        conn.rollback()  # PREPARE is not transactional: the statement survives
+        assert tpl.name in conn.connection.info["nhp_prepared"]
+        assert execute(conn, tpl, {"limit": 41, "ids": []}).one() == (42, [])
+        names = conn.exec_driver_sql("SELECT name FROM pg_prepared_statements").scalars().all()
+        assert names.count(tpl.name) == 1
+
+
+def test_prepare_in_aborted_transaction_is_retried(pg, tpl, monkeypatch):
+    monkeypatch.setattr(nhp_queries, "PREPARED_STATEMENTS", True)
+    with pg.connect() as conn:
+        with pytest.raises(DBAPIError):
+            conn.execute(text("SELECT 1/0"))
+        with pytest.raises(DBAPIError):
+            execute(conn, tpl, {"limit": 1, "ids": []})  # transaction is aborted: PREPARE fails
+        assert tpl.name not in conn.connection.info.get("nhp_prepared", set())
+        conn.rollback()
+        assert execute(conn, tpl, {"limit": 1, "ids": []}).one() == (2, [])
+        assert tpl.name in conn.connection.info["nhp_prepared"]
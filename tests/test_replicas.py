@@ -0,0 +1,139 @@
+import os
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import nhp_db
+from nhp_db import ReadRouter, make_engine
+from nhp_slowlog import SlowQueryLog, instrument_slow_queries
+
+# e.g. postgresql+psycopg2://user:pw@host:5432/db and the same database on a streaming standby
+DB_URL = os.getenv("NHP_TEST_DB_URL")
+REPLICA_URL = os.getenv("NHP_TEST_REPLICA_URL")
+
+pytestmark = pytest.mark.skipif(not (DB_URL and REPLICA_URL),
+                                reason="NHP_TEST_DB_URL and NHP_TEST_REPLICA_URL not set")
+
+
+@pytest.fixture(autouse=True)
+def routes(monkeypatch):
+    monkeypatch.setattr(nhp_db, "READ_ROUTES", {"/stations/data": "replica", "/stations/latest": "fresh"})
+    monkeypatch.setattr(nhp_db, "REPLICA_MAX_LAG", 30.0)
+    monkeypatch.setattr(nhp_db, "REPLICA_MAX_LAG_FRESH", 5.0)
+
+
+@pytest.fixture
+def router():
+    router = ReadRouter(make_engine(DB_URL, pool_gauges=False), [REPLICA_URL], check_interval=0)
+    yield router
+    for eng in router.engines():
+        eng.dispose()
+
+
+def replica_engine(router):
+    return router.replicas[0].engine
+
+
+def in_recovery(eng) -> bool:
+    with eng.connect() as conn:
+        return conn.execute(text("SELECT pg_is_in_recovery()")).scalar()
+
+
+def test_reads_go_to_the_replica_within_the_lag_threshold(router):
+    eng = router.engine_for("/stations/data")
+    assert eng is replica_engine(router) and in_recovery(eng)
+    assert router.engine_for("/stations/latest") is replica_engine(router)
+    assert router.replicas[0].lag <= nhp_db.REPLICA_MAX_LAG_FRESH
+
+
+def test_writes_and_unlisted_endpoints_use_the_primary(router):
+    for endpoint in ("/master/refresh", "/debug/slow-queries", "none"):
+        eng = router.engine_for(endpoint)
+        assert eng is router.primary and not in_recovery(eng)
+
+
+def test_down_replica_falls_back_to_the_primary(router):
+    down = ReadRouter(router.primary, [REPLICA_URL.replace(f":{router.replicas[0].url.port}/", ":1/")],
+                      check_interval=0)
+    assert down.engine_for("/stations/data") is router.primary
+    assert down.replicas[0].lag is None and down.replicas[0].error
+
+
+@pytest.fixture
+def paused_replica(router):
+    """The replica with WAL replay paused and a primary write it has not replayed."""
+    primary = create_engine(DB_URL, isolation_level="AUTOCOMMIT")
+    replica = create_engine(REPLICA_URL, isolation_level="AUTOCOMMIT")
+    with primary.connect() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS nhp_test_replica_lag (n int)"))
+        conn.execute(text("INSERT INTO nhp_test_replica_lag VALUES (1)"))
+    try:
+        with replica.connect() as conn:
+            # let the replica replay a commit first: with none, its lag reads as 0
+            deadline = time.monotonic() + 10
+            while conn.execute(text("SELECT pg_last_xact_replay_timestamp() IS NULL "
+                                    "OR pg_last_wal_replay_lsn() < :lsn"),
+                               {"lsn": lsn(primary)}).scalar():
+                assert time.monotonic() < deadline, "replica is not replaying"
+                time.sleep(0.05)
+            conn.execute(text("SELECT pg_wal_replay_pause()"))
+        with primary.connect() as conn:
+            conn.execute(text("INSERT INTO nhp_test_replica_lag VALUES (2)"))
+        yield
+    finally:
+        with replica.connect() as conn:
+            conn.execute(text("SELECT pg_wal_replay_resume()"))
+        with primary.connect() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS nhp_test_replica_lag"))
+        primary.dispose()
+        replica.dispose()
+
+
+def lsn(eng) -> str:
+    with eng.connect() as conn:
+        return conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+
+
+def test_lagging_replica_falls_back_to_the_primary(router, paused_replica, monkeypatch):
+    monkeypatch.setattr(nhp_db, "REPLICA_MAX_LAG_FRESH", 0.5)
+    monkeypatch.setattr(nhp_db, "REPLICA_MAX_LAG", 3600.0)
+    deadline = time.monotonic() + 10
+    while router.engine_for("/stations/latest") is not router.primary:
+        assert time.monotonic() < deadline, f"replica lag stayed at {router.replicas[0].lag}"
+        time.sleep(0.1)
+    assert router.replicas[0].lag > 0.5
+    # over the "fresh" threshold but within the "replica" one
+    assert router.engine_for("/stations/data") is replica_engine(router)
+    monkeypatch.setattr(nhp_db, "REPLICA_MAX_LAG", 0.5)
+    assert router.engine_for("/stations/data") is router.primary
+
+
+def test_slow_statement_explained_where_it_ran(router, tmp_path, monkeypatch):
+    log = SlowQueryLog(router.primary, path=str(tmp_path / "slow.sqlite3"), threshold_ms=0,
+                       explain_rate=1.0, explain_interval=0)
+    for eng in router.engines():
+        instrument_slow_queries(eng, log)
+    explained = {}
+    explain = log._explain
+
+    def spy(engine, statement, params, analyze=True):
+        plan = explain(engine, statement, params, analyze)
+        explained[statement] = (engine, plan)
+        return plan
+
+    monkeypatch.setattr(log, "_explain", spy)
+    with router.engine_for("/master/refresh").connect() as conn:
+        conn.execute(text("SELECT 1 AS on_primary"))
+    with router.engine_for("/stations/data").connect() as conn:
+        conn.execute(text("SELECT 1 AS on_replica"))
+
+    deadline = time.monotonic() + 10
+    while not {"SELECT 1 AS on_primary", "SELECT 1 AS on_replica"} <= explained.keys():
+        assert time.monotonic() < deadline, explained
+        time.sleep(0.05)
+    primary, primary_plan = explained["SELECT 1 AS on_primary"]
+    replica, replica_plan = explained["SELECT 1 AS on_replica"]
+    assert primary is router.primary and not in_recovery(primary)
+    assert replica is replica_engine(router) and in_recovery(replica)
+    assert "Result" in primary_plan and "Result" in replica_plan
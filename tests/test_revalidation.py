@@ -0,0 +1,48 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+
+import nhp_api
+from nhp_cache import ResponseCache
+from nhp_limits import AdmissionGate
+
+DB_URL = os.getenv("NHP_TEST_DB_URL")  # a database set up by NHP_ingest_deploy.ensure_tables()
+
+
+@pytest.fixture
+def statements(monkeypatch, tmp_path):
+    """SQL run by /stations/data against the test database, with every heavy slot taken."""
+    if not DB_URL:
+        pytest.skip("NHP_TEST_DB_URL not set")
+    eng = create_engine(DB_URL)
+    seen = []
+    event.listen(eng, "before_cursor_execute", lambda conn, cur, statement, *args: seen.append(statement))
+    monkeypatch.setattr(nhp_api, "read_engine", lambda *args: eng)
+    monkeypatch.setattr(nhp_api, "response_cache", ResponseCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(nhp_api.master_index, "resolve", lambda *args, **kwargs: ["&00558001"])
+    monkeypatch.setattr(nhp_api, "heavy_gate", AdmissionGate(max_concurrent=1, max_queue=0, max_wait=0))
+    nhp_api.app.dependency_overrides[nhp_api.get_current_user] = lambda: "u"
+    nhp_api.app.dependency_overrides[nhp_api.rate_limit] = lambda: None
+    yield seen
+    nhp_api.app.dependency_overrides.clear()
+    eng.dispose()
+
+
+def test_revalidation_and_cache_hits_skip_the_gate_and_the_readings(statements):
+    client = TestClient(nhp_api.app)
+    params = {"start_date": "2026-03-01", "end_date": "2026-03-31", "page_size": 10}
+    first = client.get("/stations/data", params=params)
+    assert first.status_code == 200
+
+    running = nhp_api.heavy_gate.acquire()  # a heavy query holds the only slot; no queueing
+    try:
+        statements.clear()
+        assert client.get("/stations/data", params=params,
+                          headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+        cached = client.get("/stations/data", params=params)
+        assert cached.status_code == 200 and cached.content == first.content
+        assert statements and not any("nhp_rtdas_ingest_v1" in s for s in statements)
+    finally:
+        nhp_api.heavy_gate.release(running)
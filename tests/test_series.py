@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from nhp_series import lttb
+
+
+def series(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.integers(1, 900, n)).astype(np.int64)  # irregular reading times
+    y = np.cumsum(rng.normal(0, 1, n))
+    return x, y
+
+
+@pytest.mark.parametrize("n, n_out", [(10, 3), (100, 7), (1000, 50), (5000, 4999), (20001, 1000)])
+def test_lttb_keeps_endpoints_and_length(n, n_out):
+    x, y = series(n)
+    keep = lttb(x, y, n_out)
+    assert len(keep) == n_out
+    assert keep[0] == 0 and keep[-1] == n - 1
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_lttb_indices_strictly_increasing(seed):
+    x, y = series(3000, seed)
+    keep = lttb(x, y, 200)
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_one_point_per_bucket():
+    x, y = series(1000)
+    keep = lttb(x, y, 12)
+    edges = np.linspace(1, 999, 11).astype(np.int64)
+    for i, k in enumerate(keep[1:-1]):
+        assert edges[i] <= k < edges[i + 1]
+
+
+def test_lttb_keeps_the_peak():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[537] = 50.0  # flood crest
+    assert 537 in lttb(x, y, 20)
+
+
+@pytest.mark.parametrize("n_out", [2, 10, 11])
+def test_lttb_short_series_or_tiny_target_returns_everything(n_out):
+    x, y = series(10)
+    assert list(lttb(x, y, n_out)) == list(range(10))
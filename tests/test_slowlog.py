@@ -0,0 +1,65 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from nhp_slowlog import SlowQueryLog, instrument_slow_queries
+
+
+@pytest.fixture
+def log(tmp_path):
+    eng = create_engine("sqlite://")
+    log = SlowQueryLog(eng, path=str(tmp_path / "slow.sqlite3"), threshold_ms=0, explain_rate=0)
+    instrument_slow_queries(eng, log)
+    return log
+
+
+def samples(log, n, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        rows = log._conn().execute("SELECT statement, error FROM slow_queries ORDER BY id").fetchall()
+        if len(rows) >= n:
+            return rows
+        time.sleep(0.01)
+    raise AssertionError(f"expected {n} samples, got {rows}")
+
+
+def test_failed_statement_recorded_with_its_error(log):
+    with log.engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        conn.rollback()
+        conn.execute(text("SELECT 1"))
+        assert not any(k.startswith("nhp_") for k in conn.info)
+    (failed, error), (ok, no_error) = samples(log, 2)
+    assert failed == "SELECT * FROM no_such_table" and "no_such_table" in error
+    assert ok == "SELECT 1" and no_error is None
+    assert sum(s["errors"] for s in log.summary()) == 1
+
+
+def test_fast_statements_not_recorded(log):
+    log.threshold_ms = 60_000
+    with log.engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        conn.rollback()
+        conn.execute(text("SELECT 1"))
+    time.sleep(0.1)
+    assert log._queue.empty() and log.summary() == []
+
+
+def test_plan_taken_on_the_engine_that_ran_the_statement(log, monkeypatch):
+    replica = create_engine("sqlite://")
+    instrument_slow_queries(replica, log)
+    log.explain_rate, log.explain_interval = 1.0, 0
+    explained = []
+    monkeypatch.setattr(log, "_explain", lambda engine, statement, params, analyze=True:
+                        explained.append((engine, analyze)) or "plan")
+    with replica.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    with log.engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+    samples(log, 2)
+    assert explained == [(replica, True), (log.engine, False)]
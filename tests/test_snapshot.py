@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from nhp_snapshot import LatestSnapshot
+
+
+def reading(ts, v=0):
+    return {"ts": ts, "HourlyRain": str(v)}
+
+
+class FakeReadings:
+    """load() over {station: rows newest first, NULL times last}, like snapshot_readings()."""
+
+    def __init__(self, table):
+        self.table = table
+        self.calls = []
+
+    def __call__(self, cursors, depth):
+        self.calls.append(dict(cursors))
+        out = {}
+        for sid, since in cursors.items():
+            rows = [r for r in self.table.get(sid, []) if since is None or (r["ts"] is not None and r["ts"] > since)]
+            if rows:
+                out[sid] = rows[:depth]
+        return out
+
+
+def t(hour):
+    return datetime(2030, 1, 1, hour)
+
+
+def snapshot(table, depth=3):
+    load = FakeReadings(table)
+    snap = LatestSnapshot(load, all_ids=lambda: sorted(table), depth=depth)
+    snap._refresh(full=True)
+    return snap, load
+
+
+def test_rows_without_a_parsed_time_are_kept_like_the_database_path():
+    table = {"A": [reading(t(2)), reading(t(1))], "B": [reading(None, 1), reading(None, 2)]}
+    snap, load = snapshot(table)
+    assert snap.rows("B") == table["B"]
+    version = snap.version
+
+    snap._refresh()  # nothing new: B (no cursor) is re-read but unchanged
+    assert load.calls[-1] == {"A": t(2), "B": None}
+    assert snap.version == version and snap.rows("B") == table["B"]
+
+    # B's first reading with a valid time goes before its NULL-time rows
+    table["B"] = [reading(t(5), 3)] + table["B"]
+    snap._refresh()
+    assert snap.version == version + 1
+    assert [r["ts"] for r in snap.rows("B")] == [t(5), None, None]
+    snap._refresh()
+    assert load.calls[-1]["B"] == t(5)
+
+
+def test_poll_prepends_newer_rows_up_to_depth():
+    table = {"A": [reading(t(2)), reading(t(1)), reading(None)]}
+    snap, _ = snapshot(table)
+    before = snap.readings()
+    table["A"] = [reading(t(4)), reading(t(3))] + table["A"]
+    snap._refresh()
+    assert [r["ts"] for r in snap.rows("A")] == [t(4), t(3), t(2)]
+    assert [r["ts"] for r in before["A"]] == [t(2), t(1), None]  # old version left as it was
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from NHP_ingest_deploy import EXPECTED_COLUMNS, TABLE_NAME, ensure_versions
+from nhp_api import data_versions
+
+DB_URL = os.getenv("NHP_TEST_DB_URL")  # needs nhp_ts() from NHP_ingest_deploy.ensure_tables()
+
+
+@pytest.fixture
+def conn():
+    """A transaction with its own readings table and change counters, rolled back afterwards."""
+    if not DB_URL:
+        pytest.skip("NHP_TEST_DB_URL not set")
+    eng = create_engine(DB_URL)
+    with eng.connect() as conn:
+        tx = conn.begin()
+        conn.exec_driver_sql("CREATE SCHEMA nhp_test_versions")
+        conn.exec_driver_sql("SET LOCAL search_path = nhp_test_versions, public")
+        cols = ", ".join(f'"{c}" TEXT' for c in EXPECTED_COLUMNS + ["uuid"])
+        conn.exec_driver_sql(f"CREATE TABLE {TABLE_NAME} ({cols}, PRIMARY KEY (uuid))")
+        conn.exec_driver_sql(f"""INSERT INTO {TABLE_NAME} ("StationID", "DateTime", uuid) VALUES
+            ('A', '10/01/26 10:00:00', 'a1'), ('A', '10/03/26 10:00:00', 'a2'), ('B', '15/03/26 00:00:00', 'b1')""")
+        ensure_versions(conn.connection.dbapi_connection.cursor())  # first deploy over existing rows
+        yield conn
+        tx.rollback()
+    eng.dispose()  # its prepared statements point at the dropped schema
+
+
+def write(conn, sql):
+    conn.exec_driver_sql(sql.replace("readings", TABLE_NAME))
+
+
+MARCH = ("2026-03-01", "2026-03-31")
+
+
+def test_window_digest_follows_writes_in_the_window_only(conn):
+    march, everything = data_versions(conn, None, *MARCH), data_versions(conn, None, None, None)
+    station_b = data_versions(conn, ["B"], *MARCH)
+    assert data_versions(conn, ["A"], *MARCH) != station_b
+
+    write(conn, """INSERT INTO readings ("StationID", "DateTime", uuid) VALUES ('A', '20/01/26 00:00:00', 'a3')""")
+    assert data_versions(conn, None, *MARCH) == march
+    assert data_versions(conn, None, None, None) != everything
+
+    write(conn, """INSERT INTO readings ("StationID", "DateTime", uuid) VALUES ('A', '20/03/26 00:00:00', 'a4')""")
+    assert data_versions(conn, None, *MARCH) != march
+    assert data_versions(conn, ["B"], *MARCH) == station_b
+
+
+@pytest.mark.parametrize("change", [
+    """DELETE FROM readings WHERE uuid = 'b1'""",
+    """UPDATE readings SET "HourlyRain" = '1' WHERE uuid = 'b1'""",
+    """UPDATE readings SET "DateTime" = '01/03/26 00:00:00' WHERE uuid = 'a1'""",  # moved into March
+    """TRUNCATE readings""",
+])
+def test_deletes_updates_and_truncates_change_the_digest(conn, change):
+    march = data_versions(conn, None, *MARCH)
+    write(conn, change)
+    assert data_versions(conn, None, *MARCH) != march
+
+
+def test_start_or_end_only(conn):
+    since_march, until_feb = data_versions(conn, None, "2026-03-05", None), data_versions(conn, None, None, "2026-02-28")
+    write(conn, """INSERT INTO readings ("StationID", "DateTime", uuid) VALUES ('B', '02/02/26 00:00:00', 'b2')""")
+    assert data_versions(conn, None, "2026-03-05", None) == since_march
+    assert data_versions(conn, None, None, "2026-02-28") != until_feb
+
+
+def test_unparseable_times_only_change_unbounded_windows(conn):
+    march, everything = data_versions(conn, None, *MARCH), data_versions(conn, None, None, None)
+    write(conn, """INSERT INTO readings ("StationID", "DateTime", uuid) VALUES ('B', 'garbage', 'b3')""")
+    assert data_versions(conn, None, *MARCH) == march
+    assert data_versions(conn, None, None, None) != everything
+
+
+@pytest.mark.parametrize("parser", ["nhp_ts", "nhp_num"])
+def test_parsers_run_under_a_forced_parallel_plan(parser):
+    # their EXCEPTION blocks open subtransactions, which a parallel leader refuses too
+    if not DB_URL:
+        pytest.skip("NHP_TEST_DB_URL not set")
+    eng = create_engine(DB_URL)
+    with eng.connect() as conn:
+        conn.exec_driver_sql("SET debug_parallel_query = on")
+        count = conn.exec_driver_sql(f"""SELECT count({parser}(x))
+                                         FROM (VALUES ('10/01/26 10:00:00'), ('1.5'), ('garbage')) v(x)""").scalar()
+    eng.dispose()
+    assert count == 1  # one parseable value each, the rest NULL